@@ -1,18 +1,20 @@
 import cv2
-import numpy as np
-import sqlite3
 import sys
 import re
-from insightface.app import FaceAnalysis
 import logging
 import os
 
+from face_models import get_face_app
+from face_index import add_to_index
+from db import get_connection
+from migrate_db import create_users_table
+from face_embeddings import add_embedding
+from embedding_cache import get_insightface_cache, content_hash
+from image_io import load_image, is_path, describe_image
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'])
-app.prepare(ctx_id=0)
-
 def validate_email(email):
     """Validates email format."""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -25,10 +27,10 @@ def validate_phone(phone):
     # Check if we have exactly 10 digits
     return len(digits) == 10
 
-def get_next_user_id():
+def get_next_user_id(db_path="attendance.db"):
     """Get the next available user ID in S101+ format."""
     try:
-        conn = sqlite3.connect("attendance.db")
+        conn = get_connection(db_path)
         cursor = conn.cursor()
         
         # Get the highest existing user_id
@@ -43,37 +45,63 @@ def get_next_user_id():
             # If no existing users, start with S101
             next_num = 101
             
-        conn.close()
         return f"S{next_num}"
         
     except Exception as e:
         logger.error(f"Error getting next user ID: {e}")
         return None
 
-def extract_face_encoding(image_path):
-    """Extract face encoding from image."""
+def extract_face_encoding(image):
+    """
+    Extract face encoding from an image, reusing a cached result for the same image.
+
+    Args:
+        image: BGR frame, encoded image bytes or path to an image file.
+    """
     try:
-        img = cv2.imread(image_path)
+        if is_path(image) and not os.path.isfile(image):
+            logger.error(f"Could not read image: {image}")
+            return None
+
+        cache = get_insightface_cache()
+        image_hash = content_hash(image)
+        hit, embedding, _ = cache.get(image_hash)
+        if hit:
+            if embedding is None:
+                logger.error("No face detected in the image")
+            return embedding
+
+        img = load_image(image)
         if img is None:
-            logger.error(f"Could not read image: {image_path}")
+            logger.error(f"Could not read image: {describe_image(image)}")
             return None
             
-        faces = app.get(img)
+        faces = get_face_app().get(img)
         if not faces:
             logger.error("No face detected in the image")
+            cache.put(image_hash, None)
             return None
             
         if len(faces) > 1:
             logger.warning("Multiple faces detected in the image. Using the first one.")
             
+        cache.put(image_hash, faces[0].embedding, faces[0].det_score)
         return faces[0].embedding
         
     except Exception as e:
         logger.error(f"Error extracting face encoding: {e}")
         return None
 
-def add_user(name, image_path, email, phone):
-    """Add a new user to the system."""
+def add_user(name, image, email, phone):
+    """
+    Add a new user to the system.
+
+    Args:
+        name: User's name.
+        image: BGR frame, encoded image bytes or path to the user's photo.
+        email: User's email.
+        phone: User's phone number.
+    """
     # Validate inputs
     if not name or not name.strip():
         logger.error("Name cannot be empty.")
@@ -93,19 +121,11 @@ def add_user(name, image_path, email, phone):
     formatted_phone = re.sub(r'\D', '', phone)
     
     try:
-        conn = sqlite3.connect("attendance.db")
+        conn = get_connection()
         cursor = conn.cursor()
 
         # Create users table if it doesn't exist (with new structure)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id TEXT PRIMARY KEY,
-                name TEXT UNIQUE,
-                encoding BLOB,
-                phone TEXT,
-                email TEXT
-            )
-        """)
+        create_users_table(cursor)
 
         # Check if user already exists
         cursor.execute("SELECT user_id FROM users WHERE name = ? OR email = ?", (name, email))
@@ -116,7 +136,7 @@ def add_user(name, image_path, email, phone):
             return False
 
         # Get face encoding
-        face_encoding = extract_face_encoding(image_path)
+        face_encoding = extract_face_encoding(image)
         if face_encoding is None:
             logger.error(f"Failed to add user {name}")
             return False
@@ -127,14 +147,12 @@ def add_user(name, image_path, email, phone):
             logger.error("Failed to generate user ID")
             return False
 
-        # Convert encoding to blob
-        face_encoding_blob = face_encoding.astype(np.float32).tobytes()
-        
         # Insert new user
         cursor.execute("""
-            INSERT INTO users (user_id, name, encoding, phone, email) 
-            VALUES (?, ?, ?, ?, ?)
-        """, (user_id, name, face_encoding_blob, formatted_phone, email))
+            INSERT INTO users (user_id, name, phone, email) 
+            VALUES (?, ?, ?, ?)
+        """, (user_id, name, formatted_phone, email))
+        add_embedding(cursor, user_id, face_encoding, source=image if is_path(image) else None)
         
         # Save the image to known_faces directory
         known_faces_dir = "known_faces"
@@ -142,24 +160,26 @@ def add_user(name, image_path, email, phone):
             os.makedirs(known_faces_dir)
             
         # Copy image to known_faces directory
-        image_ext = os.path.splitext(image_path)[1].lower()
+        image_ext = os.path.splitext(image)[1].lower() if is_path(image) else ".jpg"
         new_image_path = os.path.join(known_faces_dir, f"{name}{image_ext}")
-        cv2.imwrite(new_image_path, cv2.imread(image_path))
+        cv2.imwrite(new_image_path, load_image(image))
         
         conn.commit()
         logger.info(f"✅ User {name} added successfully with ID: {user_id}!")
         
-        conn.close()
+        # Keep the ANN index in step with the users table
+        add_to_index(user_id)
         return True
         
     except Exception as e:
         logger.error(f"Error adding user: {e}")
+        get_connection().rollback()
         return False
 
 def list_users():
     """List all users in the database."""
     try:
-        conn = sqlite3.connect("attendance.db")
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("SELECT user_id, name, email, phone FROM users ORDER BY user_id")
@@ -180,8 +200,6 @@ def list_users():
         print("-" * 70)
         print(f"Total users: {len(users)}")
         
-        conn.close()
-        
     except Exception as e:
         logger.error(f"Error listing users: {e}")
 
@@ -1,10 +1,13 @@
 import os
 import cv2
-import numpy as np
 from datetime import datetime
-import sqlite3
 import logging
 from ai_training import VeriFaceAI
+from migrate_db import ATTENDANCE_UPSERT_SQL, create_users_table
+from db import get_connection
+from face_embeddings import add_embedding
+from add_user import get_next_user_id
+from image_io import load_image
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -45,7 +48,7 @@ class VeriFaceAIIntegration:
         
         logger.info("VeriFace AI system initialized successfully")
     
-    def register_user_with_ai(self, name, email, phone, image_path):
+    def register_user_with_ai(self, name, email, phone, image):
         """
         Register a new user with AI training
         
@@ -53,7 +56,7 @@ class VeriFaceAIIntegration:
             name: User's name
             email: User's email
             phone: User's phone number
-            image_path: Path to the user's face image
+            image: BGR frame, encoded image bytes or path to the user's face image
             
         Returns:
             User ID if successful, None otherwise
@@ -63,35 +66,31 @@ class VeriFaceAIIntegration:
             clean_name = "".join(c for c in name if c.isalnum() or c in (' ', '-', '_')).strip()
             saved_image_path = os.path.join(self.known_faces_dir, f"{clean_name}.jpg")
             
-            # Check if file already exists
-            if os.path.exists(saved_image_path):
-                logger.warning(f"Image for {name} already exists. Replacing it.")
-            
-            # Save image
-            cv2.imwrite(saved_image_path, cv2.imread(image_path))
+            # Decode once; the encoding is taken from the same pixels that are saved
+            frame = load_image(image)
+            if frame is None:
+                logger.error("Could not read the image")
+                return None
             
             # Get face encoding
-            face_encoding = self.ai.extract_face_encoding(saved_image_path)
+            face_encoding = self.ai.extract_face_encoding(frame)
             if face_encoding is None:
                 logger.error("Could not detect face in the image")
                 return None
-                
-            face_encoding_blob = face_encoding.astype(np.float32).tobytes()
+            
+            # Check if file already exists
+            if os.path.exists(saved_image_path):
+                logger.warning(f"Image for {name} already exists. Replacing it.")
+            
+            # Save image
+            cv2.imwrite(saved_image_path, frame)
             
             # Save to database
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             # Create users table if it doesn't exist
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id TEXT PRIMARY KEY,
-                    name TEXT UNIQUE,
-                    encoding BLOB,
-                    phone TEXT,
-                    email TEXT
-                )
-            """)
+            create_users_table(cursor)
             
             # Check if user already exists
             cursor.execute("SELECT user_id FROM users WHERE name = ?", (name,))
@@ -102,36 +101,41 @@ class VeriFaceAIIntegration:
                 user_id = existing_user[0]
                 cursor.execute("""
                     UPDATE users 
-                    SET encoding = ?, phone = ?, email = ?, image_path = ?
+                    SET phone = ?, email = ?
                     WHERE name = ?
-                """, (face_encoding_blob, phone, email, saved_image_path, name))
+                """, (phone, email, name))
             else:
-                # Insert new user
+                # Insert new user with the next S101+ style ID
+                user_id = get_next_user_id(self.db_path)
+                if user_id is None:
+                    logger.error("Could not allocate a user ID")
+                    return None
                 cursor.execute("""
-                    INSERT INTO users (name, encoding, phone, email, image_path)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (name, face_encoding_blob, phone, email, saved_image_path))
-                user_id = cursor.lastrowid
+                    INSERT INTO users (user_id, name, phone, email)
+                    VALUES (?, ?, ?, ?)
+                """, (user_id, name, phone, email))
             
+            # A 128-d dlib encoding; InsightFace readers skip it by its size
+            add_embedding(cursor, user_id, face_encoding, source=saved_image_path)
             conn.commit()
-            conn.close()
-            
+
             # Update AI model with new data 
-            self.ai.update_model_with_new_data(saved_image_path, str(user_id), silent=True)
+            self.ai.update_model_with_new_data(frame, str(user_id), silent=True, face_encoding=face_encoding)
             
             logger.info(f"User {name} registered successfully")
             return user_id
             
         except Exception as e:
             logger.error(f"Error registering user with AI: {e}")
+            get_connection(self.db_path).rollback()
             return None
     
-    def recognize_user(self, image_path, confidence_threshold=0.6):
+    def recognize_user(self, image, confidence_threshold=0.6):
         """
         Recognize a user from an image
         
         Args:
-            image_path: Path to the image
+            image: BGR frame, encoded image bytes or path to the image
             confidence_threshold: Minimum confidence score to consider a match
             
         Returns:
@@ -139,21 +143,19 @@ class VeriFaceAIIntegration:
         """
         try:
             # Recognize face using AI
-            user_id = self.ai.recognize_face(image_path, confidence_threshold)
+            user_id = self.ai.recognize_face(image, confidence_threshold)
             
             if user_id is None:
                 logger.warning("Face not recognized")
                 return None
                 
             # Get user details from database
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute("SELECT user_id, name FROM users WHERE id = ?", (user_id,))
             user = cursor.fetchone()
             
-            conn.close()
-            
             if user is None:
                 logger.warning(f"User with ID {user_id} not found in database")
                 return None
@@ -176,41 +178,22 @@ class VeriFaceAIIntegration:
             True if successful, False otherwise
         """
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
-            # Check if attendance already recorded for today
+            # Insert today's record or update its last_seen time
             today = datetime.now().strftime("%Y-%m-%d")
-            cursor.execute("SELECT user_id, name FROM users WHERE user_id = ?", (str(user_id),))
-            
-            existing_record = cursor.fetchone()
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            cursor.execute(ATTENDANCE_UPSERT_SQL, (str(user_id), today, now, now))
             
-            if existing_record:
-                # Update last_seen time
-                cursor.execute("""
-                    UPDATE attendance 
-                    SET last_seen = ? 
-                    WHERE user_id = ?
-                """, (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), existing_record[0]))
-                
-                logger.info(f"Updated attendance for user {user_id}")
-            else:
-                # Create new attendance record
-                now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                cursor.execute("""
-                    INSERT INTO attendance (user_id, first_seen, last_seen)
-                    VALUES (?, ?, ?)
-                """, (user_id, now, now))
-                
-                logger.info(f"Created new attendance record for user {user_id}")
+            logger.info(f"Recorded attendance for user {user_id}")
             
             conn.commit()
-            conn.close()
-            
             return True
             
         except Exception as e:
             logger.error(f"Error recording attendance: {e}")
+            get_connection(self.db_path).rollback()
             return False
     
     def predict_user_attendance(self, user_id):
@@ -255,7 +238,7 @@ class VeriFaceAIIntegration:
             Dictionary with analytics data
         """
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             # Get date range
@@ -268,7 +251,7 @@ class VeriFaceAIIntegration:
                     SELECT users.name, attendance.first_seen, attendance.last_seen
                     FROM attendance
                     JOIN users ON attendance.user_id = users.user_id
-                    WHERE users.user_id = ? AND attendance.first_seen >= ?
+                    WHERE users.user_id = ? AND attendance.day >= ?
                     ORDER BY attendance.first_seen
                 """
                 cursor.execute(query, (user_id, start_date.strftime("%Y-%m-%d")))
@@ -277,7 +260,7 @@ class VeriFaceAIIntegration:
                     SELECT users.name, attendance.first_seen, attendance.last_seen
                     FROM attendance
                     JOIN users ON attendance.user_id = users.user_id
-                    WHERE attendance.first_seen >= ?
+                    WHERE attendance.day >= ?
                     ORDER BY attendance.first_seen
                 """
                 cursor.execute(query, (start_date.strftime("%Y-%m-%d"),))
@@ -338,8 +321,6 @@ class VeriFaceAIIntegration:
             if analytics['total_attendance_days'] > 0:
                 analytics['average_duration'] = total_duration / analytics['total_attendance_days']
             
-            conn.close()
-            
             return analytics
             
         except Exception as e:
@@ -1,28 +1,43 @@
+import io
 import os
 import numpy as np
 import cv2
 import face_recognition
-import pickle
 from datetime import datetime
-import sqlite3
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 import joblib
 import logging
+from db import get_connection
+from model_artifact import is_artifact, save_classifier_artifact, load_classifier_artifact
+from embedding_cache import get_dlib_cache, content_hash
+from image_io import BUFFER_TYPES, describe_image
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('VeriFace_AI')
 
+# Maximum face distance for matching faces added since the last training run
+# (the face_recognition library's default tolerance)
+FACE_MATCH_TOLERANCE = 0.6
+
+# Per-user attendance prediction models, one artifact directory per user
+ATTENDANCE_MODELS_DIR = os.path.join('models', 'attendance')
+
+def attendance_model_path(user_id):
+    """Artifact directory of a user's attendance prediction model."""
+    return os.path.join(ATTENDANCE_MODELS_DIR, f'user_{user_id}_model')
+
 class VeriFaceAI:
-    def __init__(self, model_path='models/face_recognition_model.pkl', 
+    def __init__(self, model_path='models/face_recognition_model', 
                  known_faces_dir='known_faces', 
                  db_path='attendance.db'):
         """
         Initialize the VeriFace AI training system
         
         Args:
-            model_path: Path to save/load the trained model
+            model_path: Path to save/load the trained model artifact. A legacy
+                joblib file at model_path + '.pkl' is converted on first load
             known_faces_dir: Directory containing known face images
             db_path: Path to the SQLite database
         """
@@ -34,6 +49,10 @@ class VeriFaceAI:
         self.face_labels = []
         self.attendance_data = []
         
+        # Faces added since the model was last fitted, matched by distance
+        self.pending_encodings = []
+        self.pending_labels = []
+        
         # Create models directory if it doesn't exist
         os.makedirs(os.path.dirname(model_path), exist_ok=True)
         
@@ -42,9 +61,18 @@ class VeriFaceAI:
         
     def load_model(self):
         """Load the trained model if it exists"""
-        if os.path.exists(self.model_path):
+        legacy_path = self.model_path + '.pkl'
+        if not is_artifact(self.model_path) and os.path.exists(legacy_path):
             try:
-                self.model = joblib.load(self.model_path)
+                # One-off conversion of the old joblib pickle
+                save_classifier_artifact(joblib.load(legacy_path), self.model_path, db_path=self.db_path)
+                logger.info(f"Converted {legacy_path} to {self.model_path}")
+            except Exception as e:
+                logger.error(f"Error converting model: {e}")
+                
+        if is_artifact(self.model_path):
+            try:
+                self.model = load_classifier_artifact(self.model_path)
                 logger.info(f"Loaded existing model from {self.model_path}")
             except Exception as e:
                 logger.error(f"Error loading model: {e}")
@@ -56,40 +84,60 @@ class VeriFaceAI:
     def save_model(self):
         """Save the trained model to disk"""
         try:
-            joblib.dump(self.model, self.model_path)
+            save_classifier_artifact(self.model, self.model_path, db_path=self.db_path)
             logger.info(f"Model saved to {self.model_path}")
         except Exception as e:
             logger.error(f"Error saving model: {e}")
     
-    def extract_face_encoding(self, image_path):
+    def extract_face_encoding(self, image_input):
         """
         Extract face encoding from an image
         
+        Results for files and encoded buffers are cached by content, so
+        unchanged images in known_faces are not re-encoded on every start.
+        
         Args:
-            image_path: Path to the image file
+            image_input: BGR frame, encoded image bytes or path to the image file
             
         Returns:
             Face encoding as numpy array or None if no face detected
         """
         try:
-            # Load image
-            image = face_recognition.load_image_file(image_path)
+            label = describe_image(image_input)
+            cache = get_dlib_cache()
+            image_hash = content_hash(image_input)
+            hit, encoding, _ = cache.get(image_hash)
+            if hit:
+                if encoding is None:
+                    logger.warning(f"No face detected in {label}")
+                return encoding
+            
+            # Load image as RGB; frames follow the OpenCV BGR convention
+            if isinstance(image_input, np.ndarray):
+                image = cv2.cvtColor(image_input, cv2.COLOR_BGR2RGB)
+            elif isinstance(image_input, BUFFER_TYPES):
+                image = face_recognition.load_image_file(io.BytesIO(image_input))
+            else:
+                image = face_recognition.load_image_file(image_input)
             
             # Find face locations
             face_locations = face_recognition.face_locations(image)
             
             if not face_locations:
-                logger.warning(f"No face detected in {image_path}")
+                logger.warning(f"No face detected in {label}")
+                cache.put(image_hash, None)
                 return None
                 
             # Get face encodings
             face_encodings = face_recognition.face_encodings(image, face_locations)
             
             if not face_encodings:
-                logger.warning(f"Could not encode face in {image_path}")
+                logger.warning(f"Could not encode face in {label}")
+                cache.put(image_hash, None)
                 return None
                 
             # Return the first face encoding
+            cache.put(image_hash, face_encodings[0])
             return face_encodings[0]
             
         except Exception as e:
@@ -106,6 +154,9 @@ class VeriFaceAI:
         self.face_encodings = []
         self.face_labels = []
         
+        cache = get_dlib_cache()
+        hits, misses = cache.hits, cache.misses
+        
         # Collect face encodings from known faces directory
         if os.path.exists(self.known_faces_dir):
             for filename in os.listdir(self.known_faces_dir):
@@ -125,14 +176,15 @@ class VeriFaceAI:
         # Collect attendance data from database
         self.collect_attendance_data()
         
-        logger.info(f"Collected {len(self.face_encodings)} face encodings for training")
+        logger.info(f"Collected {len(self.face_encodings)} face encodings for training "
+                    f"({cache.hits - hits} images from cache, {cache.misses - misses} encoded)")
     
     def collect_attendance_data(self):
         """
         Collect attendance data from the database for pattern analysis
         """
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             # Get attendance records with user information
@@ -170,7 +222,6 @@ class VeriFaceAI:
                     'duration': duration
                 })
             
-            conn.close()
             logger.info(f"Collected {len(self.attendance_data)} attendance records")
             
         except Exception as e:
@@ -192,7 +243,8 @@ class VeriFaceAI:
             # Split data into training and testing sets
             X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
             
-            # Train the model
+            # Train a fresh model; a loaded artifact can predict but not be refitted
+            self.model = RandomForestClassifier(n_estimators=100, random_state=42)
             self.model.fit(X_train, y_train)
             
             # Evaluate the model
@@ -201,6 +253,10 @@ class VeriFaceAI:
             
             logger.info(f"Model trained successfully. Train score: {train_score:.4f}, Test score: {test_score:.4f}")
             
+            # The fitted model now covers the faces added since the last run
+            self.pending_encodings = []
+            self.pending_labels = []
+            
             # Save the trained model
             self.save_model()
             
@@ -251,10 +307,9 @@ class VeriFaceAI:
                 logger.info(f"Trained attendance prediction model for user {user_id}")
             
             # Save user models
-            os.makedirs('models/attendance', exist_ok=True)
+            os.makedirs(ATTENDANCE_MODELS_DIR, exist_ok=True)
             for user_id, model in user_models.items():
-                model_path = f'models/attendance/user_{user_id}_model.pkl'
-                joblib.dump(model, model_path)
+                save_classifier_artifact(model, attendance_model_path(user_id), db_path=self.db_path)
             
             logger.info(f"Trained attendance prediction models for {len(user_models)} users")
             return True
@@ -276,13 +331,14 @@ class VeriFaceAI:
             Predicted duration in minutes or None if prediction failed
         """
         try:
-            model_path = f'models/attendance/user_{user_id}_model.pkl'
+            model_path = attendance_model_path(user_id)
             
-            if not os.path.exists(model_path):
+            if not is_artifact(model_path):
+                # Old joblib models are never unpickled; retraining replaces them
                 logger.warning(f"No prediction model found for user {user_id}")
                 return None
                 
-            model = joblib.load(model_path)
+            model = load_classifier_artifact(model_path)
             prediction = model.predict([[day_of_week, hour_of_day]])[0]
             
             return prediction
@@ -291,21 +347,28 @@ class VeriFaceAI:
             logger.error(f"Error predicting attendance: {e}")
             return None
     
-    def update_model_with_new_data(self, face_image_path, user_id, silent=False):
+    def update_model_with_new_data(self, face_image, user_id, silent=False, retrain=False, face_encoding=None):
         """
         Update the model with new face data
         
+        The face is usable for recognition straight away by distance matching.
+        The RandomForest is only refitted when retrain is True or on the next
+        call to train_face_recognition_model().
+        
         Args:
-            face_image_path: Path to the new face image
+            face_image: BGR frame, encoded image bytes or path to the new face image
             user_id: ID of the user
             silent: If True, don't show training messages
+            retrain: If True, refit the whole model now
+            face_encoding: Encoding of face_image if the caller already has it
             
         Returns:
             True if successful, False otherwise
         """
         try:
             # Extract face encoding
-            face_encoding = self.extract_face_encoding(face_image_path)
+            if face_encoding is None:
+                face_encoding = self.extract_face_encoding(face_image)
             if face_encoding is None:
                 logger.error("Could not extract face encoding from new image")
                 return False
@@ -314,6 +377,15 @@ class VeriFaceAI:
             self.face_encodings.append(face_encoding)
             self.face_labels.append(user_id)
             
+            # Match the new face right away, without refitting
+            self.pending_encodings.append(face_encoding)
+            self.pending_labels.append(user_id)
+            
+            if not retrain:
+                if not silent:
+                    logger.info(f"Added face for user {user_id}; model will include it on the next retrain")
+                return True
+                
             # Retrain model
             if not silent:
                 logger.info("Retraining model with new data...")
@@ -329,12 +401,12 @@ class VeriFaceAI:
             logger.error(f"Error updating model with new data: {e}")
             return False
     
-    def recognize_face(self, face_image_path, confidence_threshold=0.6):
+    def recognize_face(self, face_image, confidence_threshold=0.6):
         """
         Recognize a face in an image
         
         Args:
-            face_image_path: Path to the face image
+            face_image: BGR frame, encoded image bytes or path to the face image
             confidence_threshold: Minimum confidence score to consider a match
             
         Returns:
@@ -342,11 +414,20 @@ class VeriFaceAI:
         """
         try:
             # Extract face encoding
-            face_encoding = self.extract_face_encoding(face_image_path)
+            face_encoding = self.extract_face_encoding(face_image)
             
             if face_encoding is None:
                 return None
                 
+            # Faces added since the last fit are not in the model yet
+            if self.pending_encodings:
+                distances = np.linalg.norm(np.array(self.pending_encodings) - face_encoding, axis=1)
+                best = int(np.argmin(distances))
+                if distances[best] <= FACE_MATCH_TOLERANCE:
+                    user_id = self.pending_labels[best]
+                    logger.info(f"Recognized recently added user {user_id} (distance {distances[best]:.4f})")
+                    return user_id
+                
             # Predict user ID
             user_id = self.model.predict([face_encoding])[0]
             
@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+import threading
+import logging
+from datetime import datetime
+
+# Add the current directory to the path so we can import from the root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db import get_connection, close_connection
+
+logger = logging.getLogger("AttendanceSink")
+
+# Upsert restricted to users that still exist
+SINK_UPSERT_SQL = """
+    INSERT INTO attendance (user_id, day, first_seen, last_seen)
+    SELECT user_id, ?, ?, ? FROM users WHERE user_id = ?
+    ON CONFLICT(user_id, day) DO UPDATE SET
+        first_seen = MIN(first_seen, excluded.first_seen),
+        last_seen = MAX(last_seen, excluded.last_seen)
+"""
+
+class AttendanceSink:
+    """
+    Batched attendance writer.
+
+    Sightings from any thread are coalesced in memory per (user_id, day),
+    keeping the earliest first_seen and latest last_seen, and written in one
+    transaction over the flush thread's shared connection every flush_interval
+    seconds or as soon as batch_size distinct users are waiting.
+    """
+
+    def __init__(self, db_path="attendance.db", flush_interval=1.0, batch_size=100):
+        """
+        Initialize the sink.
+
+        Args:
+            db_path: Path to the SQLite database.
+            flush_interval: Maximum seconds a sighting waits before it is written.
+            batch_size: Number of pending (user, day) rows that triggers an early flush.
+        """
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Metrics
+        self.flushes = 0
+        self.rows_written = 0
+        self.max_rows_per_flush = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.errors = 0
+        self.last_error = None
+
+    def start(self):
+        """Start the background flush thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="attendance-sink", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread and write anything still pending."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def record(self, user_id, seen_at=None):
+        """
+        Queue a sighting of a user. Never touches the database.
+
+        Args:
+            user_id: ID of the recognized user.
+            seen_at: datetime of the sighting. Defaults to now.
+        """
+        if user_id is None:
+            logger.error("Cannot record attendance for None user_id")
+            return
+        seen_at = seen_at or datetime.now()
+        timestamp = seen_at.strftime("%Y-%m-%d %H:%M:%S")
+        key = (user_id, seen_at.strftime("%Y-%m-%d"))
+
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = [timestamp, timestamp]
+            else:
+                entry[0] = min(entry[0], timestamp)
+                entry[1] = max(entry[1], timestamp)
+            pending_count = len(self._pending)
+
+        if pending_count >= self.batch_size:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+        close_connection(self.db_path)
+
+    def flush(self):
+        """
+        Write all pending sightings in a single transaction.
+
+        Returns:
+            Number of (user, day) rows written. Sightings of users that no
+            longer exist are dropped and not counted.
+        """
+        with self._lock:
+            batch = self._pending
+            self._pending = {}
+        if not batch:
+            return 0
+
+        with self._flush_lock:
+            start = time.perf_counter()
+            try:
+                conn = get_connection(self.db_path)
+                cursor = conn.cursor()
+                cursor.executemany(SINK_UPSERT_SQL, [
+                    (day, first_seen, last_seen, user_id)
+                    for (user_id, day), (first_seen, last_seen) in batch.items()
+                ])
+                # Summed over the batch; the upsert selects no row for removed users
+                written = cursor.rowcount
+                conn.commit()
+
+            except Exception as e:
+                try:
+                    get_connection(self.db_path).rollback()
+                except Exception:
+                    pass
+                self.errors += 1
+                self.last_error = str(e)
+                logger.error(f"Error flushing attendance: {str(e)}")
+
+                # Put the batch back so it is retried on the next flush
+                with self._lock:
+                    for key, (first_seen, last_seen) in batch.items():
+                        entry = self._pending.get(key)
+                        if entry is None:
+                            self._pending[key] = [first_seen, last_seen]
+                        else:
+                            entry[0] = min(entry[0], first_seen)
+                            entry[1] = max(entry[1], last_seen)
+                return 0
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.flushes += 1
+            self.rows_written += written
+            self.max_rows_per_flush = max(self.max_rows_per_flush, written)
+            self.last_flush_ms = elapsed_ms
+            self.total_flush_ms += elapsed_ms
+            self.last_error = None
+            if written < len(batch):
+                logger.info(f"Dropped {len(batch) - written} attendance rows of users that no longer exist")
+            logger.info(f"Flushed {written} attendance rows in {elapsed_ms:.1f} ms")
+            return written
+
+    def stats(self):
+        """
+        Get flush metrics.
+
+        Returns:
+            Dict with flushes, rows_written, pending, avg_rows_per_flush,
+            max_rows_per_flush, last_flush_ms, avg_flush_ms and errors.
+        """
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'pending': pending,
+            'avg_rows_per_flush': self.rows_written / self.flushes if self.flushes else 0.0,
+            'max_rows_per_flush': self.max_rows_per_flush,
+            'last_flush_ms': self.last_flush_ms,
+            'avg_flush_ms': self.total_flush_ms / self.flushes if self.flushes else 0.0,
+            'errors': self.errors,
+        }
@@ -0,0 +1,367 @@
+import os
+import sys
+import csv
+import json
+import time
+import base64
+import shutil
+import logging
+import multiprocessing
+import numpy as np
+import cv2
+
+# Add the current directory to the path so we can import from the root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db import transaction, query_all
+from migrate_db import create_users_table
+from face_embeddings import add_embedding
+from add_user import validate_email, validate_phone
+
+logger = logging.getLogger("BulkEnroll")
+
+# Seconds between progress log lines
+PROGRESS_INTERVAL = 5.0
+
+# Images handed to a worker at a time
+CHUNK_SIZE = 8
+
+# Set in a worker whose face model failed to load
+_worker_error = None
+
+def _init_worker(threads):
+    """Load the face model once per worker process, with its share of the cores."""
+    global _worker_error
+    try:
+        from face_models import get_face_app, configure_sessions
+        configure_sessions(intra_op_num_threads=threads)
+        get_face_app()
+    except Exception as e:
+        # Raising here would make the pool restart the worker forever
+        _worker_error = f"face model unavailable: {e}"
+
+def _encode_image(image_path):
+    """
+    Detect the main face in one image and embed it (runs in a worker).
+
+    Returns:
+        Dict with image, embedding (float32 array or None), det_score and error.
+        fatal is set when the worker has no face model.
+    """
+    from face_models import get_face_app
+    result = {'image': image_path, 'embedding': None, 'det_score': None, 'error': None}
+    if _worker_error:
+        result.update({'error': _worker_error, 'fatal': True})
+        return result
+    try:
+        img = cv2.imread(image_path)
+        if img is None:
+            result['error'] = "could not read image"
+            return result
+        faces = get_face_app().get(img)
+        if not faces:
+            result['error'] = "no face detected"
+            return result
+        # Enrollment photos show one person; take the largest face
+        face = max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+        result['embedding'] = np.asarray(face.embedding, dtype=np.float32)
+        result['det_score'] = float(face.det_score)
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+def encode_images(image_paths, workers=None):
+    """
+    Detect and embed images across a pool of worker processes.
+
+    Each worker loads the face model once and then processes images in
+    chunks. Results are yielded as they complete, not in input order.
+
+    Args:
+        image_paths: Paths of the images to encode.
+        workers: Number of worker processes. Defaults to half the CPU cores.
+
+    Yields:
+        Dicts with image, embedding (float32 array or None), det_score and error.
+    """
+    workers = workers or max(1, (os.cpu_count() or 2) // 2)
+    context = multiprocessing.get_context("spawn")
+    # Workers run one model at a time, so they split the cores between them
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    with context.Pool(workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        for result in pool.imap_unordered(_encode_image, image_paths, chunksize=CHUNK_SIZE):
+            yield result
+
+def read_manifest(manifest_path, image_dir):
+    """
+    Read and validate the CSV manifest.
+
+    The CSV needs a header with name and image columns; email, phone and
+    user_id are optional. Several rows with the same name add several
+    enrollment samples for that person. image is relative to image_dir.
+
+    Returns:
+        Tuple (rows, errors): valid rows as dicts with an absolute image path,
+        and a list of (line number, message) for rejected rows.
+    """
+    rows = []
+    errors = []
+    with open(manifest_path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        missing = {'name', 'image'} - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"Manifest is missing column(s): {', '.join(sorted(missing))}")
+
+        for line_no, row in enumerate(reader, start=2):
+            name = (row.get('name') or '').strip()
+            image = (row.get('image') or '').strip()
+            email = (row.get('email') or '').strip()
+            phone = (row.get('phone') or '').strip()
+            if not name or not image:
+                errors.append((line_no, "name and image are required"))
+                continue
+            if email and not validate_email(email):
+                errors.append((line_no, f"invalid email {email}"))
+                continue
+            if phone and not validate_phone(phone):
+                errors.append((line_no, f"invalid phone {phone}"))
+                continue
+            image_path = os.path.abspath(os.path.join(image_dir, image))
+            if not os.path.isfile(image_path):
+                errors.append((line_no, f"image not found: {image}"))
+                continue
+            rows.append({
+                'name': name,
+                'image': image_path,
+                'email': email,
+                'phone': ''.join(c for c in phone if c.isdigit()),
+                'user_id': (row.get('user_id') or '').strip() or None,
+            })
+    return rows, errors
+
+def _checkpoint_path(manifest_path):
+    """Sidecar file holding the embeddings computed so far for a manifest."""
+    directory, filename = os.path.split(os.path.abspath(manifest_path))
+    return os.path.join(directory, f".{filename}.progress.jsonl")
+
+def _load_checkpoint(path):
+    """
+    Read the embeddings saved by an interrupted run.
+
+    Only successfully encoded images are checkpointed; failed ones are
+    retried on the next run.
+
+    Returns:
+        Dict of image path -> result dict.
+    """
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line may be cut short by the interruption
+                continue
+            record['embedding'] = np.frombuffer(base64.b64decode(record['embedding']), dtype=np.float32)
+            results[record['image']] = record
+    return results
+
+def _append_checkpoint(f, result):
+    record = dict(result)
+    record['embedding'] = base64.b64encode(record['embedding'].tobytes()).decode('ascii')
+    f.write(json.dumps(record) + "\n")
+    f.flush()
+
+def _next_user_number():
+    """Return the number after the highest S-prefixed user ID."""
+    numbers = [int(user_id[1:]) for (user_id,) in query_all("SELECT user_id FROM users")
+               if isinstance(user_id, str) and user_id[:1] == 'S' and user_id[1:].isdigit()]
+    return max(numbers, default=100) + 1
+
+def _write_results(rows, results):
+    """
+    Insert the new users and all their samples in a single transaction.
+
+    Rows are matched to users by their user_id column. A row without one
+    creates a new user, and later rows with the same name in this manifest
+    add samples to it. A row is never merged into an existing user by name
+    alone: one whose name or user_id belongs to a different existing user
+    is reported as a conflict and skipped.
+
+    Images that are already enrolled (same source path) are skipped, so
+    running the import again after it completed adds nothing.
+
+    Returns:
+        Dict with users_added, samples_added, the list of new user IDs and
+        conflicts, a list of (image, message) for skipped rows.
+    """
+    users_added = []
+    conflicts = []
+    samples_added = 0
+    with transaction() as cursor:
+        create_users_table(cursor)
+        cursor.execute("SELECT source FROM embeddings WHERE source IS NOT NULL")
+        enrolled = {source for (source,) in cursor.fetchall()}
+        cursor.execute("SELECT user_id, name FROM users")
+        names = dict(cursor.fetchall())
+        user_ids = {name: user_id for user_id, name in names.items()}
+        created = {}
+        next_number = _next_user_number()
+
+        for row in rows:
+            result = results.get(row['image'])
+            if result is None or result['embedding'] is None or row['image'] in enrolled:
+                continue
+
+            name, user_id = row['name'], row['user_id']
+            if user_id is None and name in created:
+                user_id = created[name]
+            elif user_id is None and name in user_ids:
+                conflicts.append((row['image'], f"{name} is already enrolled as {user_ids[name]}; "
+                                                f"set user_id to add samples to that user"))
+                continue
+            elif user_id in names and names[user_id] != name:
+                conflicts.append((row['image'], f"user_id {user_id} belongs to {names[user_id]}, not {name}"))
+                continue
+            elif user_id not in names and name in user_ids:
+                conflicts.append((row['image'], f"{name} is already enrolled as {user_ids[name]}, not {user_id}"))
+                continue
+            elif user_id not in names:
+                if user_id is None:
+                    user_id = f"S{next_number}"
+                    next_number += 1
+                cursor.execute("""
+                    INSERT INTO users (user_id, name, phone, email)
+                    VALUES (?, ?, ?, ?)
+                """, (user_id, name, row['phone'], row['email']))
+                names[user_id] = name
+                user_ids[name] = user_id
+                created[name] = user_id
+                users_added.append((user_id, row))
+
+            add_embedding(cursor, user_id, result['embedding'],
+                          quality=result['det_score'], source=row['image'])
+            enrolled.add(row['image'])
+            samples_added += 1
+
+    return {'users_added': len(users_added), 'samples_added': samples_added, 'new_users': users_added,
+            'conflicts': conflicts}
+
+def bulk_enroll(manifest_path, image_dir, workers=None, known_faces_dir="known_faces"):
+    """
+    Enroll every person in a CSV manifest.
+
+    Images are detected and embedded across a pool of worker processes, each
+    with its own face model. Results are appended to a checkpoint file next
+    to the manifest as they arrive, so an interrupted import resumes where it
+    stopped. The users and embeddings are then written in one transaction and
+    the checkpoint is removed.
+
+    Args:
+        manifest_path: CSV with name, image and optional email, phone, user_id.
+        image_dir: Directory the image column is relative to.
+        workers: Number of worker processes. Defaults to half the CPU cores.
+        known_faces_dir: Directory that receives one photo per new user.
+
+    Returns:
+        Dict with rows, rejected, encoded, resumed, failed, users_added,
+        samples_added, conflicts, elapsed and images_per_second, or None on
+        error.
+    """
+    try:
+        rows, errors = read_manifest(manifest_path, image_dir)
+        for line_no, message in errors:
+            logger.warning(f"Manifest line {line_no} skipped: {message}")
+
+        checkpoint = _checkpoint_path(manifest_path)
+        results = _load_checkpoint(checkpoint)
+        resumed = len(results)
+        if resumed:
+            logger.info(f"Resuming: {resumed} images were already processed")
+
+        enrolled = {source for (source,) in query_all("SELECT source FROM embeddings WHERE source IS NOT NULL")}
+        todo = sorted({row['image'] for row in rows} - set(results) - enrolled)
+
+        start = time.perf_counter()
+        encoded = 0
+        if todo:
+            logger.info(f"Encoding {len(todo)} images")
+            last_report = start
+            with open(checkpoint, 'a') as f:
+                for result in encode_images(todo, workers):
+                    if result.get('fatal'):
+                        raise RuntimeError(result['error'])
+                    if result['embedding'] is not None:
+                        _append_checkpoint(f, result)
+                    else:
+                        logger.warning(f"{result['image']}: {result['error']}")
+                    results[result['image']] = result
+                    encoded += 1
+                    now = time.perf_counter()
+                    if now - last_report >= PROGRESS_INTERVAL:
+                        logger.info(f"{encoded}/{len(todo)} images, {encoded / (now - start):.1f} images/s")
+                        last_report = now
+        elapsed = time.perf_counter() - start
+
+        summary = _write_results(rows, results)
+        for image, message in summary['conflicts']:
+            logger.warning(f"{image} skipped: {message}")
+        summary['conflicts'] = len(summary['conflicts'])
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        # Keep one photo per new user, as add_user does
+        os.makedirs(known_faces_dir, exist_ok=True)
+        for user_id, row in summary.pop('new_users'):
+            extension = os.path.splitext(row['image'])[1].lower()
+            try:
+                shutil.copy2(row['image'], os.path.join(known_faces_dir, f"{row['name']}{extension}"))
+            except Exception as e:
+                logger.warning(f"Could not copy photo for {user_id}: {e}")
+
+        summary.update({
+            'rows': len(rows),
+            'rejected': len(errors),
+            'encoded': encoded,
+            'resumed': resumed,
+            'failed': sum(1 for result in results.values() if result['embedding'] is None),
+            'elapsed': elapsed,
+            'images_per_second': encoded / elapsed if elapsed > 0 else 0.0,
+        })
+        logger.info(f"Imported {summary['users_added']} users and {summary['samples_added']} samples; "
+                    f"{encoded} images in {elapsed:.1f}s ({summary['images_per_second']:.1f} images/s)")
+        return summary
+
+    except Exception as e:
+        logger.error(f"Error during bulk enrollment: {str(e)}")
+        import traceback
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return None
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Enroll many users from a CSV manifest and an image directory")
+    parser.add_argument("manifest", help="CSV with name,image[,email,phone,user_id] columns")
+    parser.add_argument("image_dir", help="Directory the image column is relative to")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: half the CPU cores)")
+    args = parser.parse_args()
+
+    summary = bulk_enroll(args.manifest, args.image_dir, workers=args.workers)
+    if summary is None:
+        print("\n❌ Bulk enrollment failed. Check the logs above.")
+        sys.exit(1)
+
+    print("\n✅ Bulk enrollment complete")
+    print(f"Rows: {summary['rows']} valid, {summary['rejected']} rejected")
+    print(f"Images: {summary['encoded']} encoded, {summary['resumed']} resumed, {summary['failed']} without a face")
+    print(f"Added: {summary['users_added']} users, {summary['samples_added']} samples")
+    if summary['conflicts']:
+        print(f"Skipped: {summary['conflicts']} rows whose name or user_id matches a different user")
+    print(f"Throughput: {summary['images_per_second']:.1f} images/s over {summary['elapsed']:.1f}s")
+    print("\nNext steps:")
+    print("1. Retrain the model (python train_face_model.py)")
+    print("2. Rebuild the ANN index for large galleries (python face_index.py build)")
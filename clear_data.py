@@ -1,6 +1,9 @@
 import os
-import sqlite3
 import logging
+import shutil
+from db import get_connection
+from embedding_store import DEFAULT_STORE_DIR
+from face_index import DEFAULT_INDEX_PATH
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -16,11 +19,12 @@ def clear_all_data():
     try:
         # 1. Clear database tables
         logger.info("Clearing database tables...")
-        conn = sqlite3.connect("attendance.db")
+        conn = get_connection()
         cursor = conn.cursor()
         
         # Delete all records from tables
         cursor.execute("DELETE FROM attendance")
+        cursor.execute("DELETE FROM embeddings")
         cursor.execute("DELETE FROM users")
         
         # Reset auto-increment counters
@@ -37,17 +41,21 @@ def clear_all_data():
         attendance_count = cursor.fetchone()[0]
         logger.info(f"Attendance table cleared: {attendance_count} records remaining")
         
-        conn.close()
-        
+
         # 2. Delete trained models from models directory
         logger.info("\nDeleting trained models...")
         models_dir = "models"
         if os.path.exists(models_dir):
             for file in os.listdir(models_dir):
-                if file.endswith(".pkl"):
+                file_path = os.path.join(models_dir, file)
+                # The ANN index holds the centroids of the users being deleted
+                if (file.endswith(".pkl") or file in ("manifest.json", os.path.basename(DEFAULT_INDEX_PATH))
+                        or os.path.isdir(file_path)):
                     try:
-                        file_path = os.path.join(models_dir, file)
-                        os.remove(file_path)
+                        if os.path.isdir(file_path):
+                            shutil.rmtree(file_path)
+                        else:
+                            os.remove(file_path)
                         logger.info(f"Deleted model file: {file}")
                     except Exception as e:
                         logger.error(f"Could not delete model file {file}: {e}")
@@ -64,6 +72,14 @@ def clear_all_data():
             except Exception as e:
                 logger.error(f"Could not delete model file {model_file}: {e}")
         
+        # Delete the embedding store
+        if os.path.exists(DEFAULT_STORE_DIR):
+            try:
+                shutil.rmtree(DEFAULT_STORE_DIR)
+                logger.info(f"Deleted embedding store: {DEFAULT_STORE_DIR}")
+            except Exception as e:
+                logger.error(f"Could not delete embedding store: {e}")
+        
         # 3. Clear known faces directory
         logger.info("\nClearing known faces directory...")
         known_faces_dir = "known_faces"
@@ -0,0 +1,155 @@
+import os
+import sys
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+
+# Add the current directory to the path so we can import from the root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger("Database")
+
+DB_PATH = "attendance.db"
+
+# Applied to every new connection. WAL lets readers run while the recognition
+# writer commits; busy_timeout makes a blocked writer wait instead of failing
+# with "database is locked".
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Number of compiled statements each connection keeps for reuse
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+_checked_paths = set()
+_schema_lock = threading.Lock()
+
+def _open(db_path):
+    """Open a new connection with the standard pragmas applied."""
+    conn = sqlite3.connect(db_path, timeout=5.0, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def _check_schema(conn, db_path):
+    """
+    Warn once per process when a database is older than the current schema.
+
+    Migrations back up, rewrite and VACUUM the database, so they only run
+    when asked for with migrate_db.py, never as a side effect of connecting.
+    """
+    if db_path in _checked_paths:
+        return
+    with _schema_lock:
+        if db_path in _checked_paths:
+            return
+        _checked_paths.add(db_path)
+
+    from migrate_db import SCHEMA_VERSION, get_schema_version
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'")
+        if not cursor.fetchone()[0]:
+            # New database; initialize_db.py creates the current schema
+            return
+        version = get_schema_version(cursor)
+        if version < SCHEMA_VERSION:
+            logger.warning(f"{db_path} is at schema version {version}, this code needs "
+                           f"version {SCHEMA_VERSION}. Run 'python migrate_db.py {db_path}' to upgrade it.")
+    finally:
+        cursor.close()
+
+def get_connection(db_path=DB_PATH, check_schema=True):
+    """
+    Get this thread's connection to the database, opening it on first use.
+
+    Connections are kept per thread and per database path, so repeated calls
+    reuse the same connection and its compiled statement cache. Do not close
+    the returned connection; use close_connection() instead.
+
+    Args:
+        db_path: Path to the SQLite database.
+        check_schema: Warn the first time the path is used if the database
+            needs migrate_db.py. The database is never migrated here.
+
+    Returns:
+        sqlite3.Connection
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = _open(db_path)
+        connections[db_path] = conn
+    if check_schema:
+        _check_schema(conn, db_path)
+    return conn
+
+def close_connection(db_path=DB_PATH):
+    """Close this thread's connection to the database, if open."""
+    connections = getattr(_local, 'connections', {})
+    conn = connections.pop(db_path, None)
+    if conn is not None:
+        conn.close()
+
+def query_all(sql, params=(), db_path=DB_PATH):
+    """Run a read query and return all rows."""
+    return get_connection(db_path).execute(sql, params).fetchall()
+
+def query_one(sql, params=(), db_path=DB_PATH):
+    """Run a read query and return the first row, or None."""
+    return get_connection(db_path).execute(sql, params).fetchone()
+
+def execute_write(sql, params=(), db_path=DB_PATH):
+    """
+    Run one write statement in its own transaction.
+
+    Returns:
+        Number of rows changed.
+    """
+    conn = get_connection(db_path)
+    with conn:
+        cursor = conn.execute(sql, params)
+    return cursor.rowcount
+
+@contextmanager
+def transaction(db_path=DB_PATH):
+    """
+    Run several statements in one transaction.
+
+    Yields a cursor; commits on success and rolls back if the block raises.
+    """
+    conn = get_connection(db_path)
+    cursor = conn.cursor()
+    try:
+        yield cursor
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def backup_database(backup_path, db_path=DB_PATH):
+    """
+    Copy the database, including changes still in the WAL file, to backup_path.
+
+    Returns:
+        Path to the backup.
+    """
+    source = get_connection(db_path, check_schema=False)
+    target = sqlite3.connect(backup_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+    return backup_path
@@ -0,0 +1,204 @@
+import os
+import sys
+import hashlib
+import logging
+import threading
+from importlib import metadata
+import numpy as np
+from datetime import datetime
+
+# Add the current directory to the path so we can import from the root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db import get_connection
+
+logger = logging.getLogger("EmbeddingCache")
+
+DEFAULT_CACHE_PATH = os.path.join("face_data", "embedding_cache.db")
+
+# Bytes read at a time when hashing an image file
+HASH_CHUNK_SIZE = 1 << 20
+
+CACHE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS embedding_cache (
+        image_hash TEXT NOT NULL,
+        model TEXT NOT NULL,
+        version TEXT NOT NULL,
+        vector BLOB,
+        det_score REAL,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (image_hash, model)
+    )
+"""
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def content_hash(image):
+    """
+    Hash an image given as a file path or an encoded buffer.
+
+    Decoded frames are not hashed and so never cached; a live frame is
+    practically never seen twice.
+
+    Returns:
+        SHA-256 hex digest, or None for a numpy array.
+    """
+    if isinstance(image, np.ndarray):
+        return None
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(image).hexdigest()
+    return hash_file(image)
+
+class EmbeddingCache:
+    """
+    Persistent cache of face embeddings keyed by image content.
+
+    Entries are keyed by the SHA-256 of the image file and the model name,
+    and tagged with the model version. Opening the cache with a new version
+    of a model drops that model's old entries, so a changed model pack never
+    serves stale embeddings. Images without a face are cached too (with a
+    NULL vector) so they are not re-detected either.
+    """
+
+    def __init__(self, model, version, path=DEFAULT_CACHE_PATH):
+        """
+        Open the cache for one model.
+
+        Args:
+            model: Model name, e.g. 'insightface/buffalo_l'.
+            version: Version tag of the model; entries from other versions are dropped.
+            path: SQLite file holding the cache.
+        """
+        self.model = model
+        self.version = version
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(CACHE_TABLE_SQL)
+        deleted = conn.execute("DELETE FROM embedding_cache WHERE model = ? AND version != ?",
+                               (model, version)).rowcount
+        conn.commit()
+        if deleted:
+            logger.info(f"Dropped {deleted} cached embeddings from an older version of {model}")
+
+    def _connection(self):
+        # The cache file has its own schema, so skip the attendance.db migration
+        return get_connection(self.path, check_schema=False)
+
+    def get(self, image_hash):
+        """
+        Look up an image.
+
+        Args:
+            image_hash: Hash returned by content_hash(); None always misses.
+
+        Returns:
+            Tuple (hit, embedding, det_score). embedding is None on a miss and
+            for images cached as having no face.
+        """
+        if image_hash is None:
+            return False, None, None
+        row = self._connection().execute(
+            "SELECT vector, det_score FROM embedding_cache WHERE image_hash = ? AND model = ? AND version = ?",
+            (image_hash, self.model, self.version)).fetchone()
+        if row is None:
+            self.misses += 1
+            return False, None, None
+        self.hits += 1
+        vector, det_score = row
+        embedding = np.frombuffer(vector, dtype=np.float32) if vector is not None else None
+        return True, embedding, det_score
+
+    def put(self, image_hash, embedding, det_score=None):
+        """
+        Store the result for an image.
+
+        Args:
+            image_hash: Hash returned by content_hash(); nothing is stored for None.
+            embedding: Face embedding, or None if the image has no face.
+            det_score: Optional detector confidence.
+        """
+        if image_hash is None:
+            return
+        vector = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        conn = self._connection()
+        conn.execute("""
+            INSERT OR REPLACE INTO embedding_cache (image_hash, model, version, vector, det_score, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (image_hash, self.model, self.version, vector,
+              float(det_score) if det_score is not None else None,
+              datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        conn.commit()
+
+    def stats(self):
+        """
+        Get cache metrics.
+
+        Returns:
+            Dict with entries (for this model version), hits and misses.
+        """
+        entries = self._connection().execute(
+            "SELECT COUNT(*) FROM embedding_cache WHERE model = ? AND version = ?",
+            (self.model, self.version)).fetchone()[0]
+        return {'entries': entries, 'hits': self.hits, 'misses': self.misses}
+
+# One cache per face model configuration, opened on first use
+_caches = {}
+_lock = threading.Lock()
+
+def get_insightface_cache(path=DEFAULT_CACHE_PATH):
+    """
+    Get the cache for the active InsightFace inference profile.
+
+    The version tag combines a fingerprint of the installed model pack with
+    the detector input size, both of which change the embeddings.
+    """
+    from face_models import get_profile, get_model_version
+    settings = get_profile()
+    width, height = settings['det_size']
+    key = ('insightface', settings['name'], width, height, path)
+    with _lock:
+        cache = _caches.get(key)
+        if cache is None:
+            version = f"{get_model_version(settings['name'])}-det{width}x{height}"
+            cache = EmbeddingCache(f"insightface/{settings['name']}", version, path)
+            _caches[key] = cache
+        return cache
+
+def _package_version(package):
+    """Installed version of a distribution, or 'unknown' when it is not installed."""
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+def get_dlib_cache(path=DEFAULT_CACHE_PATH):
+    """Get the cache for the dlib encoder used by the face_recognition package."""
+    key = ('dlib', path)
+    with _lock:
+        cache = _caches.get(key)
+        if cache is None:
+            # Read versions from the installed distributions: importing
+            # face_recognition here finds this repo's face_recognition.py
+            version = "-".join(_package_version(package) for package in
+                               ('face_recognition', 'face_recognition_models', 'dlib'))
+            cache = EmbeddingCache("face_recognition/dlib", version, path)
+            _caches[key] = cache
+        return cache
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cache = get_insightface_cache()
+    print(f"Embedding cache {DEFAULT_CACHE_PATH}: {cache.model} {cache.version}")
+    print(cache.stats())
@@ -0,0 +1,435 @@
+import os
+import sys
+import json
+import pickle
+import hashlib
+import logging
+import threading
+import numpy as np
+
+# Add the current directory to the path so we can import from the root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from model_registry import file_lock
+
+logger = logging.getLogger("EmbeddingStore")
+
+DEFAULT_STORE_DIR = os.path.join("face_data", "store")
+LEGACY_DATA_DIR = "face_data"
+
+EMBEDDINGS_FILE = "embeddings.npy"
+EMBEDDINGS_PREFIX = "embeddings."
+INDEX_FILE = "index.json"
+STORE_FORMAT = 1
+
+# Rows reserved when the embeddings file is first created
+INITIAL_CAPACITY = 1024
+
+# Compact automatically once this fraction of the stored rows is dead
+COMPACT_RATIO = 0.25
+
+def store_path_for_db(db_path="attendance.db"):
+    """
+    Directory of the store that mirrors a database: face_data/store next to
+    attendance.db, face_data/store_<name> next to any other database.
+    """
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    store = "store" if name == "attendance" else f"store_{name}"
+    return os.path.join(os.path.dirname(db_path), LEGACY_DATA_DIR, store)
+
+def embedding_hash(embedding):
+    """Content hash of one float32 embedding, used for deduplication."""
+    return hashlib.sha1(np.ascontiguousarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+
+class EmbeddingStore:
+    """
+    Append-only store of face embeddings shared by training, evaluation and
+    recognition.
+
+    All embeddings live in one float32 .npy file that is memory-mapped, so
+    readers get a view of the file instead of a copy. index.json names that
+    file and maps each live row to its user ID and content hash:
+
+        {"format": 1, "dim": 512, "count": 120, "capacity": 1024,
+         "generation": 3, "file": "embeddings.3.npy",
+         "entries": [{"user_id": "S101", "offset": 0, "hash": "..."}, ...]}
+
+    count is the number of rows written to the file. Rows that are no longer
+    listed in entries are dead and are dropped by compact(). New rows are
+    written before the index is replaced, and the index is replaced
+    atomically, so a reader never sees a half-written row. Growing or
+    compacting the store writes the next generation's file and only the index
+    write switches to it, so a reader always pairs a matrix with the offsets
+    written for it. Files of older generations are removed afterwards.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_DIR):
+        """
+        Open (or prepare to create) a store.
+
+        Args:
+            path: Directory holding embeddings.npy and index.json.
+        """
+        self.path = path
+        self.index_path = os.path.join(path, INDEX_FILE)
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._mmap_stamp = None
+
+    def __len__(self):
+        return len(self._read_index()['entries'])
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'format': STORE_FORMAT, 'dim': 0, 'count': 0, 'capacity': 0, 'entries': []}
+
+    def _write_index(self, index):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+        self._remove_stale_files(index)
+
+    def _embeddings_path(self, index):
+        """Path of the embeddings file an index refers to."""
+        # Stores written before generations kept a single embeddings.npy
+        return os.path.join(self.path, index.get('file', EMBEDDINGS_FILE))
+
+    def _remove_stale_files(self, index):
+        """Delete embeddings files of generations the index no longer uses."""
+        current = os.path.basename(self._embeddings_path(index))
+        for name in os.listdir(self.path):
+            if name.startswith(EMBEDDINGS_PREFIX) and name.endswith(".npy") and name != current:
+                try:
+                    # Readers that already mapped the file keep their view
+                    os.remove(os.path.join(self.path, name))
+                except OSError as e:
+                    logger.debug(f"Could not remove {name} yet: {e}")
+
+    def _open(self, index):
+        """
+        Memory-map the embeddings file of an index read-only.
+
+        Returns:
+            The mapped array, or None if the store has no file yet. Raises
+            FileNotFoundError when a writer replaced the file after the index
+            was read.
+        """
+        if not index['capacity']:
+            return None
+        path = self._embeddings_path(index)
+        stat = os.stat(path)
+        stamp = (path, stat.st_ino, stat.st_size)
+        if self._mmap is None or self._mmap_stamp != stamp:
+            self._mmap = np.load(path, mmap_mode='r', allow_pickle=False)
+            self._mmap_stamp = stamp
+        return self._mmap
+
+    def _read_mapped(self, attempts=3):
+        """
+        Read the index together with the matrix it refers to.
+
+        A writer in another process may replace the file between the two
+        reads; the index is then read again and names the new file.
+
+        Returns:
+            Tuple (index, matrix); matrix is None for an empty store.
+        """
+        for attempt in range(attempts):
+            index = self._read_index()
+            try:
+                return index, self._open(index)
+            except FileNotFoundError:
+                if attempt == attempts - 1:
+                    raise
+
+    def _rewrite(self, rows, capacity, dim, index):
+        """
+        Write rows into the next generation's embeddings file with room for
+        capacity rows, and point index at it. The switch takes effect when
+        the index is written.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        generation = index.get('generation', 0) + 1
+        filename = f"{EMBEDDINGS_PREFIX}{generation}.npy"
+        tmp_path = os.path.join(self.path, filename + ".tmp")
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(capacity, dim))
+        if len(rows):
+            out[:len(rows)] = rows
+        out.flush()
+        del out
+        os.replace(tmp_path, os.path.join(self.path, filename))
+        index.update({'generation': generation, 'file': filename, 'capacity': capacity})
+
+    def embeddings(self, user_ids=None):
+        """
+        Get the live embeddings and their labels.
+
+        Args:
+            user_ids: Optional collection of user IDs to restrict the result to.
+
+        Returns:
+            Tuple (embeddings, labels): a float32 array of shape (n, dim) and a
+            numpy array of n user IDs. When the store is compacted and no
+            filter is given, embeddings is a read-only view of the mapped file.
+        """
+        with self._lock:
+            index, matrix = self._read_mapped()
+            entries = index['entries']
+            if user_ids is not None:
+                wanted = set(user_ids)
+                entries = [entry for entry in entries if entry['user_id'] in wanted]
+
+            if matrix is None or not entries:
+                return np.zeros((0, index['dim']), dtype=np.float32), np.array([])
+
+            labels = np.array([entry['user_id'] for entry in entries])
+            offsets = [entry['offset'] for entry in entries]
+            if offsets == list(range(len(offsets))):
+                return matrix[:len(offsets)], labels
+            return matrix[offsets], labels
+
+    def user_ids(self):
+        """Return the set of user IDs with at least one live embedding."""
+        return {entry['user_id'] for entry in self._read_index()['entries']}
+
+    def stats(self):
+        """
+        Get store metrics.
+
+        Returns:
+            Dict with dim, live, dead, capacity and bytes on disk.
+        """
+        index = self._read_index()
+        live = len(index['entries'])
+        path = self._embeddings_path(index)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        return {
+            'dim': index['dim'],
+            'live': live,
+            'dead': index['count'] - live,
+            'capacity': index['capacity'],
+            'bytes': size,
+        }
+
+    def add(self, embeddings, labels):
+        """
+        Append embeddings, skipping any (user, content) pair already stored.
+
+        Args:
+            embeddings: Array of shape (n, dim) or (dim,).
+            labels: Sequence of n user IDs.
+
+        Returns:
+            Number of rows appended.
+        """
+        return self._apply(embeddings, labels, replace=False)
+
+    def sync(self, embeddings, labels):
+        """
+        Make the store hold exactly the given embeddings.
+
+        Rows that are already stored are kept in place, new ones are appended
+        and stored rows that are not in the input are marked dead.
+
+        Args:
+            embeddings: Array of shape (n, dim).
+            labels: Sequence of n user IDs.
+
+        Returns:
+            Number of rows appended.
+        """
+        return self._apply(embeddings, labels, replace=True)
+
+    def remove_user(self, user_id):
+        """
+        Mark every embedding of a user as dead.
+
+        Returns:
+            Number of rows removed.
+        """
+        if not os.path.exists(self.index_path):
+            return 0
+        with self._lock, file_lock(self.index_path):
+            index = self._read_index()
+            before = len(index['entries'])
+            index['entries'] = [entry for entry in index['entries'] if entry['user_id'] != user_id]
+            removed = before - len(index['entries'])
+            if removed:
+                self._write_index(index)
+                self._maybe_compact(index)
+        return removed
+
+    def _apply(self, embeddings, labels, replace):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+        labels = [label.item() if hasattr(label, 'item') else label for label in labels]
+        if len(labels) != len(embeddings):
+            raise ValueError(f"Got {len(embeddings)} embeddings but {len(labels)} labels")
+
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock, file_lock(self.index_path):
+            index = self._read_index()
+            dim = embeddings.shape[1] if len(embeddings) else index['dim']
+            if index['dim'] and dim != index['dim']:
+                if not replace:
+                    raise ValueError(f"Store holds {index['dim']}-d embeddings, got {dim}-d")
+                logger.warning(f"Embedding size changed from {index['dim']} to {dim}; rebuilding the store")
+                # Keep counting generations so the new file never reuses a name in use
+                index = {'format': STORE_FORMAT, 'dim': dim, 'count': 0, 'capacity': 0, 'entries': [],
+                         'generation': index.get('generation', 0)}
+
+            stored = {(entry['user_id'], entry['hash']): entry for entry in index['entries']}
+            kept = {}
+            new_rows = []
+            new_entries = []
+            seen = set()
+            for user_id, embedding in zip(labels, embeddings):
+                key = (user_id, embedding_hash(embedding))
+                if key in seen:
+                    continue
+                seen.add(key)
+                if key in stored:
+                    kept[key] = stored[key]
+                else:
+                    new_entries.append({'user_id': user_id, 'offset': index['count'] + len(new_rows), 'hash': key[1]})
+                    new_rows.append(embedding)
+
+            entries = list(kept.values()) if replace else index['entries']
+            if replace:
+                # Keep the file order so a compacted store stays contiguous
+                entries.sort(key=lambda entry: entry['offset'])
+            changed = bool(new_rows) or len(entries) != len(index['entries'])
+            if not changed:
+                return 0
+
+            count = index['count'] + len(new_rows)
+            if count > index['capacity']:
+                # Grow by doubling so appends stay amortized O(1)
+                capacity = max(INITIAL_CAPACITY, index['capacity'] * 2, count)
+                old = self._open(index)
+                self._rewrite(old[:index['count']] if old is not None else [], capacity, dim, index)
+            if new_rows:
+                out = np.load(self._embeddings_path(index), mmap_mode='r+', allow_pickle=False)
+                out[index['count']:count] = np.stack(new_rows)
+                out.flush()
+                del out
+
+            index.update({'dim': dim, 'count': count, 'entries': entries + new_entries})
+            self._write_index(index)
+            self._maybe_compact(index)
+
+        if new_rows:
+            logger.info(f"Stored {len(new_rows)} new embeddings ({len(index['entries'])} live)")
+        return len(new_rows)
+
+    def _maybe_compact(self, index):
+        dead = index['count'] - len(index['entries'])
+        if dead and dead >= COMPACT_RATIO * index['count']:
+            self._compact(index)
+
+    def compact(self):
+        """
+        Rewrite the store without dead rows.
+
+        Afterwards the live rows are contiguous and embeddings() returns a
+        zero-copy view again.
+
+        Returns:
+            Number of dead rows dropped.
+        """
+        with self._lock, file_lock(self.index_path):
+            index = self._read_index()
+            return self._compact(index)
+
+    def _compact(self, index):
+        dead = index['count'] - len(index['entries'])
+        matrix = self._open(index)
+        if matrix is None:
+            return 0
+        offsets = [entry['offset'] for entry in index['entries']]
+        rows = matrix[offsets]
+        # The new offsets only apply to the new file, which the index write switches to
+        self._rewrite(rows, max(INITIAL_CAPACITY, len(rows)), index['dim'], index)
+        for position, entry in enumerate(index['entries']):
+            entry['offset'] = position
+        index['count'] = len(rows)
+        self._write_index(index)
+        logger.info(f"Compacted embedding store: dropped {dead} dead rows, {len(rows)} live")
+        return dead
+
+    def sync_from_db(self, db_path="attendance.db"):
+        """
+        Bring the store in line with the enrollment samples in the database.
+
+        Returns:
+            Number of rows appended, or None on error.
+        """
+        try:
+            from face_embeddings import load_embeddings
+            embeddings, labels = load_embeddings(db_path)
+            if embeddings is None:
+                return None
+            return self.sync(embeddings, labels)
+        except Exception as e:
+            logger.error(f"Error syncing embedding store from database: {str(e)}")
+            return None
+
+def import_legacy_files(store=None, data_dir=LEGACY_DATA_DIR, remove=False):
+    """
+    Merge the face_encodings_*.pkl snapshots written by older versions into the store.
+
+    The snapshots are mostly copies of each other, so deduplication leaves
+    one row per distinct (user, embedding).
+
+    Args:
+        store: EmbeddingStore to import into. Defaults to the shared store.
+        data_dir: Directory holding the snapshots.
+        remove: Delete each snapshot after it has been imported.
+
+    Returns:
+        Tuple (files imported, rows appended).
+    """
+    if store is None:
+        store = EmbeddingStore()
+    if not os.path.isdir(data_dir):
+        return 0, 0
+
+    files = sorted(f for f in os.listdir(data_dir)
+                   if f.startswith("face_encodings_") and f.endswith(".pkl"))
+    imported = 0
+    appended = 0
+    for name in files:
+        path = os.path.join(data_dir, name)
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+            appended += store.add(data['encodings'], data['labels'])
+            imported += 1
+            if remove:
+                os.remove(path)
+        except Exception as e:
+            logger.error(f"Could not import {path}: {e}")
+    return imported, appended
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    store = EmbeddingStore()
+    print(f"Embedding store: {store.stats()}")
+
+    if len(sys.argv) > 1 and sys.argv[1] == "compact":
+        print(f"Dropped {store.compact()} dead rows")
+    elif len(sys.argv) > 1 and sys.argv[1] == "import":
+        response = input(f"\nImport the snapshots in {LEGACY_DATA_DIR}/ and delete them? (yes/no): ")
+        if response.lower() == 'yes':
+            files, rows = import_legacy_files(store, remove=True)
+            print(f"\n✅ Imported {files} snapshots ({rows} distinct embeddings)")
+            print(f"Embedding store: {store.stats()}")
+        else:
+            print("Operation cancelled.")
@@ -0,0 +1,153 @@
+import os
+import sys
+import logging
+import numpy as np
+from datetime import datetime
+
+# Add the current directory to the path so we can import from the root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db import get_connection
+
+logger = logging.getLogger("FaceEmbeddings")
+
+# Size of the InsightFace embeddings the gallery and classifiers use. The AI
+# integration stores 128-d dlib encodings in the same table; readers select
+# one kind by its size.
+EMBEDDING_DIM = 512
+
+def encode_vector(embedding):
+    """Convert an embedding to the float32 BLOB stored in the embeddings table."""
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+def add_embedding(cursor, user_id, embedding, quality=None, source=None):
+    """
+    Insert one enrollment sample for a user.
+
+    The caller owns the transaction, so the sample is committed together with
+    the user row it belongs to.
+
+    Args:
+        cursor: Cursor of the connection that will commit the insert.
+        user_id: ID of the user.
+        embedding: Face embedding of shape (dim,).
+        quality: Optional quality score, e.g. the detector confidence.
+        source: Optional origin of the sample, e.g. the image path.
+
+    Returns:
+        Row ID of the new sample.
+    """
+    cursor.execute("""
+        INSERT INTO embeddings (user_id, vector, quality, source, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (user_id, encode_vector(embedding), quality, source,
+          datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    return cursor.lastrowid
+
+def delete_embeddings(cursor, user_id):
+    """
+    Delete every enrollment sample of a user.
+
+    Returns:
+        Number of samples deleted.
+    """
+    cursor.execute("DELETE FROM embeddings WHERE user_id = ?", (user_id,))
+    return cursor.rowcount
+
+def load_embeddings(db_path="attendance.db", user_ids=None, min_quality=None, dim=EMBEDDING_DIM):
+    """
+    Load enrollment samples into one contiguous array.
+
+    All vectors are fetched with a single query and decoded with one
+    np.frombuffer call over the concatenated BLOBs.
+
+    Args:
+        db_path: Path to the SQLite database.
+        user_ids: Optional collection of user IDs to restrict the result to.
+        min_quality: Optional minimum quality; samples without a score are kept.
+        dim: Embedding size to load; samples of other models are skipped.
+
+    Returns:
+        Tuple (embeddings, labels): a float32 array of shape (n, dim) and a
+        numpy array of n user IDs, ordered by user. (None, None) on error.
+    """
+    try:
+        sql = "SELECT e.user_id, e.vector FROM embeddings e JOIN users u ON u.user_id = e.user_id"
+        clauses = ["length(e.vector) = ?"]
+        params = [dim * 4]
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            clauses.append(f"e.user_id IN ({','.join('?' * len(user_ids))})")
+            params.extend(user_ids)
+        if min_quality is not None:
+            clauses.append("(e.quality IS NULL OR e.quality >= ?)")
+            params.append(min_quality)
+        sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY e.user_id, e.id"
+
+        rows = get_connection(db_path).execute(sql, params).fetchall()
+        if not rows:
+            return np.zeros((0, 0), dtype=np.float32), np.array([])
+
+        blobs = [blob for _, blob in rows]
+        embeddings = np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), dim)
+        labels = np.array([user_id for user_id, _ in rows])
+        return embeddings, labels
+
+    except Exception as e:
+        logger.error(f"Error loading embeddings from database: {str(e)}")
+        return None, None
+
+def compute_centroids(embeddings, labels):
+    """
+    Average the L2-normalized samples of each user in one vectorized pass.
+
+    Args:
+        embeddings: Array of shape (n, dim).
+        labels: Sequence of n user IDs.
+
+    Returns:
+        Tuple (centroids, user_ids): a float32 array of shape (k, dim) with
+        unit-length rows and the k distinct user IDs in sorted order.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    labels = np.asarray(labels)
+    if len(labels) == 0:
+        return np.zeros((0, embeddings.shape[1] if embeddings.ndim == 2 else 0), dtype=np.float32), []
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    unit = embeddings / norms
+
+    user_ids, inverse = np.unique(labels, return_inverse=True)
+    # Sum each user's rows: sort by user, then reduce over each contiguous run
+    order = np.argsort(inverse, kind='stable')
+    starts = np.searchsorted(inverse[order], np.arange(len(user_ids)))
+    sums = np.add.reduceat(unit[order], starts, axis=0)
+
+    norms = np.linalg.norm(sums, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(sums / norms, dtype=np.float32), user_ids.tolist()
+
+def load_centroids(db_path="attendance.db", user_ids=None):
+    """
+    Load one normalized centroid per enrolled user.
+
+    Returns:
+        Tuple (centroids, user_ids), or (None, None) on error.
+    """
+    embeddings, labels = load_embeddings(db_path, user_ids=user_ids)
+    if embeddings is None:
+        return None, None
+    return compute_centroids(embeddings, labels)
+
+def count_samples(db_path="attendance.db"):
+    """
+    Count enrollment samples per user.
+
+    Returns:
+        Dict of user_id -> number of samples.
+    """
+    rows = get_connection(db_path).execute(
+        "SELECT user_id, COUNT(*) FROM embeddings GROUP BY user_id").fetchall()
+    return dict(rows)
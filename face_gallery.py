@@ -0,0 +1,282 @@
+import os
+import sys
+import logging
+import threading
+import numpy as np
+from embedding_store import EmbeddingStore, store_path_for_db
+from face_embeddings import compute_centroids, load_centroids
+
+# Add the current directory to the path so we can import from the root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger("FaceGallery")
+
+# Cosine similarity below which a face is reported as unknown (open-set)
+DEFAULT_MATCH_THRESHOLD = 0.4
+
+# Galleries at least this large are searched through the ANN index
+ANN_MIN_IDENTITIES = 5000
+
+def normalize_embeddings(embeddings):
+    """
+    L2-normalize a batch of embeddings.
+
+    Args:
+        embeddings: Array of shape (n, dim) or (dim,).
+
+    Returns:
+        Contiguous float32 array of shape (n, dim) with unit-length rows.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim == 1:
+        embeddings = embeddings.reshape(1, -1)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(embeddings / norms, dtype=np.float32)
+
+class FaceGallery:
+    """Cosine-similarity matcher over a contiguous matrix of enrolled embeddings."""
+
+    def __init__(self, threshold=DEFAULT_MATCH_THRESHOLD):
+        """
+        Initialize an empty gallery.
+
+        Args:
+            threshold: Minimum cosine similarity to accept a match.
+        """
+        self.threshold = threshold
+        self.user_ids = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.index = None
+        # Guards the (user_ids, matrix) pair while identities are added or removed
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @property
+    def dim(self):
+        """Embedding dimension of the gallery, or 0 if empty."""
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    def build(self, embeddings, user_ids):
+        """
+        Replace the gallery contents.
+
+        Args:
+            embeddings: Array of shape (n, dim), one row per enrolled user.
+            user_ids: Sequence of n user IDs aligned with the rows.
+        """
+        self.index = None
+        if len(user_ids) == 0:
+            with self._lock:
+                self.user_ids = []
+                self.matrix = np.zeros((0, 0), dtype=np.float32)
+            return
+        matrix = normalize_embeddings(embeddings)
+        with self._lock:
+            self.matrix = matrix
+            self.user_ids = list(user_ids)
+        logger.info(f"Gallery built with {len(self.user_ids)} identities (dim {self.dim})")
+
+    def attach(self, matrix, user_ids):
+        """
+        Use an already normalized matrix as the gallery without copying it,
+        e.g. a view of a shared memory block.
+
+        Args:
+            matrix: float32 array of shape (n, dim) with unit-length rows.
+            user_ids: Sequence of n user IDs aligned with the rows.
+        """
+        self.index = None
+        with self._lock:
+            self.matrix = matrix
+            self.user_ids = list(user_ids)
+
+    def add(self, user_id, db_path="attendance.db"):
+        """
+        Insert one identity, or replace its row if it is already enrolled.
+
+        The row is the centroid of all of the user's enrollment samples in
+        the database, as in load_from_db. Only the affected row is touched,
+        so a new user can be matched immediately without rebuilding the
+        gallery.
+
+        Args:
+            user_id: ID of the user.
+            db_path: Path to the SQLite database.
+
+        Returns:
+            True if the user was added, False otherwise.
+        """
+        vector, user_ids = load_centroids(db_path, user_ids=[user_id])
+        if vector is None:
+            return False
+        if not user_ids:
+            logger.warning(f"No face encodings found for {user_id}.")
+            return False
+        with self._lock:
+            if len(self.user_ids) == 0:
+                self.matrix = vector
+                self.user_ids = [user_id]
+            elif user_id in self.user_ids:
+                matrix = self.matrix.copy()
+                matrix[self.user_ids.index(user_id)] = vector[0]
+                self.matrix = matrix
+            else:
+                self.matrix = np.vstack([self.matrix, vector])
+                self.user_ids = self.user_ids + [user_id]
+            if self.index is not None:
+                self.index.add(vector, [user_id])
+        logger.info(f"Added {user_id} to the gallery ({len(self.user_ids)} identities)")
+        return True
+
+    def remove(self, user_id):
+        """
+        Remove one identity from the gallery.
+
+        Args:
+            user_id: ID of the user.
+
+        Returns:
+            True if the user was enrolled, False otherwise.
+        """
+        with self._lock:
+            if user_id not in self.user_ids:
+                return False
+            position = self.user_ids.index(user_id)
+            self.matrix = np.delete(self.matrix, position, axis=0)
+            self.user_ids = self.user_ids[:position] + self.user_ids[position + 1:]
+            if self.index is not None:
+                self.index.remove(user_id)
+        logger.info(f"Removed {user_id} from the gallery ({len(self.user_ids)} identities)")
+        return True
+
+    def load_from_db(self, db_path="attendance.db", exclude=None):
+        """
+        Build the gallery from the enrollment samples in the database, one
+        centroid per user.
+
+        Args:
+            db_path: Path to the SQLite database.
+            exclude: Optional collection of user IDs to leave out.
+
+        Returns:
+            True if loaded successfully, False otherwise.
+        """
+        try:
+            if not os.path.exists(db_path):
+                logger.error(f"Database file '{db_path}' not found.")
+                return False
+
+            # Read the encodings through the embedding store of this database,
+            # which is brought up to date with its embeddings table first
+            store = EmbeddingStore(store_path_for_db(db_path))
+            if store.sync_from_db(db_path) is None:
+                return False
+
+            exclude = set(exclude or ())
+            wanted = store.user_ids() - exclude if exclude else None
+            embeddings, labels = store.embeddings(wanted)
+
+            # Users with several enrollment samples are matched against their centroid
+            embeddings, user_ids = compute_centroids(embeddings, labels)
+
+            if not user_ids:
+                logger.warning("No face encodings found for the gallery.")
+                self.build([], [])
+                return True
+
+            self.build(embeddings, user_ids)
+            
+            if len(user_ids) >= ANN_MIN_IDENTITIES:
+                # Index exactly these rows: the saved index ignores exclude and
+                # misses enrollments made without add_to_index
+                from face_index import IVFIndex
+                index = IVFIndex()
+                index.train(self.matrix)
+                index.add(self.matrix, self.user_ids)
+                self.index = index
+            return True
+
+        except Exception as e:
+            logger.error(f"Error loading gallery from database: {str(e)}")
+            import traceback
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return False
+
+    def score(self, embeddings):
+        """
+        Score faces against every enrolled identity.
+
+        Args:
+            embeddings: Array of shape (n, dim) or (dim,).
+
+        Returns:
+            Array of shape (n, len(gallery)) with cosine similarities.
+        """
+        return self._score(embeddings, self.matrix)
+
+    def _score(self, embeddings, matrix):
+        queries = normalize_embeddings(embeddings)
+        if matrix.shape[0] == 0:
+            return np.zeros((queries.shape[0], 0), dtype=np.float32)
+        return queries @ matrix.T
+
+    def topk(self, embeddings, k=1):
+        """
+        Find the k most similar enrolled identities for each face.
+
+        Args:
+            embeddings: Array of shape (n, dim) or (dim,).
+            k: Number of identities to return per face.
+
+        Returns:
+            Tuple (ids, scores): ids is a list of n lists of up to k user IDs,
+            best first, and scores is an array of shape (n, k) padded with -inf.
+        """
+        if self.index is not None:
+            return self.index.search(embeddings, k=k)
+
+        # Take a consistent snapshot in case an identity is added meanwhile
+        with self._lock:
+            user_ids, matrix = self.user_ids, self.matrix
+        scores = self._score(embeddings, matrix)
+        n_faces, n_users = scores.shape
+        top_scores = np.full((n_faces, k), -np.inf, dtype=np.float32)
+        top = min(k, n_users)
+        if top == 0:
+            return [[] for _ in range(n_faces)], top_scores
+
+        if top < n_users:
+            # Partial sort is enough to find the k best
+            top_idx = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+        else:
+            top_idx = np.tile(np.arange(n_users), (n_faces, 1))
+        order = np.argsort(-np.take_along_axis(scores, top_idx, axis=1), axis=1, kind='stable')
+        top_idx = np.take_along_axis(top_idx, order, axis=1)
+        top_scores[:, :top] = np.take_along_axis(scores, top_idx, axis=1)
+        return [[user_ids[i] for i in row] for row in top_idx], top_scores
+
+    def match(self, embeddings):
+        """
+        Find the best enrolled identity for each face in one matrix multiply.
+
+        Args:
+            embeddings: Array of shape (n, dim) or (dim,).
+
+        Returns:
+            List of (user_id, score, margin) tuples, one per face. user_id is None
+            when the best score is below the threshold. margin is the gap between
+            the best and the runner-up score.
+        """
+        ids, scores = self.topk(embeddings, k=2)
+        results = []
+        for row_ids, (best, second) in zip(ids, scores):
+            if not row_ids:
+                results.append((None, 0.0, 0.0))
+                continue
+            margin = best - second if len(row_ids) > 1 else best
+            user_id = row_ids[0] if best >= self.threshold else None
+            results.append((user_id, float(best), float(margin)))
+        return results
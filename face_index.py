@@ -0,0 +1,388 @@
+import os
+import sys
+import time
+import logging
+import numpy as np
+
+# Add the current directory to the path so we can import from the root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from face_gallery import normalize_embeddings
+from face_embeddings import load_centroids
+
+logger = logging.getLogger("FaceIndex")
+
+DEFAULT_INDEX_PATH = os.path.join("models", "face_index.npz")
+
+# Below this many identities a single list (exact search) is faster than IVF
+MIN_VECTORS_PER_LIST = 64
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index over unit-length embeddings.
+
+    Vectors are assigned to the closest of nlist k-means centroids. A query only
+    scores the vectors in its nprobe closest lists, so search cost grows with
+    n / nlist * nprobe instead of n. Inner product equals cosine similarity
+    because every stored vector is L2-normalized.
+    """
+
+    def __init__(self, nlist=None, nprobe=8):
+        """
+        Initialize an empty index.
+
+        Args:
+            nlist: Number of inverted lists. If None, chosen from the data size when trained.
+            nprobe: Number of lists scanned per query.
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.dim = 0
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.list_vectors = []
+        self.list_ids = []
+        self.id_to_list = {}
+
+    def __len__(self):
+        return len(self.id_to_list)
+
+    @property
+    def is_trained(self):
+        """True once the coarse centroids exist."""
+        return self.centroids.shape[0] > 0
+
+    def train(self, embeddings, n_iter=10, seed=42):
+        """
+        Fit the coarse quantizer with spherical k-means.
+
+        Args:
+            embeddings: Array of shape (n, dim) used to place the centroids.
+            n_iter: Number of k-means iterations.
+            seed: Random seed for centroid initialization.
+        """
+        data = normalize_embeddings(embeddings)
+        n_vectors, self.dim = data.shape
+
+        nlist = self.nlist
+        if nlist is None:
+            nlist = int(4 * np.sqrt(n_vectors))
+        nlist = max(1, min(nlist, n_vectors // MIN_VECTORS_PER_LIST))
+        self.nlist = nlist
+
+        rng = np.random.default_rng(seed)
+        centroids = data[rng.choice(n_vectors, nlist, replace=False)].copy()
+
+        # Train on a sample; a few hundred points per list is plenty
+        sample_size = min(n_vectors, nlist * 256)
+        sample = data[rng.choice(n_vectors, sample_size, replace=False)] if sample_size < n_vectors else data
+
+        for _ in range(n_iter if nlist > 1 else 0):
+            assignments = (sample @ centroids.T).argmax(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=nlist)
+            empty = counts == 0
+            # Re-seed empty lists from random points
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = normalize_embeddings(sums)
+
+        self.centroids = centroids
+        self.list_vectors = [np.zeros((0, self.dim), dtype=np.float32) for _ in range(nlist)]
+        self.list_ids = [[] for _ in range(nlist)]
+        self.id_to_list = {}
+        logger.info(f"Trained IVF index with {nlist} lists on {len(sample)} vectors")
+
+    def _assign(self, vectors):
+        """Return the closest list for each normalized vector."""
+        return (vectors @ self.centroids.T).argmax(axis=1)
+
+    def add(self, embeddings, ids):
+        """
+        Insert embeddings. An ID that is already present is replaced.
+
+        Args:
+            embeddings: Array of shape (n, dim) or (dim,).
+            ids: Sequence of n identifiers aligned with the rows.
+        """
+        vectors = normalize_embeddings(embeddings)
+        ids = list(ids)
+        if not self.is_trained:
+            self.train(vectors)
+
+        for item_id in ids:
+            if item_id in self.id_to_list:
+                self.remove(item_id)
+
+        assignments = self._assign(vectors)
+        for list_no in np.unique(assignments):
+            rows = np.flatnonzero(assignments == list_no)
+            self.list_vectors[list_no] = np.ascontiguousarray(
+                np.vstack([self.list_vectors[list_no], vectors[rows]]))
+            for row in rows:
+                self.list_ids[list_no].append(ids[row])
+                self.id_to_list[ids[row]] = int(list_no)
+
+    def remove(self, item_id):
+        """
+        Remove one identifier from the index.
+
+        Args:
+            item_id: Identifier to remove.
+
+        Returns:
+            True if the identifier was present, False otherwise.
+        """
+        list_no = self.id_to_list.pop(item_id, None)
+        if list_no is None:
+            return False
+        position = self.list_ids[list_no].index(item_id)
+        del self.list_ids[list_no][position]
+        self.list_vectors[list_no] = np.delete(self.list_vectors[list_no], position, axis=0)
+        return True
+
+    def search(self, queries, k=1):
+        """
+        Find the k most similar stored vectors for each query.
+
+        Args:
+            queries: Array of shape (n, dim) or (dim,).
+            k: Number of neighbours to return.
+
+        Returns:
+            Tuple (ids, scores): ids is a list of n lists of up to k identifiers,
+            scores is an array of shape (n, k) padded with -inf.
+        """
+        queries = normalize_embeddings(queries)
+        n_queries = queries.shape[0]
+        result_ids = [[] for _ in range(n_queries)]
+        result_scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        if len(self) == 0:
+            return result_ids, result_scores
+
+        nprobe = min(self.nprobe, self.nlist)
+        centroid_scores = queries @ self.centroids.T
+        if nprobe < self.nlist:
+            probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.tile(np.arange(self.nlist), (n_queries, 1))
+
+        for q in range(n_queries):
+            lists = [list_no for list_no in probes[q] if len(self.list_ids[list_no])]
+            if not lists:
+                continue
+            candidates = np.vstack([self.list_vectors[list_no] for list_no in lists])
+            candidate_ids = [item_id for list_no in lists for item_id in self.list_ids[list_no]]
+            scores = candidates @ queries[q]
+            top = min(k, len(scores))
+            best = np.argpartition(-scores, top - 1)[:top]
+            best = best[np.argsort(-scores[best])]
+            result_ids[q] = [candidate_ids[i] for i in best]
+            result_scores[q, :top] = scores[best]
+        return result_ids, result_scores
+
+    def save(self, path=DEFAULT_INDEX_PATH):
+        """
+        Save the index next to the models, replacing any previous file atomically.
+
+        Args:
+            path: Destination .npz file.
+
+        Returns:
+            Path to the saved index.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        ids = [item_id for list_ids in self.list_ids for item_id in list_ids]
+        assignments = np.concatenate([np.full(len(list_ids), list_no, dtype=np.int32)
+                                      for list_no, list_ids in enumerate(self.list_ids)]) \
+            if self.list_ids else np.zeros(0, dtype=np.int32)
+        vectors = np.vstack(self.list_vectors) if self.list_vectors else np.zeros((0, self.dim), dtype=np.float32)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, centroids=self.centroids, vectors=vectors,
+                     ids=np.array(ids, dtype=str), assignments=assignments,
+                     nprobe=np.int32(self.nprobe))
+        os.replace(tmp_path, path)
+        logger.info(f"Saved index with {len(ids)} vectors to {path}")
+        return path
+
+    @classmethod
+    def load(cls, path=DEFAULT_INDEX_PATH):
+        """
+        Load an index saved with save().
+
+        Args:
+            path: Index .npz file.
+
+        Returns:
+            IVFIndex instance.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(nlist=data['centroids'].shape[0], nprobe=int(data['nprobe']))
+            index.centroids = data['centroids'].astype(np.float32)
+            index.dim = index.centroids.shape[1]
+            vectors = data['vectors'].astype(np.float32)
+            ids = data['ids'].tolist()
+            assignments = data['assignments']
+
+        index.list_vectors = []
+        index.list_ids = []
+        for list_no in range(index.nlist):
+            rows = np.flatnonzero(assignments == list_no)
+            index.list_vectors.append(np.ascontiguousarray(vectors[rows]))
+            index.list_ids.append([ids[row] for row in rows])
+            for row in rows:
+                index.id_to_list[ids[row]] = list_no
+        logger.info(f"Loaded index with {len(index)} vectors from {path}")
+        return index
+
+def build_index_from_db(db_path="attendance.db", index_path=DEFAULT_INDEX_PATH):
+    """
+    Build the index from every enrolled user's centroid and save it.
+
+    Args:
+        db_path: Path to the SQLite database.
+        index_path: Destination .npz file.
+
+    Returns:
+        IVFIndex instance, or None on failure.
+    """
+    try:
+        embeddings, user_ids = load_centroids(db_path)
+        if embeddings is None:
+            return None
+
+        index = IVFIndex()
+        if len(user_ids):
+            index.train(embeddings)
+            index.add(embeddings, user_ids)
+        index.save(index_path)
+        return index
+
+    except Exception as e:
+        logger.error(f"Error building index from database: {str(e)}")
+        return None
+
+def load_index(index_path=DEFAULT_INDEX_PATH, db_path="attendance.db"):
+    """Load the saved index, building it from the database if it does not exist yet."""
+    if os.path.exists(index_path):
+        try:
+            return IVFIndex.load(index_path)
+        except Exception as e:
+            logger.error(f"Error loading index, rebuilding: {str(e)}")
+    return build_index_from_db(db_path, index_path)
+
+def add_to_index(user_id, index_path=DEFAULT_INDEX_PATH, db_path="attendance.db"):
+    """
+    Insert or replace one user in the saved index.
+
+    The index holds one centroid per user, so the user's centroid is
+    recomputed from all of their enrollment samples in the database.
+
+    Returns:
+        True if successful, False otherwise.
+    """
+    try:
+        centroids, user_ids = load_centroids(db_path, user_ids=[user_id])
+        if centroids is None:
+            return False
+        if not user_ids:
+            logger.warning(f"No enrollment samples found for {user_id}")
+            return False
+
+        index = load_index(index_path, db_path)
+        if index is None:
+            return False
+        if len(index) >= 4 * MIN_VECTORS_PER_LIST * index.nlist:
+            # The gallery has outgrown its lists; re-cluster from the database
+            index = build_index_from_db(db_path, index_path)
+            if index is None:
+                return False
+        index.add(centroids, user_ids)
+        index.save(index_path)
+        return True
+    except Exception as e:
+        logger.error(f"Error adding user {user_id} to index: {str(e)}")
+        return False
+
+def remove_from_index(user_id, index_path=DEFAULT_INDEX_PATH):
+    """
+    Remove one user from the saved index.
+
+    Returns:
+        True if successful (or the index does not exist yet), False otherwise.
+    """
+    try:
+        if not os.path.exists(index_path):
+            return True
+        index = IVFIndex.load(index_path)
+        if index.remove(user_id):
+            index.save(index_path)
+        return True
+    except Exception as e:
+        logger.error(f"Error removing user {user_id} from index: {str(e)}")
+        return False
+
+def benchmark(n_identities=100000, dim=512, n_queries=1000, nprobe=8, noise=0.6, seed=0):
+    """
+    Compare the IVF index with brute-force search on synthetic embeddings.
+
+    Queries are noisy copies of enrolled vectors, so the brute-force nearest
+    neighbour is the ground truth for Recall@1.
+
+    Returns:
+        Dict with recall_at_1, brute_ms and ivf_ms (mean milliseconds per query)
+        and build_s (seconds to train and fill the index).
+    """
+    rng = np.random.default_rng(seed)
+    gallery = normalize_embeddings(rng.standard_normal((n_identities, dim), dtype=np.float32))
+    ids = [f"S{i}" for i in range(n_identities)]
+    targets = rng.choice(n_identities, n_queries, replace=False)
+    queries = normalize_embeddings(gallery[targets] + noise / np.sqrt(dim) *
+                                   rng.standard_normal((n_queries, dim), dtype=np.float32))
+
+    start = time.perf_counter()
+    index = IVFIndex(nprobe=nprobe)
+    index.train(gallery)
+    index.add(gallery, ids)
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    truth = [ids[i] for i in (queries @ gallery.T).argmax(axis=1)]
+    brute_ms = (time.perf_counter() - start) * 1000 / n_queries
+
+    start = time.perf_counter()
+    found, _ = index.search(queries, k=1)
+    ivf_ms = (time.perf_counter() - start) * 1000 / n_queries
+
+    hits = sum(1 for expected, result in zip(truth, found) if result and result[0] == expected)
+    return {
+        'recall_at_1': hits / n_queries,
+        'brute_ms': brute_ms,
+        'ivf_ms': ivf_ms,
+        'build_s': build_s,
+        'nlist': index.nlist,
+    }
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build or benchmark the face ANN index")
+    parser.add_argument("command", choices=["build", "benchmark"])
+    parser.add_argument("--identities", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = build_index_from_db()
+        if index is not None:
+            print(f"Index built with {len(index)} users")
+    else:
+        print(f"{'nprobe':<8} {'nlist':<8} {'Recall@1':<10} {'Brute ms/q':<12} {'IVF ms/q':<10} {'Build s':<8}")
+        print("-" * 60)
+        for nprobe in args.nprobe:
+            result = benchmark(args.identities, n_queries=args.queries, nprobe=nprobe)
+            print(f"{nprobe:<8} {result['nlist']:<8} {result['recall_at_1']:<10.3f} "
+                  f"{result['brute_ms']:<12.3f} {result['ivf_ms']:<10.3f} {result['build_s']:<8.1f}")
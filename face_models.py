@@ -0,0 +1,612 @@
+import os
+import sys
+import time
+import threading
+import logging
+
+# Add the current directory to the path so we can import from the root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger("FaceModels")
+
+# Default InsightFace configuration shared by every module that touches faces.
+# VeriFace only ever uses the detector boxes and the ArcFace embedding.
+DEFAULT_MODEL_NAME = 'buffalo_l'
+DEFAULT_ALLOWED_MODULES = ('detection', 'recognition')
+DEFAULT_DET_SIZE = (640, 640)
+DEFAULT_PROVIDERS = ('CPUExecutionProvider',)
+
+# Inference profiles: model pack, modules and detector input size per deployment.
+# buffalo_s and buffalo_sc share the same detector (det_500m) and recognizer
+# (w600k_mbf); with the landmark and gender/age modules pruned they behave
+# the same, and buffalo_sc is the smaller download.
+INFERENCE_PROFILES = {
+    'accurate': {'name': 'buffalo_l', 'allowed_modules': DEFAULT_ALLOWED_MODULES, 'det_size': (640, 640)},
+    'balanced': {'name': 'buffalo_l', 'allowed_modules': DEFAULT_ALLOWED_MODULES, 'det_size': (480, 480)},
+    'light': {'name': 'buffalo_sc', 'allowed_modules': DEFAULT_ALLOWED_MODULES, 'det_size': (640, 640)},
+    'fast': {'name': 'buffalo_sc', 'allowed_modules': DEFAULT_ALLOWED_MODULES, 'det_size': (320, 320)},
+    'edge': {'name': 'buffalo_l', 'allowed_modules': DEFAULT_ALLOWED_MODULES, 'det_size': (640, 640),
+             'quantized': True},
+}
+DEFAULT_PROFILE = 'accurate'
+
+# Recognition model in each pack; embeddings are only comparable within one
+RECOGNITION_MODELS = {
+    'buffalo_l': 'w600k_r50',
+    'buffalo_m': 'w600k_r50',
+    'buffalo_s': 'w600k_mbf',
+    'buffalo_sc': 'w600k_mbf',
+}
+
+# Environment variable selecting the profile for a deployment
+PROFILE_ENV = 'VERIFACE_PROFILE'
+
+# INT8 packs written by quantize_models.py sit next to the float pack with
+# this suffix; a profile with 'quantized': True, or VERIFACE_INT8=1, uses them
+QUANTIZED_SUFFIX = '_int8'
+QUANTIZED_ENV = 'VERIFACE_INT8'
+
+# Most aligned face crops passed to the recognition model in one run
+EMBED_BATCH_SIZE = 32
+
+# ONNX Runtime session settings applied to every model, then per task.
+# intra_op_num_threads=None splits the cores between CONCURRENT_SESSIONS
+# sessions, since detection and recognition run at the same time in the
+# live pipeline; spinning is off so idle sessions do not burn those cores.
+SESSION_DEFAULTS = {
+    'intra_op_num_threads': None,
+    'inter_op_num_threads': 1,
+    'execution_mode': 'sequential',
+    'graph_optimization_level': 'all',
+    'enable_cpu_mem_arena': True,
+    'enable_mem_pattern': True,
+    'allow_spinning': False,
+}
+SESSION_OVERRIDES = {
+    'detection': {},
+    'recognition': {},
+}
+CONCURRENT_SESSIONS = 2
+
+# Environment variable overriding the intra-op threads of every session
+THREADS_ENV = 'VERIFACE_ORT_THREADS'
+
+# Timed runs after the first (cold) run when warming up a model
+WARMUP_RUNS = 3
+
+# One FaceAnalysis instance per configuration, built on first use
+_models = {}
+_model_stats = {}
+_lock = threading.Lock()
+
+# Profile chosen with set_profile; overrides the environment when set
+_active_profile = None
+
+def _memory_usage_mb():
+    """Return the resident memory of this process in MB, or None if unavailable."""
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    except Exception:
+        return None
+
+    try:
+        # Without psutil, read the current resident pages on Linux
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except Exception:
+        return None
+
+def model_root():
+    """InsightFace home directory: $INSIGHTFACE_HOME or ~/.insightface."""
+    return os.environ.get('INSIGHTFACE_HOME', os.path.join(os.path.expanduser('~'), '.insightface'))
+
+def quantized_pack_name(name):
+    """Name of the INT8 variant of a model pack."""
+    return name if name.endswith(QUANTIZED_SUFFIX) else name + QUANTIZED_SUFFIX
+
+def float_pack_name(name):
+    """Name of the float pack an INT8 pack was made from."""
+    return name[:-len(QUANTIZED_SUFFIX)] if name.endswith(QUANTIZED_SUFFIX) else name
+
+def get_profile_name():
+    """Name of the active inference profile: set_profile, then $VERIFACE_PROFILE, then the default."""
+    return _active_profile or os.environ.get(PROFILE_ENV) or DEFAULT_PROFILE
+
+def get_profile(profile=None):
+    """
+    Get the settings of an inference profile.
+
+    Args:
+        profile: Profile name. Defaults to the active profile.
+
+    Returns:
+        Dict with profile, name (model pack), allowed_modules, det_size and
+        quantized; name is the INT8 pack when quantized is set.
+    """
+    profile = profile or get_profile_name()
+    if profile not in INFERENCE_PROFILES:
+        raise ValueError(f"Unknown inference profile '{profile}' "
+                         f"(choose from {', '.join(INFERENCE_PROFILES)})")
+    settings = dict(INFERENCE_PROFILES[profile])
+    settings['profile'] = profile
+    settings['quantized'] = bool(settings.get('quantized') or
+                                 os.environ.get(QUANTIZED_ENV, '0') not in ('', '0'))
+    if settings['quantized']:
+        settings['name'] = quantized_pack_name(settings['name'])
+    return settings
+
+def set_profile(profile):
+    """
+    Select the inference profile for this process.
+
+    Apps already built for another profile stay cached, so call this before
+    the first get_face_app call.
+
+    Args:
+        profile: Profile name, or None to go back to $VERIFACE_PROFILE / the default.
+    """
+    global _active_profile
+    if profile is not None:
+        get_profile(profile)
+    _active_profile = profile
+
+def embeddings_compatible(name, other):
+    """Return True if two model packs produce embeddings in the same space."""
+    name, other = float_pack_name(name), float_pack_name(other)
+    return RECOGNITION_MODELS.get(name, name) == RECOGNITION_MODELS.get(other, other)
+
+def get_session_config(task):
+    """
+    Resolve the ONNX Runtime session settings for one model task.
+
+    Args:
+        task: InsightFace task name, e.g. 'detection' or 'recognition'.
+
+    Returns:
+        Dict of SESSION_DEFAULTS keys with the task's overrides applied.
+    """
+    config = dict(SESSION_DEFAULTS)
+    config.update(SESSION_OVERRIDES.get(task, {}))
+    if os.environ.get(THREADS_ENV):
+        config['intra_op_num_threads'] = int(os.environ[THREADS_ENV])
+    if config['intra_op_num_threads'] is None:
+        config['intra_op_num_threads'] = max(1, (os.cpu_count() or 1) // CONCURRENT_SESSIONS)
+    return config
+
+def configure_sessions(task=None, **options):
+    """
+    Change the ONNX Runtime session settings used for models built from now on.
+
+    Apps that are already loaded keep their sessions; a different setting
+    gives a new configuration key, so the next get_face_app builds a new app.
+
+    Args:
+        task: Task to configure ('detection', 'recognition'), or None for all tasks.
+        **options: SESSION_DEFAULTS keys and their new values.
+    """
+    unknown = set(options) - set(SESSION_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown session options: {', '.join(sorted(unknown))}")
+    with _lock:
+        if task is None:
+            SESSION_DEFAULTS.update(options)
+        else:
+            SESSION_OVERRIDES.setdefault(task, {}).update(options)
+
+def _session_options(config):
+    """Build onnxruntime.SessionOptions from a resolved session config."""
+    import onnxruntime
+
+    execution_modes = {
+        'sequential': onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+        'parallel': onnxruntime.ExecutionMode.ORT_PARALLEL,
+    }
+    optimization_levels = {
+        'disable': onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        'basic': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        'extended': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        'all': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = config['intra_op_num_threads']
+    options.inter_op_num_threads = config['inter_op_num_threads']
+    options.execution_mode = execution_modes[config['execution_mode']]
+    options.graph_optimization_level = optimization_levels[config['graph_optimization_level']]
+    options.enable_cpu_mem_arena = config['enable_cpu_mem_arena']
+    options.enable_mem_pattern = config['enable_mem_pattern']
+    options.add_session_config_entry('session.intra_op.allow_spinning',
+                                     '1' if config['allow_spinning'] else '0')
+    return options
+
+def _model_task(model_file):
+    """
+    Tell which task an InsightFace model file serves without opening a session.
+
+    Follows the routing of insightface's model_zoo.ModelRouter and the task
+    names of its model classes, reading the input shape and the outputs from
+    the ONNX graph.
+
+    Returns:
+        Task name, e.g. 'detection' or 'recognition', or None for files
+        FaceAnalysis cannot use.
+    """
+    import onnx
+
+    graph = onnx.load(model_file).graph
+    initializers = {tensor.name for tensor in graph.initializer}
+    inputs = [value for value in graph.input if value.name not in initializers]
+    shape = [dim.dim_value for dim in inputs[0].type.tensor_type.shape.dim]
+    outputs = [dim.dim_value for dim in graph.output[0].type.tensor_type.shape.dim]
+    if len(graph.output) >= 5:
+        return 'detection'
+    if shape[2] == 192 and shape[3] == 192:
+        return 'landmark_3d_68' if outputs[1] == 3309 else f'landmark_2d_{outputs[1] // 2}'
+    if shape[2] == 96 and shape[3] == 96:
+        return 'genderage' if outputs[1] == 3 else f'attribute_{outputs[1]}'
+    if len(inputs) == 2 and shape[2] == 128 and shape[3] == 128:
+        # Face swapper; not a FaceAnalysis module
+        return None
+    if shape[2] == shape[3] and shape[2] >= 112 and shape[2] % 16 == 0:
+        return 'recognition'
+    return None
+
+def _load_app(name, allowed_modules, providers):
+    """
+    Build a FaceAnalysis app whose models each open one session.
+
+    FaceAnalysis cannot pass SessionOptions to onnxruntime, and it opens a
+    session for every model in the pack, even the ones allowed_modules then
+    drops. Here each file's task is read from its graph first, so dropped
+    models are never loaded and the others are built once with their task's
+    options. The models are then handed to a FaceAnalysis, whose prepare and
+    get only use its models and det_model.
+    """
+    import glob
+    import onnxruntime
+    from insightface.app import FaceAnalysis
+    from insightface.model_zoo.model_zoo import ModelRouter
+    from insightface.utils import ensure_available
+
+    onnxruntime.set_default_logger_severity(3)
+    model_dir = ensure_available('models', name, root=model_root())
+    models = {}
+    for model_file in sorted(glob.glob(os.path.join(model_dir, '*.onnx'))):
+        task = _model_task(model_file)
+        if task is None or task in models or (allowed_modules and task not in allowed_modules):
+            continue
+        models[task] = ModelRouter(model_file).get_model(
+            sess_options=_session_options(get_session_config(task)), providers=list(providers))
+    if 'detection' not in models:
+        raise FileNotFoundError(f"No detection model in {model_dir}")
+
+    app = FaceAnalysis.__new__(FaceAnalysis)
+    app.model_dir = model_dir
+    app.models = models
+    app.det_model = models['detection']
+    return app
+
+def _warm_up(app, runs=WARMUP_RUNS):
+    """
+    Run each model on synthetic input so the first real frame is not slow.
+
+    The first run pays for memory arena growth and kernel selection; it is
+    timed as the cold latency and the median of the following runs as the
+    warm latency. Detection sees a blank frame at the detector input size;
+    recognition sees one blank aligned crop.
+
+    Returns:
+        Dict of task -> {'cold_ms', 'warm_ms'}.
+    """
+    import numpy as np
+
+    def measure(run):
+        timings = []
+        for _ in range(runs + 1):
+            start = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - start) * 1000)
+        return {'cold_ms': timings[0], 'warm_ms': float(np.median(timings[1:]))}
+
+    latency = {}
+    width, height = app.det_model.input_size
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    latency['detection'] = measure(lambda: app.det_model.detect(frame, max_num=0, metric='default'))
+
+    recognition_model = app.models.get('recognition')
+    if recognition_model is not None:
+        size = recognition_model.input_size[0]
+        crop = np.zeros((size, size, 3), dtype=np.uint8)
+        latency['recognition'] = measure(lambda: recognition_model.get_feat([crop]))
+    return latency
+
+def _config_key(name, allowed_modules, det_size, providers, ctx_id):
+    """Build a hashable key that identifies one model configuration."""
+    modules = tuple(sorted(allowed_modules)) if allowed_modules else None
+    sessions = tuple((task, tuple(sorted(get_session_config(task).items())))
+                     for task in sorted(modules or SESSION_OVERRIDES))
+    return (name, modules, tuple(det_size), tuple(providers), ctx_id, sessions)
+
+def get_face_app(name=None, allowed_modules=None, det_size=None,
+                 providers=DEFAULT_PROVIDERS, ctx_id=0, profile=None, warmup=True):
+    """
+    Get a prepared InsightFace FaceAnalysis app, loading it on first use.
+
+    Each configuration is built and prepared once per process; later calls
+    with the same configuration return the same instance. Settings that are
+    not given come from the inference profile, and every model session gets
+    the options from get_session_config.
+
+    Args:
+        name: InsightFace model pack name.
+        allowed_modules: Model modules to load.
+        det_size: Detector input size as (width, height).
+        providers: ONNX Runtime execution providers.
+        ctx_id: Device id passed to FaceAnalysis.prepare.
+        profile: Inference profile name. Defaults to the active profile.
+        warmup: Run each model on synthetic input after loading and record
+            its cold and warm latency.
+
+    Returns:
+        Prepared FaceAnalysis instance.
+    """
+    settings = get_profile(profile)
+    name = name or settings['name']
+    allowed_modules = allowed_modules or settings['allowed_modules']
+    det_size = det_size or settings['det_size']
+    key = _config_key(name, allowed_modules, det_size, providers, ctx_id)
+
+    app = _models.get(key)
+    if app is not None:
+        return app
+
+    with _lock:
+        # Another thread may have finished loading while we waited
+        app = _models.get(key)
+        if app is not None:
+            return app
+
+        # ensure_available would try to download an INT8 pack that was never built
+        if name.endswith(QUANTIZED_SUFFIX) and get_model_version(name) == 'missing':
+            raise FileNotFoundError(f"Quantized model pack {name} not found in {model_root()}; "
+                                    f"build it with python quantize_models.py quantize")
+
+        memory_before = _memory_usage_mb()
+        start_time = time.perf_counter()
+
+        app = _load_app(name, allowed_modules, providers)
+        app.prepare(ctx_id=ctx_id, det_size=tuple(det_size))
+
+        load_time = time.perf_counter() - start_time
+        latency = _warm_up(app) if warmup else {}
+        memory_after = _memory_usage_mb()
+        memory_delta = None
+        if memory_before is not None and memory_after is not None:
+            memory_delta = memory_after - memory_before
+
+        _models[key] = app
+        _model_stats[key] = {
+            'name': name,
+            'allowed_modules': list(allowed_modules) if allowed_modules else None,
+            'det_size': tuple(det_size),
+            'sessions': {task: dict(config) for task, config in key[5]},
+            'load_time': load_time,
+            'latency': latency,
+            'memory_mb': memory_delta,
+            'rss_mb': memory_after,
+        }
+
+        if memory_delta is not None:
+            logger.info(f"Loaded face model {name} {key[1]} in {load_time:.2f}s "
+                        f"(+{memory_delta:.1f} MB, RSS {memory_after:.1f} MB)")
+        else:
+            logger.info(f"Loaded face model {name} {key[1]} in {load_time:.2f}s")
+        for task, timings in latency.items():
+            logger.info(f"Warmed up {task}: cold {timings['cold_ms']:.1f} ms, "
+                        f"warm {timings['warm_ms']:.1f} ms")
+
+        return app
+
+def detect_faces(frame, app=None, max_num=0):
+    """
+    Run only the detector on a frame.
+
+    Args:
+        frame: BGR image as a numpy array.
+        app: FaceAnalysis instance to use. Defaults to the shared default app.
+        max_num: Maximum number of faces to return (0 for all).
+
+    Returns:
+        List of insightface Face objects with bbox, kps and det_score but no embedding.
+    """
+    from insightface.app.common import Face
+
+    if app is None:
+        app = get_face_app()
+    bboxes, kpss = app.det_model.detect(frame, max_num=max_num, metric='default')
+    faces = []
+    for i in range(bboxes.shape[0]):
+        kps = kpss[i] if kpss is not None else None
+        faces.append(Face(bbox=bboxes[i, 0:4], kps=kps, det_score=bboxes[i, 4]))
+    return faces
+
+def embed_faces(frame, faces, app=None):
+    """
+    Compute the ArcFace embedding for faces returned by detect_faces.
+
+    Args:
+        frame: BGR image the faces were detected in.
+        faces: Face objects to embed; each gets its embedding attribute set.
+        app: FaceAnalysis instance to use. Defaults to the shared default app.
+
+    Returns:
+        The same list of faces.
+    """
+    embed_batch([(frame, faces)], app)
+    return faces
+
+def _max_batch_size(recognition_model, batch_size):
+    """Largest batch the recognition model accepts, capped at batch_size."""
+    batch_dim = recognition_model.input_shape[0]
+    # ONNX reports a dynamic batch dimension as a name or None
+    if isinstance(batch_dim, int) and batch_dim > 0:
+        return min(batch_dim, batch_size)
+    return batch_size
+
+def embed_batch(items, app=None, batch_size=EMBED_BATCH_SIZE):
+    """
+    Embed the faces of several frames, e.g. from several cameras, together.
+
+    Every face is aligned to the recognition model's input size, the crops
+    are stacked and the model runs once per batch_size crops instead of once
+    per face. The embeddings are written back to their Face objects.
+
+    Args:
+        items: Sequence of (frame, faces) pairs; frame is the BGR image the
+            faces were detected in.
+        app: FaceAnalysis instance to use. Defaults to the shared default app.
+        batch_size: Maximum number of faces per model run.
+
+    Returns:
+        Number of faces embedded.
+    """
+    from insightface.utils import face_align
+
+    if app is None:
+        app = get_face_app()
+    recognition_model = app.models['recognition']
+    size = recognition_model.input_size[0]
+
+    crops = []
+    targets = []
+    for frame, faces in items:
+        for face in faces:
+            crops.append(face_align.norm_crop(frame, landmark=face.kps, image_size=size))
+            targets.append(face)
+
+    step = _max_batch_size(recognition_model, batch_size)
+    for start in range(0, len(crops), step):
+        features = recognition_model.get_feat(crops[start:start + step])
+        for face, feature in zip(targets[start:start + step], features):
+            face.embedding = feature.flatten()
+    return len(crops)
+
+def benchmark_embedding(n_faces=64, batch_sizes=(1, 8, 32), repeats=3, app=None):
+    """
+    Compare per-face and batched recognition throughput on CPU.
+
+    Random aligned crops are used, since alignment costs the same on both
+    paths; the per-face path calls the model once per crop, as
+    FaceAnalysis.get does.
+
+    Args:
+        n_faces: Number of crops per run.
+        batch_sizes: Batch sizes to measure for the batched path.
+        repeats: Runs per configuration; the fastest is reported.
+        app: FaceAnalysis instance to use. Defaults to the shared default app.
+
+    Returns:
+        List of dicts with mode, batch_size, faces_per_second and ms_per_face.
+    """
+    import numpy as np
+
+    if app is None:
+        app = get_face_app()
+    recognition_model = app.models['recognition']
+    size = recognition_model.input_size[0]
+    rng = np.random.default_rng(0)
+    crops = [rng.integers(0, 256, (size, size, 3), dtype=np.uint8) for _ in range(n_faces)]
+
+    # Warm up the session so the first run does not include allocation
+    recognition_model.get_feat(crops[:1])
+
+    def measure(step):
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for i in range(0, n_faces, step):
+                recognition_model.get_feat(crops[i:i + step])
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    results = []
+    runs = [('per-face', 1)] + [('batched', batch) for batch in batch_sizes if batch > 1]
+    for mode, batch in runs:
+        step = _max_batch_size(recognition_model, batch)
+        elapsed = measure(step)
+        results.append({
+            'mode': mode,
+            'batch_size': step,
+            'faces_per_second': n_faces / elapsed,
+            'ms_per_face': elapsed * 1000 / n_faces,
+        })
+    return results
+
+def get_model_version(name=None, root=None):
+    """
+    Fingerprint the installed files of an InsightFace model pack.
+
+    The fingerprint changes whenever a model file is added, removed or
+    replaced, so it can be used to invalidate anything derived from the
+    pack's output.
+
+    Args:
+        name: InsightFace model pack name. Defaults to the active profile's pack.
+        root: InsightFace home directory. Defaults to $INSIGHTFACE_HOME or ~/.insightface.
+
+    Returns:
+        Short hex string, or 'missing' if the pack is not installed.
+    """
+    import hashlib
+
+    name = name or get_profile()['name']
+    root = root or model_root()
+    model_dir = os.path.join(root, 'models', name)
+    if not os.path.isdir(model_dir):
+        return 'missing'
+
+    digest = hashlib.sha1()
+    for filename in sorted(os.listdir(model_dir)):
+        if not filename.endswith('.onnx'):
+            continue
+        stat = os.stat(os.path.join(model_dir, filename))
+        digest.update(f"{filename}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:12]
+
+def get_model_stats():
+    """
+    Get load statistics for every model configuration built in this process.
+
+    Returns:
+        List of dicts with name, allowed_modules, det_size, sessions (session
+        settings per task), load_time (seconds), latency (task -> cold_ms and
+        warm_ms from the warmup), memory_mb (RSS growth caused by the load)
+        and rss_mb (RSS after the load).
+    """
+    return [dict(stats) for stats in _model_stats.values()]
+
+def clear_models():
+    """Drop all cached model instances so they are rebuilt on next use."""
+    with _lock:
+        _models.clear()
+        _model_stats.clear()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        n_faces = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+        print(f"Recognition throughput over {n_faces} faces ({get_profile()['name']}, CPU):")
+        results = benchmark_embedding(n_faces)
+        baseline = results[0]['faces_per_second']
+        for result in results:
+            print(f"  {result['mode']:<9} batch {result['batch_size']:>3}: "
+                  f"{result['faces_per_second']:8.1f} faces/s  {result['ms_per_face']:6.2f} ms/face  "
+                  f"x{result['faces_per_second'] / baseline:.2f}")
+    else:
+        get_face_app()
+        get_face_app()
+        for stats in get_model_stats():
+            print(stats)
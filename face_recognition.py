@@ -1,24 +1,28 @@
 import os
-import pickle
 import numpy as np
-import cv2
 import sqlite3
 import logging
+import threading
+import time
 from datetime import datetime
 import sys
-from insightface.app import FaceAnalysis
 
 # Add the current directory to the path so we can import from the root
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from face_models import get_face_app, get_profile, embeddings_compatible
+from face_gallery import FaceGallery, DEFAULT_MATCH_THRESHOLD
+from migrate_db import ATTENDANCE_UPSERT_SQL
+from db import get_connection
+from model_registry import current_model, manifest_stamp, list_versions
+from model_artifact import load_model
+from embedding_cache import get_insightface_cache, content_hash
+from image_io import load_image, is_path, describe_image
+
 # Create necessary directories
 os.makedirs("models", exist_ok=True)
 os.makedirs("known_faces", exist_ok=True)
 
-# Initialize InsightFace app
-app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'])
-app.prepare(ctx_id=0)
-
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -30,28 +34,92 @@ logging.basicConfig(
 )
 logger = logging.getLogger("FaceRecognition")
 
+# Recognition engines supported by FaceRecognizer
+ENGINE_CLASSIFIER = 'classifier'
+ENGINE_GALLERY = 'gallery'
+
+# Seconds between checks of the model manifest by start_model_watch()
+MODEL_WATCH_INTERVAL = 2.0
+
+def ranked_result(ids, scores, k, threshold):
+    """
+    Turn one face's ranked identities and scores into a recognize_topk result.
+
+    Args:
+        ids: User IDs ranked best first, as in one row of FaceGallery.topk.
+        scores: Scores aligned with ids.
+        k: Number of candidates to keep.
+        threshold: Minimum best score to accept the match.
+
+    Returns:
+        Dict with user_id (None below the threshold), confidence, margin and
+        candidates, a list of up to k (user_id, score) pairs.
+    """
+    result = {'user_id': None, 'confidence': 0.0, 'margin': 0.0, 'candidates': []}
+    if not ids:
+        return result
+    best = float(scores[0])
+    result['confidence'] = best
+    result['margin'] = best - float(scores[1]) if len(ids) > 1 else best
+    result['candidates'] = [(user_id, float(score)) for user_id, score in zip(ids[:k], scores)]
+    if best >= threshold:
+        result['user_id'] = ids[0]
+    return result
+
 class FaceRecognizer:
-    def __init__(self, model_path=None, confidence_threshold=0.6):
+    def __init__(self, model_path=None, confidence_threshold=None, engine=ENGINE_CLASSIFIER):
         """
         Initialize the face recognizer.
         
         Args:
-            model_path: Path to the trained model file. If None, will try to find the latest model.
-            confidence_threshold: Minimum confidence score to consider a match.
+            model_path: Path to the trained model artifact (or legacy .pkl). If None, the
+                current version in the model manifest is used.
+            confidence_threshold: Minimum confidence score to consider a match. Defaults to 0.6
+                for the classifier engine and to the gallery's cosine threshold for the gallery engine.
+            engine: 'classifier' to use the trained sklearn model, or 'gallery' to match
+                embeddings directly against the enrolled users by cosine similarity.
         """
+        if engine not in (ENGINE_CLASSIFIER, ENGINE_GALLERY):
+            raise ValueError(f"Unknown recognition engine: {engine}")
+            
+        if confidence_threshold is None:
+            confidence_threshold = DEFAULT_MATCH_THRESHOLD if engine == ENGINE_GALLERY else 0.6
+            
+        self.engine = engine
         self.confidence_threshold = confidence_threshold
         self.classifier = None
+        self.gallery = None
         self.user_ids = []
         self.user_names = {}
         
-        # Load the model
-        if model_path is None:
-            model_path = self._find_latest_model()
-            
-        if model_path and os.path.exists(model_path):
-            self._load_model(model_path)
+        # Enrollment changes made since the classifier was trained: new users are
+        # matched by cosine similarity, deleted users are masked out of its output
+        self.pending = FaceGallery()
+        self.removed_ids = set()
+        
+        # Model hot reload: a watcher thread stages a newly published model and
+        # the recognition thread swaps it in between frames
+        self.model_version = None
+        self._staged_model = None
+        self._staged_lock = threading.Lock()
+        self._watch_thread = None
+        self._watch_stop = threading.Event()
+        self._manifest_stamp = manifest_stamp()
+        
+        if engine == ENGINE_GALLERY:
+            # The gallery is built straight from the enrolled encodings
+            self.gallery = FaceGallery(threshold=confidence_threshold)
+            self.gallery.load_from_db()
         else:
-            logger.warning("No model found. Please train a model first.")
+            # Load the model
+            if model_path is None:
+                self.model_version, model_path = current_model()
+                
+            if model_path and os.path.exists(model_path):
+                self._load_model(model_path)
+                self._check_face_model(self.model_version)
+            else:
+                logger.warning("No model found. Please train a model first.")
             
         # Load user information
         self._load_user_info()
@@ -60,27 +128,179 @@ class FaceRecognizer:
         # Verify model and database consistency
         self._verify_model_database_consistency()
     
-    def _find_latest_model(self):
-        """Find the latest trained model in the models directory."""
-        models_dir = "models"
-        if not os.path.exists(models_dir):
-            logger.warning(f"Models directory '{models_dir}' not found.")
-            return None
+    def is_ready(self):
+        """Return True if the selected engine can recognize faces."""
+        if self.engine == ENGINE_GALLERY:
+            return self.gallery is not None and len(self.gallery) > 0
+        return self.classifier is not None or len(self.pending) > 0
+    
+    def add_identity(self, user_id, user_name=None, db_path="attendance.db"):
+        """
+        Enroll or re-enroll one user in the running recognizer without retraining.
+        
+        The user is matched against the centroid of their enrollment samples,
+        so call this after the new sample has been committed to the database.
+        
+        Args:
+            user_id: ID of the user.
+            user_name: Display name. Keeps the current name if None.
+            db_path: Path to the SQLite database.
+        """
+        if user_name is not None:
+            self.user_names[user_id] = user_name
+        if user_id not in self.user_ids:
+            self.user_ids.append(user_id)
             
-        # Look for both old and new model filename patterns
-        model_files = [f for f in os.listdir(models_dir) 
-                      if (f.startswith("face_classifier_") or f.startswith("face_recognition_")) 
-                      and f.endswith(".pkl")]
+        if self.engine == ENGINE_GALLERY:
+            self.gallery.add(user_id, db_path)
+        else:
+            # The classifier's embedding for this user is stale either way
+            self.pending.add(user_id, db_path)
+            self.removed_ids.discard(user_id)
+    
+    def remove_identity(self, user_id):
+        """
+        Remove one user from the running recognizer without retraining.
         
-        if not model_files:
-            logger.warning("No model files found.")
-            return None
+        Args:
+            user_id: ID of the user.
+        """
+        self.user_names.pop(user_id, None)
+        if user_id in self.user_ids:
+            self.user_ids.remove(user_id)
+            
+        if self.engine == ENGINE_GALLERY:
+            self.gallery.remove(user_id)
+        else:
+            self.pending.remove(user_id)
+            if self.classifier is not None and user_id in getattr(self.classifier, 'classes_', ()):
+                self.removed_ids.add(user_id)
+        logger.info(f"Removed user {user_id} from the recognizer")
+    
+    def _score_topk(self, encodings, k):
+        """
+        Score a batch of face embeddings once and rank the identities for each.
+        
+        For the classifier engine, users deleted since training are never
+        reported and a confident cosine match against a user enrolled since
+        training takes precedence over the classifier.
+        
+        Args:
+            encodings: Array of shape (n, dim).
+            k: Number of candidate identities to keep per face.
             
-        # Sort by modification time (newest first)
-        model_files.sort(key=lambda x: os.path.getmtime(os.path.join(models_dir, x)), reverse=True)
-        latest_model = os.path.join(models_dir, model_files[0])
-        logger.info(f"Found latest model: {latest_model}")
-        return latest_model
+        Returns:
+            List of n dicts with user_id (None when confidence is below the
+            threshold), confidence, margin to the runner-up and candidates, a
+            list of up to k (user_id, score) tuples, best first.
+        """
+        if self.engine == ENGINE_GALLERY:
+            ids, scores = self.gallery.topk(encodings, k=max(k, 2))
+            return [ranked_result(row_ids, row_scores, k, self.confidence_threshold)
+                    for row_ids, row_scores in zip(ids, scores)]
+            
+        # Pick up a newly published model between frames
+        self.swap_in_new_model()
+        
+        results = [{'user_id': None, 'confidence': 0.0, 'margin': 0.0, 'candidates': []}
+                   for _ in range(len(encodings))]
+        if self.classifier is not None:
+            # Labels and probabilities for all faces in one scoring pass
+            predictions, probabilities = self.classifier.predict_scores(encodings)
+            classes = self.classifier.classes_
+            ranking = np.argsort(-probabilities, axis=1, kind='stable')
+            for result, user_id, probs, order in zip(results, predictions, probabilities, ranking):
+                candidates = [(classes[j], float(probs[j])) for j in order
+                              if classes[j] not in self.removed_ids][:max(k, 2)]
+                confidence = float(probs.max())
+                result['confidence'] = confidence
+                if len(candidates) > 1:
+                    result['margin'] = candidates[0][1] - candidates[1][1]
+                elif candidates:
+                    result['margin'] = candidates[0][1]
+                result['candidates'] = candidates[:k]
+                if confidence >= self.confidence_threshold and user_id not in self.removed_ids:
+                    result['user_id'] = user_id
+                    
+        if len(self.pending):
+            # The classifier has never seen these users, so a confident
+            # cosine match against them takes precedence
+            ids, scores = self.pending.topk(encodings, k=2)
+            for result, row_ids, row_scores in zip(results, ids, scores):
+                match = ranked_result(row_ids, row_scores, 1, self.pending.threshold)
+                if match['user_id'] is None:
+                    continue
+                others = [c for c in result['candidates'] if c[0] != match['user_id']]
+                match['candidates'] = (match['candidates'] + others)[:k]
+                result.update(match)
+        return results
+    
+    def recognize_topk(self, frame_or_faces, k=3, max_faces=10):
+        """
+        Recognize every face and rank the k best identities for each.
+        
+        All faces are scored in one vectorized pass; thresholding, debug
+        display and attendance should consume this result instead of
+        scoring again.
+        
+        Args:
+            frame_or_faces: A BGR frame (faces are detected and embedded), a list
+                of insightface Face objects with embeddings, or an array of
+                embeddings of shape (n, dim) or (dim,).
+            k: Number of candidate identities to return per face.
+            max_faces: Maximum number of faces to take from a frame.
+            
+        Returns:
+            List of dicts, one per face, with bbox (None for bare embeddings),
+            user_id and user_name of the accepted match (None below the
+            threshold), confidence, margin to the runner-up, and candidates:
+            up to k (user_id, user_name, score) tuples, best first.
+        """
+        if not self.is_ready():
+            logger.error("No model loaded. Please train a model first.")
+            return []
+            
+        bboxes = None
+        if isinstance(frame_or_faces, np.ndarray) and frame_or_faces.ndim == 3:
+            frame_or_faces = get_face_app().get(frame_or_faces)[:max_faces]
+        if isinstance(frame_or_faces, np.ndarray):
+            encodings = frame_or_faces
+        else:
+            if not frame_or_faces:
+                return []
+            encodings = np.stack([face.embedding for face in frame_or_faces])
+            bboxes = [face.bbox for face in frame_or_faces]
+            
+        encodings = np.asarray(encodings, dtype=np.float32)
+        if encodings.ndim == 1:
+            encodings = encodings.reshape(1, -1)
+        if len(encodings) == 0:
+            return []
+            
+        results = self._score_topk(encodings, k)
+        for i, result in enumerate(results):
+            result['bbox'] = bboxes[i] if bboxes is not None else None
+            user_id = result['user_id']
+            result['user_name'] = self.user_names.get(user_id, "Unknown") if user_id is not None else None
+            result['candidates'] = [(candidate_id, self.user_names.get(candidate_id, "Unknown"), score)
+                                    for candidate_id, score in result['candidates']]
+        return results
+    
+    def _check_face_model(self, version):
+        """Warn if a model version was trained on embeddings from another model pack."""
+        entry = next((entry for entry in list_versions() if entry['version'] == version), None)
+        trained_with = entry.get('face_model') if entry else None
+        active = get_profile()['name']
+        if trained_with and not embeddings_compatible(trained_with, active):
+            logger.warning(f"Model version {version} was trained on {trained_with} embeddings but the "
+                           f"inference profile uses {active}; re-enroll and retrain before relying on it")
+            return False
+        return True
+    
+    def _read_model_file(self, model_path):
+        """Load a classifier from a model artifact, converting a legacy pickle on first use."""
+        classifier, _ = load_model(model_path)
+        return classifier
     
     def _load_model(self, model_path):
         """Load the trained model from file."""
@@ -89,8 +309,7 @@ class FaceRecognizer:
                 logger.error(f"Model file not found: {model_path}")
                 return False
                 
-            with open(model_path, 'rb') as f:
-                self.classifier = pickle.load(f)
+            self.classifier = self._read_model_file(model_path)
                 
             logger.info(f"Model loaded from {model_path}")
             
@@ -112,14 +331,12 @@ class FaceRecognizer:
                 logger.error("Database file 'attendance.db' not found.")
                 return False
                 
-            conn = sqlite3.connect("attendance.db")
-            cursor = conn.cursor()
+            cursor = get_connection().cursor()
             
             # Check if users table exists
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
             if not cursor.fetchone():
                 logger.error("Users table not found in database.")
-                conn.close()
                 return False
                 
             cursor.execute("SELECT user_id, name FROM users")
@@ -134,7 +351,6 @@ class FaceRecognizer:
                 self.user_names = {user[0]: user[1] for user in users}
                 logger.info(f"Loaded information for {len(self.user_ids)} users")
             
-            conn.close()
             return True
         except Exception as e:
             logger.error(f"Error loading user information: {str(e)}")
@@ -142,45 +358,57 @@ class FaceRecognizer:
             logger.error(f"Traceback: {traceback.format_exc()}")
             return False
     
-    def extract_face_encoding(self, image_path):
+    def extract_face_encoding(self, image):
         """
-        Extract face encoding from an image file.
+        Extract face encoding from an image.
         
         Args:
-            image_path: Path to the image file.
+            image: BGR frame, encoded image bytes or path to an image file.
             
         Returns:
             Face encoding as numpy array or None if no face detected.
         """
         try:
+            label = describe_image(image)
             # Check if file exists
-            if not os.path.exists(image_path):
-                logger.error(f"Image file not found: {image_path}")
+            if is_path(image) and not os.path.exists(image):
+                logger.error(f"Image file not found: {label}")
                 return None
+
+            # Reuse the embedding if this exact image was encoded by the current model
+            cache = get_insightface_cache()
+            image_hash = content_hash(image)
+            hit, embedding, _ = cache.get(image_hash)
+            if hit:
+                if embedding is None:
+                    logger.warning(f"No face detected in image: {label}")
+                return embedding
                 
-            img = cv2.imread(image_path)
+            img = load_image(image)
             if img is None:
-                logger.error(f"Failed to load image: {image_path}")
+                logger.error(f"Failed to load image: {label}")
                 return None
                 
             # Check if image is empty
             if img.size == 0:
-                logger.error(f"Image is empty: {image_path}")
+                logger.error(f"Image is empty: {label}")
                 return None
                 
             # Get face embeddings
-            faces = app.get(img)
+            faces = get_face_app().get(img)
             if not faces:
-                logger.warning(f"No face detected in image: {image_path}")
+                logger.warning(f"No face detected in image: {label}")
+                cache.put(image_hash, None)
                 return None
                 
             # Check if embedding is valid
             embedding = faces[0].embedding
             if embedding is None or embedding.shape[0] == 0:
-                logger.error(f"Invalid face embedding extracted from: {image_path}")
+                logger.error(f"Invalid face embedding extracted from: {label}")
                 return None
-                
-            logger.info(f"Successfully extracted face encoding from: {image_path}")
+
+            cache.put(image_hash, embedding, faces[0].det_score)
+            logger.info(f"Successfully extracted face encoding from: {label}")
             return embedding
             
         except Exception as e:
@@ -189,66 +417,43 @@ class FaceRecognizer:
             logger.error(f"Traceback: {traceback.format_exc()}")
             return None
     
-    def recognize_faces(self, image_path, max_faces=10):
+    def recognize_faces(self, image, max_faces=10):
         """
         Recognize multiple faces in an image.
         
         Args:
-            image_path: Path to the image file.
+            image: BGR frame, encoded image bytes or path to an image file.
             max_faces: Maximum number of faces to detect.
             
         Returns:
             List of tuples (user_id, user_name, confidence) for each recognized face.
         """
-        if self.classifier is None:
+        if not self.is_ready():
             logger.error("No model loaded. Please train a model first.")
             return []
             
         try:
-            # Read image
-            img = cv2.imread(image_path)
+            # Decode the image unless it is already a frame
+            img = load_image(image)
             if img is None:
-                logger.warning(f"Failed to load image: {image_path}")
+                logger.warning(f"Failed to load image: {describe_image(image)}")
                 return []
                 
-            # Detect faces
-            faces = app.get(img)
-            if not faces:
-                logger.warning(f"No faces detected in image: {image_path}")
+            # Detect faces and score them all in one pass
+            matches = self.recognize_topk(img, k=1, max_faces=max_faces)
+            if not matches:
+                logger.warning(f"No faces detected in image: {describe_image(image)}")
                 return []
-                
-            # Limit to max_faces
-            faces = faces[:max_faces]
             
             results = []
-            for face in faces:
-                # Get face encoding
-                face_encoding = face.embedding
-                
-                # Reshape for prediction
-                face_encoding = face_encoding.reshape(1, -1)
-                
-                # Predict user ID
-                user_id = self.classifier.predict(face_encoding)[0]
-                
-                # Get confidence score
-                if hasattr(self.classifier, 'predict_proba'):
-                    confidence = self.classifier.predict_proba(face_encoding).max()
-                else:
-                    # For KNN, we can't get probability directly
-                    # Use a simple distance-based approach
-                    distances = self.classifier.kneighbors(face_encoding, return_distance=True)[0][0]
-                    confidence = 1.0 / (1.0 + distances[0])  # Convert distance to confidence
-                    
+            for match in matches:
+                user_id, user_name, confidence = match['user_id'], match['user_name'], match['confidence']
                 # Check if confidence meets threshold
-                if confidence < self.confidence_threshold:
+                if user_id is None:
                     logger.info(f"Face recognized but confidence ({confidence:.2f}) below threshold ({self.confidence_threshold})")
                     results.append((None, None, confidence))
                     continue
                     
-                # Get user name
-                user_name = self.user_names.get(user_id, "Unknown")
-                
                 logger.info(f"Face recognized as {user_name} (ID: {user_id}) with confidence {confidence:.2f}")
                 results.append((user_id, user_name, confidence))
                 
@@ -258,17 +463,17 @@ class FaceRecognizer:
             logger.error(f"Error recognizing faces: {str(e)}")
             return []
     
-    def recognize_face(self, image_path):
+    def recognize_face(self, image):
         """
         Recognize a face in the given image (maintained for backward compatibility).
         
         Args:
-            image_path: Path to the image file.
+            image: BGR frame, encoded image bytes or path to an image file.
             
         Returns:
             Tuple of (user_id, user_name, confidence) if recognized, (None, None, 0) otherwise.
         """
-        results = self.recognize_faces(image_path, max_faces=1)
+        results = self.recognize_faces(image, max_faces=1)
         if results:
             return results[0]
         return None, None, 0
@@ -283,87 +488,208 @@ class FaceRecognizer:
         Returns:
             Tuple of (user_id, user_name, confidence) if recognized, (None, None, 0) otherwise.
         """
-        if self.classifier is None:
+        if not self.is_ready():
             logger.error("No model loaded. Please train a model first.")
             return None, None, 0
             
         try:
-            # Extract face encoding directly from frame
-            faces = app.get(frame)
-            if not faces:
+            # Detect and score the first face in the frame
+            matches = self.recognize_topk(frame, k=1, max_faces=1)
+            if not matches:
                 return None, None, 0
                 
-            face_encoding = faces[0].embedding
-            
-            # Reshape for prediction
-            face_encoding = face_encoding.reshape(1, -1)
-            
-            # Predict user ID
-            user_id = self.classifier.predict(face_encoding)[0]
-            
-            # Get confidence score
-            if hasattr(self.classifier, 'predict_proba'):
-                confidence = self.classifier.predict_proba(face_encoding).max()
-            else:
-                # For KNN, we can't get probability directly
-                # Use a simple distance-based approach
-                distances = self.classifier.kneighbors(face_encoding, return_distance=True)[0][0]
-                confidence = 1.0 / (1.0 + distances[0])  # Convert distance to confidence
-                
-            # Check if confidence meets threshold
-            if confidence < self.confidence_threshold:
-                return None, None, confidence
-                
-            # Get user name
-            user_name = self.user_names.get(user_id, "Unknown")
-            
-            return user_id, user_name, confidence
+            match = matches[0]
+            return match['user_id'], match['user_name'], match['confidence']
             
         except Exception as e:
             logger.error(f"Error recognizing face from frame: {str(e)}")
             return None, None, 0
     
     def _verify_model_database_consistency(self):
-        """Verify that the model's user IDs match the database."""
-        if self.classifier is None:
-            return
+        """
+        Reconcile the classifier with users added or deleted since it was trained.
+        
+        Deleted users are masked out of the classifier's predictions and users
+        enrolled after training are matched by their stored encodings, so the
+        model does not have to be retrained before it can be used.
+        """
+        self.pending, self.removed_ids = self._build_enrollment_overlay(self.classifier, self.user_ids)
+    
+    def _build_enrollment_overlay(self, classifier, user_ids):
+        """
+        Work out which users a classifier is missing or has in excess.
+        
+        Returns:
+            Tuple (pending, removed_ids): a FaceGallery of users enrolled after
+            training and the set of trained user IDs no longer in the database.
+        """
+        pending = FaceGallery()
+        removed_ids = set()
+        if self.engine == ENGINE_GALLERY:
+            return pending, removed_ids
             
         try:
             # Get unique labels that the model knows about
-            if hasattr(self.classifier, 'classes_'):
-                model_user_ids = set(self.classifier.classes_)
-            else:
-                logger.warning("Classifier doesn't have classes_ attribute")
-                return
+            model_user_ids = set()
+            if classifier is not None:
+                if hasattr(classifier, 'classes_'):
+                    model_user_ids = set(classifier.classes_)
+                else:
+                    logger.warning("Classifier doesn't have classes_ attribute")
+                    return pending, removed_ids
                 
             # Get user IDs from database
-            db_user_ids = set(self.user_ids)
+            db_user_ids = set(user_ids)
             
             # Check for mismatches
             missing_in_db = model_user_ids - db_user_ids
             if missing_in_db:
                 logger.warning(f"Model contains user IDs not in database: {missing_in_db}")
-                logger.warning("Retraining model to ensure consistency...")
-                self._retrain_model()
+                logger.warning("Ignoring them until the model is retrained")
+                removed_ids = missing_in_db
+                
+            missing_in_model = db_user_ids - model_user_ids
+            if missing_in_model:
+                pending.load_from_db(exclude=model_user_ids)
+                logger.info(f"{len(pending)} users are not in the model yet; "
+                            "matching them by similarity until the model is retrained")
                 
         except Exception as e:
             logger.error(f"Error verifying model-database consistency: {e}")
+        return pending, removed_ids
     
-    def _retrain_model(self):
-        """Retrain the model using current database data."""
+    def start_model_watch(self, interval=MODEL_WATCH_INTERVAL):
+        """
+        Watch the model manifest and stage newly published models.
+        
+        The new model is loaded on a background thread; it replaces the current
+        one the next time faces are scored, so no frame waits for the load.
+        
+        Args:
+            interval: Seconds between manifest checks.
+        """
+        if self.engine == ENGINE_GALLERY:
+            return
+        if self._watch_thread is not None and self._watch_thread.is_alive():
+            return
+        self._watch_stop.clear()
+        self._watch_thread = threading.Thread(target=self._watch_models, args=(interval,),
+                                              name="model-watch", daemon=True)
+        self._watch_thread.start()
+        
+    def stop_model_watch(self):
+        """Stop watching the model manifest."""
+        self._watch_stop.set()
+        if self._watch_thread is not None:
+            self._watch_thread.join(timeout=5)
+            self._watch_thread = None
+    
+    def _watch_models(self, interval):
+        while not self._watch_stop.wait(interval):
+            stamp = manifest_stamp()
+            if stamp == self._manifest_stamp:
+                continue
+            self._manifest_stamp = stamp
+            
+            version, model_path = current_model()
+            if version is None or version == self.model_version or not model_path:
+                continue
+            self._stage_model(version, model_path)
+    
+    def _stage_model(self, version, model_path):
+        """Load a model and everything derived from it without touching the live state."""
+        try:
+            start = time.perf_counter()
+            classifier = self._read_model_file(model_path)
+            self._check_face_model(version)
+            users = get_connection().execute("SELECT user_id, name FROM users").fetchall()
+            user_ids = [user[0] for user in users]
+            pending, removed_ids = self._build_enrollment_overlay(classifier, user_ids)
+            
+            with self._staged_lock:
+                self._staged_model = {
+                    'version': version,
+                    'classifier': classifier,
+                    'user_ids': user_ids,
+                    'user_names': {user[0]: user[1] for user in users},
+                    'pending': pending,
+                    'removed_ids': removed_ids,
+                }
+            logger.info(f"Staged model version {version} from {model_path} "
+                        f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+        except Exception as e:
+            logger.error(f"Error staging model version {version}: {str(e)}")
+    
+    def swap_in_new_model(self):
+        """
+        Switch to a model staged by the watcher, if there is one.
+        
+        Called by the recognition thread between frames; the swap itself only
+        rebinds a few attributes.
+        
+        Returns:
+            True if a new model was swapped in, False otherwise.
+        """
+        if self._staged_model is None:
+            return False
+        with self._staged_lock:
+            staged, self._staged_model = self._staged_model, None
+        if staged is None:
+            return False
+            
+        self.classifier = staged['classifier']
+        self.user_ids = staged['user_ids']
+        self.user_names = staged['user_names']
+        self.pending = staged['pending']
+        self.removed_ids = staged['removed_ids']
+        self.model_version = staged['version']
+        logger.info(f"Switched to model version {staged['version']}")
+        return True
+    
+    def reload_model(self, model_path=None):
+        """
+        Reload the recognizer after a full retrain.
+        
+        Args:
+            model_path: Model to load. Defaults to the latest model in the models directory.
+            
+        Returns:
+            True if successful, False otherwise.
+        """
+        if self.engine == ENGINE_GALLERY:
+            loaded = self.gallery.load_from_db() and self._load_user_info()
+            return bool(loaded)
+            
+        version = None
+        if model_path is None:
+            version, model_path = current_model()
+        if not model_path or not self._load_model(model_path):
+            return False
+        self.model_version = version
+        self._verify_model_database_consistency()
+        return True
+    
+    def consolidate(self):
+        """
+        Retrain the model from the current database data and reload it.
+        
+        Folds users added or removed with add_identity()/remove_identity() into
+        the classifier. This is optional; recognition works without it.
+        
+        Returns:
+            True if the model was retrained and reloaded, False otherwise.
+        """
         try:
             from train_face_model import train_and_save_face_model
             result = train_and_save_face_model(classifier_type='svm')
             if result['success']:
                 logger.info("Model retrained successfully")
-                # Reload the model
-                model_path = self._find_latest_model()
-                if model_path and os.path.exists(model_path):
-                    self._load_model(model_path)
-            else:
-                logger.error(f"Model retraining failed: {result['message']}")
+                return self.reload_model()
+            logger.error(f"Model retraining failed: {result['message']}")
+            return False
         except Exception as e:
             logger.error(f"Error retraining model: {e}")
+            return False
 
     def record_attendance(self, user_id):
         """Record attendance for a user."""
@@ -372,7 +698,7 @@ class FaceRecognizer:
             return False
         
         try:
-            conn = sqlite3.connect("attendance.db")
+            conn = get_connection()
             cursor = conn.cursor()
             
             # First verify if the user exists in users table
@@ -390,46 +716,21 @@ class FaceRecognizer:
             today = datetime.now().strftime("%Y-%m-%d")
             
             try:
-                # Check if attendance already recorded today
-                cursor.execute("""
-                    SELECT user_id, first_seen, last_seen 
-                    FROM attendance 
-                    WHERE user_id = ? AND DATE(first_seen) = ?
-                """, (user_id, today))
-                
-                existing = cursor.fetchone()
-                
-                if existing:
-                    # Update last_seen
-                    cursor.execute("""
-                        UPDATE attendance 
-                        SET last_seen = ? 
-                        WHERE user_id = ?
-                    """, (current_time, user_id))
-                    logger.info(f"Updated last_seen for user {user[1]} (ID: {user[0]})")
-                else:
-                    # Insert new attendance record
-                    cursor.execute("""
-                        INSERT INTO attendance (user_id, first_seen, last_seen)
-                        VALUES (?, ?, ?)
-                    """, (user_id, current_time, current_time))
-                    logger.info(f"Created new attendance record for user {user[1]} (ID: {user[0]})")
+                # One indexed upsert per sighting: insert today's row or move last_seen forward
+                cursor.execute(ATTENDANCE_UPSERT_SQL, (user_id, today, current_time, current_time))
+                logger.info(f"Recorded attendance for user {user[1]} (ID: {user[0]})")
                 
                 conn.commit()
                 return True
                 
             except sqlite3.Error as e:
+                conn.rollback()
                 logger.error(f"Database error while recording attendance: {e}")
                 return False
             
         except Exception as e:
             logger.error(f"Error recording attendance: {e}")
             return False
-        finally:
-            try:
-                conn.close()
-            except:
-                pass
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,183 @@
+import time
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger("FaceTracker")
+
+class Track:
+    """A face followed across frames, with the identity it was last recognized as."""
+
+    def __init__(self, track_id, bbox, now):
+        self.track_id = track_id
+        self.bbox = np.asarray(bbox, dtype=np.float32)
+        self.user_id = None
+        self.user_name = None
+        self.confidence = 0.0
+        self.last_recognized = None
+        self.last_seen = now
+        self.missed = 0
+        self.pending_since = None
+
+def iou_matrix(boxes_a, boxes_b):
+    """
+    Compute pairwise intersection-over-union of two sets of boxes.
+
+    Args:
+        boxes_a: Array of shape (n, 4) as (x1, y1, x2, y2).
+        boxes_b: Array of shape (m, 4) as (x1, y1, x2, y2).
+
+    Returns:
+        Array of shape (n, m).
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return intersection / np.maximum(union, 1e-6)
+
+class FaceTracker:
+    """
+    Lightweight IoU/centroid tracker for face detections.
+
+    Each detection is linked to the track it overlaps most. A track only needs
+    to be re-recognized when it is new, its last match was below the confidence
+    threshold, or its identity is older than recheck_interval seconds.
+
+    The methods may be called from different pipeline stages (update and
+    mark_pending from the detect stage, set_identity from the match stage),
+    so every method reads and writes the track table and its tracks under a
+    lock.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_centroid_shift=0.5, max_missed=10, recheck_interval=5.0,
+                 pending_timeout=1.0):
+        """
+        Initialize the tracker.
+
+        Args:
+            iou_threshold: Minimum IoU to link a detection to an existing track.
+            max_centroid_shift: Fallback link when centroids moved less than this
+                fraction of the track's box width.
+            max_missed: Frames a track survives without a matching detection.
+            recheck_interval: Seconds after which a recognized track is re-recognized.
+            pending_timeout: Seconds a track marked pending is skipped while its
+                recognition result is still on its way.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_centroid_shift = max_centroid_shift
+        self.max_missed = max_missed
+        self.recheck_interval = recheck_interval
+        self.pending_timeout = pending_timeout
+        self.tracks = []
+        self._next_id = 1
+        # Guards self.tracks and the state of every track
+        self._lock = threading.Lock()
+
+    def update(self, bboxes, now=None):
+        """
+        Link this frame's detections to tracks.
+
+        Args:
+            bboxes: Array of shape (n, 4) with detection boxes.
+            now: Current time in seconds. Defaults to time.time().
+
+        Returns:
+            List of n Track objects aligned with bboxes.
+        """
+        now = time.time() if now is None else now
+        bboxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)
+        with self._lock:
+            return self._update(bboxes, now)
+
+    def _update(self, bboxes, now):
+        assigned = [None] * len(bboxes)
+        unmatched_tracks = set(range(len(self.tracks)))
+
+        if self.tracks and len(bboxes):
+            track_boxes = np.stack([track.bbox for track in self.tracks])
+            overlaps = iou_matrix(track_boxes, bboxes)
+
+            # Greedy matching, highest overlap first
+            for flat in np.argsort(-overlaps, axis=None):
+                t, d = np.unravel_index(flat, overlaps.shape)
+                if overlaps[t, d] < self.iou_threshold:
+                    break
+                if t in unmatched_tracks and assigned[d] is None:
+                    assigned[d] = self.tracks[t]
+                    unmatched_tracks.discard(t)
+
+            # Centroid fallback for fast movement that breaks the overlap
+            for d in range(len(bboxes)):
+                if assigned[d] is not None or not unmatched_tracks:
+                    continue
+                center = (bboxes[d, :2] + bboxes[d, 2:]) / 2
+                best_track, best_shift = None, None
+                for t in unmatched_tracks:
+                    track_box = self.tracks[t].bbox
+                    width = max(track_box[2] - track_box[0], 1.0)
+                    shift = np.linalg.norm(center - (track_box[:2] + track_box[2:]) / 2) / width
+                    if shift <= self.max_centroid_shift and (best_shift is None or shift < best_shift):
+                        best_track, best_shift = t, shift
+                if best_track is not None:
+                    assigned[d] = self.tracks[best_track]
+                    unmatched_tracks.discard(best_track)
+
+        for d, track in enumerate(assigned):
+            if track is None:
+                track = Track(self._next_id, bboxes[d], now)
+                self._next_id += 1
+                self.tracks.append(track)
+                assigned[d] = track
+            track.bbox = bboxes[d]
+            track.last_seen = now
+            track.missed = 0
+
+        # Age out tracks that were not seen in this frame
+        for t in unmatched_tracks:
+            self.tracks[t].missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        return assigned
+
+    def needs_recognition(self, track, confidence_threshold, now=None):
+        """
+        Decide whether a track must be embedded and matched again.
+
+        Args:
+            track: Track returned by update().
+            confidence_threshold: Confidence at which an identity is trusted.
+            now: Current time in seconds. Defaults to time.time().
+
+        Returns:
+            True if the track is new, low-confidence or stale.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if track.pending_since is not None and now - track.pending_since < self.pending_timeout:
+                return False
+            if track.last_recognized is None:
+                return True
+            if track.user_id is None or track.confidence < confidence_threshold:
+                return True
+            return now - track.last_recognized > self.recheck_interval
+
+    def mark_pending(self, track, now=None):
+        """Mark a track as sent for recognition so it is not embedded twice."""
+        with self._lock:
+            track.pending_since = time.time() if now is None else now
+
+    def set_identity(self, track, user_id, user_name, confidence, now=None):
+        """Store a recognition result on a track."""
+        with self._lock:
+            track.pending_since = None
+            track.user_id = user_id
+            track.user_name = user_name
+            track.confidence = confidence
+            track.last_recognized = time.time() if now is None else now
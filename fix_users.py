@@ -1,10 +1,10 @@
 import sqlite3
 import os
-import shutil
 import logging
-from insightface.app import FaceAnalysis
-import cv2
-import numpy as np
+from migrate_db import SCHEMA_VERSION, create_users_table, create_attendance_table, create_embeddings_table
+from db import get_connection, backup_database
+from face_embeddings import add_embedding
+from bulk_enroll import encode_images
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,86 +18,62 @@ def rebuild_users_database():
     4. Recompute face encodings
     """
     try:
-        # Initialize InsightFace
-        app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'])
-        app.prepare(ctx_id=0)
-        
         # 1. Backup existing database
         if os.path.exists("attendance.db"):
             backup_name = "attendance_backup.db"
-            shutil.copy2("attendance.db", backup_name)
+            backup_database(backup_name)
             logger.info(f"Created database backup: {backup_name}")
         
         # 2. Create fresh database
-        conn = sqlite3.connect("attendance.db")
+        conn = get_connection()
         cursor = conn.cursor()
         
         # Drop existing tables
         cursor.execute("DROP TABLE IF EXISTS users")
         cursor.execute("DROP TABLE IF EXISTS attendance")
+        cursor.execute("DROP TABLE IF EXISTS embeddings")
         
         # Create fresh tables
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id TEXT PRIMARY KEY,
-            name TEXT,
-            encoding BLOB,
-            phone TEXT,
-            email TEXT
-        )
-    """)
+        create_users_table(cursor)
 
-    # Create attendance table with proper structure
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS attendance (
-            user_id TEXT,
-            first_seen TEXT,
-            last_seen TEXT,
-            FOREIGN KEY(user_id) REFERENCES users(user_id)
-        )
-    """)
+        # Create attendance table with proper structure
+        create_attendance_table(cursor)
+        create_embeddings_table(cursor)
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         
         # 3. Re-add users from known_faces directory
         known_faces_dir = "known_faces"
         if not os.path.exists(known_faces_dir):
             os.makedirs(known_faces_dir)
             
-        print("\nProcessing users:")
-        for file in os.listdir(known_faces_dir):
-            if file.endswith(('.jpg', '.jpeg', '.png')):
-                name = os.path.splitext(file)[0]
-                image_path = os.path.join(known_faces_dir, file)
-                
-                print(f"\nProcessing: {name}")
-                print(f"Image: {image_path}")
-                
-                # Read image and extract face encoding
-                img = cv2.imread(image_path)
-                if img is None:
-                    print(f"Could not read image: {image_path}")
-                    continue
-                
-                faces = app.get(img)
-                if not faces:
-                    print(f"No face detected in: {image_path}")
-                    continue
+        image_paths = [os.path.join(known_faces_dir, file) for file in sorted(os.listdir(known_faces_dir))
+                       if file.endswith(('.jpg', '.jpeg', '.png'))]
+        
+        # Detect and embed all images across a process pool
+        print(f"\nProcessing {len(image_paths)} images:")
+        results = {result['image']: result for result in encode_images(image_paths)}
+        
+        for image_path in image_paths:
+            name = os.path.splitext(os.path.basename(image_path))[0]
+            result = results[image_path]
+            if result['embedding'] is None:
+                print(f"Skipping {image_path}: {result['error']}")
+                continue
+            
+            try:
+                # Add user with minimal info first (can be updated later)
+                cursor.execute("""
+                    INSERT INTO users (name, phone, email)
+                    VALUES (?, ?, ?)
+                """, (name, "", ""))
                 
-                face_encoding = faces[0].embedding
-                face_encoding_blob = face_encoding.astype(np.float32).tobytes()
+                user_id = cursor.lastrowid
+                add_embedding(cursor, user_id, result['embedding'], quality=result['det_score'], source=image_path)
+                print(f"Added user: {name} (ID: {user_id})")
                 
-                try:
-                    # Add user with minimal info first (can be updated later)
-                    cursor.execute("""
-                        INSERT INTO users (name, encoding, phone, email)
-                        VALUES (?, ?, ?, ?)
-                    """, (name, face_encoding_blob, "", ""))
-                    
-                    user_id = cursor.lastrowid
-                    print(f"Added user: {name} (ID: {user_id})")
-                    
-                except sqlite3.IntegrityError:
-                    print(f"User {name} already exists, skipping...")
-                    continue
+            except sqlite3.IntegrityError:
+                print(f"User {name} already exists, skipping...")
+                continue
                 
         conn.commit()
         
@@ -109,8 +85,7 @@ def rebuild_users_database():
         for user_id, name in users:
             print(f"ID: {user_id}, Name: {name}")
         
-        conn.close()
-        
+
         print("\n✅ Database rebuilt successfully!")
         return True
         
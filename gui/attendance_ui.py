@@ -1,19 +1,21 @@
 from PyQt5.QtWidgets import QApplication, QWidget, QStackedWidget, QVBoxLayout, QLabel, QPushButton, QLineEdit, QTableWidget, QTableWidgetItem, QDateEdit, QFileDialog, QMessageBox, QHeaderView, QHBoxLayout, QFormLayout, QFrame
-from PyQt5.QtCore import Qt, QDate, QTimer
-from PyQt5.QtGui import QFont, QIcon, QPixmap, QImage, QColor, QPalette
-import sqlite3
+from PyQt5.QtCore import Qt, QDate, QObject, pyqtSignal
+from PyQt5.QtGui import QFont, QIcon, QPixmap, QImage
 import pandas as pd
 import os
 import cv2
-from datetime import datetime
-import numpy as np
 import sys
 
 # Add the parent directory to the path so we can import from the root
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from face_recognition import FaceRecognizer
-from train_face_model import train_and_save_face_model
+from training_service import TrainingService
+from face_index import add_to_index, remove_from_index
+from add_user import get_next_user_id
+from db import query_all, query_one, transaction
+from face_embeddings import add_embedding, delete_embeddings
+from migrate_db import create_users_table
 
 # Global styles
 GLOBAL_STYLE = """
@@ -85,6 +87,11 @@ GLOBAL_STYLE = """
     }
 """
 
+class TrainingSignals(QObject):
+    """Carries TrainingService callbacks from its thread to the UI thread."""
+    progress = pyqtSignal(str)
+    finished = pyqtSignal(bool, str, str)
+
 class MainWindow(QStackedWidget):
     def __init__(self):
         super().__init__()
@@ -101,6 +108,20 @@ class MainWindow(QStackedWidget):
         else:
             print("Logo file not found.")
         
+        # Recognizer shared by the screens; user changes are applied to it in place
+        self.recognizer = FaceRecognizer()
+        
+        # Retrains run in a worker process; bursts of changes become one retrain
+        self.training_signals = TrainingSignals()
+        self.training_signals.progress.connect(self.on_training_progress)
+        self.training_signals.finished.connect(self.on_training_finished)
+        self.training_service = TrainingService(
+            classifier_type='svm',
+            on_progress=self.training_signals.progress.emit,
+            on_finished=self.training_signals.finished.emit
+        )
+        self.training_service.start()
+        
         self.login_screen = LoginScreen(self)
         self.attendance_screen = AttendanceScreen(self)
         self.register_screen = RegisterScreen(self)
@@ -112,6 +133,20 @@ class MainWindow(QStackedWidget):
         self.addWidget(self.users_screen)
         
         self.setCurrentWidget(self.login_screen)
+        
+    def on_training_progress(self, message):
+        self.users_screen.set_training_status(message)
+        
+    def on_training_finished(self, success, message, model_path):
+        # Swap in the new model only now; recognition used the old one until here
+        if success and self.recognizer.reload_model():
+            self.users_screen.set_training_status("Model up to date")
+        else:
+            self.users_screen.set_training_status(f"Retrain failed: {message}")
+            
+    def closeEvent(self, event):
+        self.training_service.stop()
+        super().closeEvent(event)
 
 class LoginScreen(QWidget):
     def __init__(self, main_window):
@@ -436,17 +471,13 @@ class AttendanceScreen(QWidget):
         
     def display_attendance_table(self):
         selected_date = self.date_picker.date().toString("yyyy-MM-dd")
-        conn = sqlite3.connect("attendance.db")
-        cursor = conn.cursor()
         query = """
         SELECT users.name, attendance.first_seen, attendance.last_seen 
         FROM attendance
         INNER JOIN users ON attendance.user_id = users.user_id
-        WHERE DATE(attendance.first_seen) = ?
+        WHERE attendance.day = ?
         """
-        cursor.execute(query, (selected_date,))
-        records = cursor.fetchall()
-        conn.close()
+        records = query_all(query, (selected_date,))
         
         self.attendance_table.setRowCount(len(records))
         for row_idx, (name, first_seen, last_seen) in enumerate(records):
@@ -717,100 +748,59 @@ class RegisterScreen(QWidget):
                 if reply == QMessageBox.No:
                     return
             
-            cv2.imwrite(image_path, self.captured_image)
-            
-            # Get face encoding using FaceRecognizer
-            recognizer = FaceRecognizer()
-            face_encoding = recognizer.extract_face_encoding(image_path)
+            # Get face encoding from the captured frame using the shared FaceRecognizer
+            recognizer = self.main_window.recognizer
+            face_encoding = recognizer.extract_face_encoding(self.captured_image)
             if face_encoding is None:
                 QMessageBox.warning(self, "Error", "Could not detect face in the image. Please try again.")
                 return
-                
-            face_encoding_blob = face_encoding.astype(np.float32).tobytes()
             
-            # Save to database
-            conn = sqlite3.connect("attendance.db")
-            cursor = conn.cursor()
-            
-            # Create users table if it doesn't exist
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id TEXT PRIMARY KEY,
-                    name TEXT,
-                    encoding BLOB,
-                    phone TEXT,
-                    email TEXT
-                )
-            """)
+            # Keep the photo with the other known faces
+            cv2.imwrite(image_path, self.captured_image)
             
-            # Check if user already exists
-            cursor.execute("SELECT user_id FROM users WHERE name = ?", (name,))
-            existing_user = cursor.fetchone()
+            # Save to database
+            with transaction() as cursor:
+                # Create users table if it doesn't exist
+                create_users_table(cursor)
+                
+                # Check if user already exists
+                cursor.execute("SELECT user_id FROM users WHERE name = ?", (name,))
+                existing_user = cursor.fetchone()
+                
+                if existing_user:
+                    # Update existing user
+                    user_id = existing_user[0]
+                    cursor.execute("""
+                        UPDATE users 
+                        SET phone = ?, email = ?
+                        WHERE name = ?
+                    """, (phone, email, name))
+                else:
+                    # Insert new user with the next S101+ style ID
+                    user_id = get_next_user_id()
+                    cursor.execute("""
+                        INSERT INTO users (user_id, name, phone, email)
+                        VALUES (?, ?, ?, ?)
+                    """, (user_id, name, phone, email))
+                
+                # Keep every capture as an enrollment sample
+                add_embedding(cursor, user_id, face_encoding, source=image_path)
             
-            if existing_user:
-                # Update existing user
-                user_id = existing_user[0]
-                cursor.execute("""
-                    UPDATE users 
-                    SET encoding = ?, phone = ?, email = ?
-                    WHERE name = ?
-                """, (face_encoding_blob, phone, email, name))
-            else:
-                # Insert new user
-                cursor.execute("""
-                    INSERT INTO users (name, encoding, phone, email)
-                    VALUES (?, ?, ?, ?)
-                """, (name, face_encoding_blob, phone, email))
-                user_id = cursor.lastrowid
+            # Keep the ANN index and the recognizer in step with the users table
+            add_to_index(user_id)
+            recognizer.add_identity(user_id, name)
             
-            conn.commit()
-            conn.close()
+            # Fold the change into the classifier in the background
+            self.main_window.training_service.request(f"registered {user_id}")
             
             QMessageBox.information(self, "Success", f"User {name} registered successfully!")
             
-            # Train the model with the new data
-            self.train_model()
-            
-            # Clear fields
-            self.clear_fields()
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"An error occurred: {str(e)}")
-            
-    def train_model(self):
-        """Train the face recognition model after registering a user."""
-        try:
-            # Show a progress message
-            progress_msg = QMessageBox()
-            progress_msg.setIcon(QMessageBox.Information)
-            progress_msg.setText("Training AI Model")
-            progress_msg.setInformativeText("Please wait while the face recognition model is being trained...")
-            progress_msg.setWindowTitle("Processing")
-            progress_msg.show()
-            
-            # Train the model
-            result = train_and_save_face_model(classifier_type='svm')
-            
-            # Close the progress message
-            progress_msg.close()
-            
-            if result['success']:
-                QMessageBox.information(self, "Success", "User registered and model trained successfully!")
-            else:
-                QMessageBox.warning(self, "Warning", 
-                    f"User registered, but model training failed: {result['message']}")
-            
             # Clear fields and go back
             self.clear_fields()
             self.go_back()
             
         except Exception as e:
-            import traceback
-            error_details = traceback.format_exc()
-            QMessageBox.critical(self, "Error", f"Failed to train AI model: {str(e)}\n\nPlease check the console for more details.")
-            print(f"Error details: {error_details}")
-            self.clear_fields()
-            self.go_back()
+            QMessageBox.critical(self, "Error", f"An error occurred: {str(e)}")
             
     def clear_fields(self):
         self.name_input.clear()
@@ -951,6 +941,14 @@ class UsersScreen(QWidget):
             }
         """)
         refresh_layout.addWidget(self.refresh_button)
+        
+        # Full retrain is optional: new and deleted users are already live
+        self.train_button = QPushButton("Retrain Model")
+        self.train_button.clicked.connect(self.train_model)
+        refresh_layout.addWidget(self.train_button)
+        
+        self.training_status = QLabel("")
+        refresh_layout.insertWidget(0, self.training_status)
         table_layout.addLayout(refresh_layout)
         
         layout.addWidget(table_card)
@@ -963,14 +961,8 @@ class UsersScreen(QWidget):
     def load_users(self):
         """Load all users from the database and display them in the table."""
         try:
-            conn = sqlite3.connect("attendance.db")
-            cursor = conn.cursor()
-            
             # Get all users
-            cursor.execute("SELECT user_id, name, email, phone FROM users")
-            users = cursor.fetchall()
-            
-            conn.close()
+            users = query_all("SELECT user_id, name, email, phone FROM users")
             
             # Clear the table
             self.users_table.setRowCount(0)
@@ -1027,68 +1019,46 @@ class UsersScreen(QWidget):
             )
             
             if reply == QMessageBox.Yes:
-                conn = sqlite3.connect("attendance.db")
-                cursor = conn.cursor()
-                
-                # Get user name for confirmation message
-                cursor.execute("SELECT name FROM users WHERE id = ?", (user_id,))
-                user = cursor.fetchone()
-                user_name = user[0] if user else "Unknown"
-                
-                # Delete user
-                cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-                
-                # Delete attendance records
-                cursor.execute("DELETE FROM attendance WHERE user_id = ?", (user_id,))
+                with transaction() as cursor:
+                    # Get user name for confirmation message
+                    cursor.execute("SELECT name FROM users WHERE user_id = ?", (user_id,))
+                    user = cursor.fetchone()
+                    user_name = user[0] if user else "Unknown"
+                    
+                    # Delete user
+                    cursor.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+                    delete_embeddings(cursor, user_id)
+                    
+                    # Delete attendance records
+                    cursor.execute("DELETE FROM attendance WHERE user_id = ?", (user_id,))
                 
-                conn.commit()
-                conn.close()
+                # Drop the user from the ANN index and the recognizer
+                remove_from_index(user_id)
+                self.main_window.recognizer.remove_identity(user_id)
+                self.main_window.training_service.request(f"deleted {user_id}")
                 
                 QMessageBox.information(self, "Success", f"User {user_name} has been deleted.")
                 
                 # Reload users
                 self.load_users()
                 
-                # Retrain the model
-                self.train_model()
-                
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to delete user: {str(e)}")
     
     def train_model(self):
-        """Train the face recognition model after deleting a user."""
+        """Request a background retrain of the face recognition model on all users."""
         try:
             # Check if there are enough users to train the model
-            conn = sqlite3.connect("attendance.db")
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM users")
-            user_count = cursor.fetchone()[0]
-            conn.close()
+            user_count = query_one("SELECT COUNT(*) FROM users")[0]
             
             if user_count < 2:
                 QMessageBox.information(self, "Information", 
                     "Not enough users to train the model. At least 2 users are required.\n\nPlease add more users before training the model.")
                 return
             
-            # Show a progress message
-            progress_msg = QMessageBox()
-            progress_msg.setIcon(QMessageBox.Information)
-            progress_msg.setText("Training AI Model")
-            progress_msg.setInformativeText("Please wait while the face recognition model is being trained...")
-            progress_msg.setWindowTitle("Processing")
-            progress_msg.show()
-            
-            # Train the model
-            result = train_and_save_face_model(classifier_type='svm')
-            
-            # Close the progress message
-            progress_msg.close()
-            
-            if result['success']:
-                QMessageBox.information(self, "Success", "Model trained successfully!")
-            else:
-                QMessageBox.warning(self, "Warning", 
-                    f"Model training failed: {result['message']}")
+            # Queue a background retrain; the UI stays responsive meanwhile
+            self.main_window.training_service.request("manual retrain")
+            self.set_training_status("Retrain queued...")
             
         except Exception as e:
             import traceback
@@ -1096,6 +1066,10 @@ class UsersScreen(QWidget):
             QMessageBox.critical(self, "Error", f"Failed to train AI model: {str(e)}\n\nPlease check the console for more details.")
             print(f"Error details: {error_details}")
     
+    def set_training_status(self, message):
+        """Show the state of the background retrain next to the buttons."""
+        self.training_status.setText(message)
+    
     def go_back(self):
         self.main_window.setCurrentWidget(self.main_window.attendance_screen)
 
@@ -0,0 +1,45 @@
+import os
+import logging
+import numpy as np
+import cv2
+
+logger = logging.getLogger("ImageIO")
+
+# Encoded image buffers accepted wherever an image is expected
+BUFFER_TYPES = (bytes, bytearray, memoryview)
+
+def load_image(image):
+    """
+    Get a BGR image from an in-memory frame, an encoded buffer or a file path.
+
+    Arrays are returned as they are, so callers that already hold a frame
+    never touch the filesystem. Encoded buffers (JPEG, PNG, ...) are decoded
+    once with cv2.imdecode.
+
+    Args:
+        image: BGR numpy array, bytes/bytearray/memoryview holding an encoded
+            image, or a path to an image file.
+
+    Returns:
+        BGR image as a numpy array, or None if it could not be read.
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, BUFFER_TYPES):
+        buffer = np.frombuffer(image, dtype=np.uint8)
+        if buffer.size == 0:
+            return None
+        return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    return cv2.imread(os.fspath(image))
+
+def is_path(image):
+    """Return True if image refers to a file rather than holding pixels or bytes."""
+    return isinstance(image, (str, os.PathLike))
+
+def describe_image(image):
+    """Short description of an image argument for log messages."""
+    if isinstance(image, np.ndarray):
+        return f"<frame {'x'.join(str(size) for size in image.shape)}>"
+    if isinstance(image, BUFFER_TYPES):
+        return f"<{len(memoryview(image).cast('B'))}-byte image>"
+    return os.fspath(image)
@@ -1,39 +1,31 @@
-import sqlite3
 import logging
 import os
 
+from migrate_db import SCHEMA_VERSION, create_users_table, create_attendance_table, create_embeddings_table
+from db import get_connection
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def initialize_database():
     """Initialize database and create tables with consistent data types."""
     try:
-        conn = sqlite3.connect("attendance.db")
+        conn = get_connection()
         cursor = conn.cursor()
         
         # Enable foreign key support
         cursor.execute("PRAGMA foreign_keys = ON")
         
         # Create users table with TEXT user_id
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id TEXT PRIMARY KEY,
-                name TEXT UNIQUE,
-                encoding BLOB,
-                phone TEXT,
-                email TEXT
-            )
-        """)
+        create_users_table(cursor)
+        
+        # Create attendance table with TEXT user_id to match users table,
+        # one row per user per day
+        create_attendance_table(cursor)
         
-        # Create attendance table with TEXT user_id to match users table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS attendance (
-                user_id TEXT,
-                first_seen TEXT,
-                last_seen TEXT,
-                FOREIGN KEY(user_id) REFERENCES users(user_id)
-            )
-        """)
+        # Enrollment samples, several per user
+        create_embeddings_table(cursor)
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         
         conn.commit()
         
@@ -61,7 +53,6 @@ def initialize_database():
         for fk in cursor.fetchall():
             print(f"Column: {fk[3]} references users({fk[4]})")
         
-        conn.close()
         logger.info("Database initialized successfully!")
         return True
         
@@ -82,6 +73,7 @@ if __name__ == "__main__":
             print("1. users table: user_id is TEXT")
             print("2. attendance table: user_id is TEXT")
             print("3. Foreign key now correctly references users(user_id)")
+            print("4. attendance table: indexed day column, one row per user per day")
         else:
             print("\n❌ Error initializing database. Check the logs above.")
     else:
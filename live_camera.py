@@ -1,141 +1,355 @@
 import cv2
 import numpy as np
 import time
-from datetime import datetime
-import sqlite3
 import os
 import sys
+import queue
+import threading
 
 # Add the current directory to the path so we can import from the root
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from face_recognition import FaceRecognizer
-from insightface.app import FaceAnalysis
-
-def run_live_camera():
-    """Runs a continuous live CCTV camera feed while marking attendance."""
-    # Initialize InsightFace app with modified parameters
-    app = FaceAnalysis(name='buffalo_l', 
-                      providers=['CPUExecutionProvider'],
-                      allowed_modules=['detection', 'recognition'])
-    # Prepare with modified detection parameters
-    app.prepare(ctx_id=0, det_size=(640, 640))
-    
+from face_recognition import FaceRecognizer, ENGINE_CLASSIFIER, ENGINE_GALLERY
+from face_models import get_face_app, get_model_stats, detect_faces, embed_batch
+from face_tracker import FaceTracker
+from pipeline import DropOldestQueue, PipelineStage, BatchPipelineStage, format_stats
+from attendance_sink import AttendanceSink
+from recognition_pool import RecognitionPool
+
+# Bounded queue sizes between stages; the oldest item is dropped when full.
+# Frame and embed queues hold this many frames per camera.
+FRAME_QUEUE_SIZE = 2
+EMBED_QUEUE_SIZE = 2
+MATCH_QUEUE_SIZE = 4
+RENDER_QUEUE_SIZE = 2
+
+# Seconds between pipeline statistics printouts
+STATS_INTERVAL = 10
+
+def recognize_embeddings(recognizer, embeddings):
+    """
+    Match a batch of face embeddings and print debugging information.
+
+    Every face is scored once; the top-3 listing comes from the same pass.
+
+    Args:
+        recognizer: FaceRecognizer instance.
+        embeddings: Array of shape (n, dim).
+
+    Returns:
+        List of (user_id, user_name, confidence) tuples, one per embedding.
+    """
+    # Pick up a newly published model between frames
+    if recognizer.swap_in_new_model():
+        print(f"\nSwitched to model version {recognizer.model_version}")
+
+    results = []
+    for match in recognizer.recognize_topk(embeddings, k=3):
+        print(f"\nTop 3 predictions (margin {match['margin']:.2f}):")
+        for pred_id, pred_name, pred_conf in match['candidates']:
+            print(f"{pred_name} (ID: {pred_id}): {pred_conf:.2f}")
+        user_name = match['user_name'] or "Unknown"
+        results.append((match['user_id'], user_name, match['confidence']))
+    return results
+
+def run_live_camera(engine=ENGINE_CLASSIFIER, cameras=(0,), workers=0):
+    """
+    Runs a continuous live CCTV camera feed while marking attendance.
+
+    The work is split into capture -> detect -> embed -> match -> attendance
+    writer stages running on their own threads, with rendering on the calling
+    thread. Stages are connected by bounded queues that drop the oldest item,
+    so a slow database commit never stalls frame capture.
+
+    Faces are tracked across frames so each person is embedded and matched
+    once, then again only when their match was weak or has gone stale. The
+    embed stage aligns the faces of every frame waiting for it, from all
+    cameras, and runs the recognition model on them as one batch.
+
+    With workers > 0, detection, embedding and matching run instead in a
+    RecognitionPool of worker processes that share the enrolled gallery, so
+    several cores are used; every frame is recognized and the results, kept
+    in order per camera, update the trackers. The pool matches by cosine
+    similarity, so it always uses the gallery engine.
+
+    Args:
+        engine: Recognition engine passed to FaceRecognizer ('classifier' or 'gallery').
+        cameras: Indices of the cameras to read, one window each.
+        workers: Number of recognition worker processes, or 0 to recognize in this process.
+    """
+    if workers:
+        engine = ENGINE_GALLERY
+    else:
+        # Get the shared InsightFace app (detection + recognition, 640x640)
+        app = get_face_app()
+        for stats in get_model_stats():
+            for task, latency in stats['latency'].items():
+                print(f"{stats['name']} {task}: cold {latency['cold_ms']:.1f} ms, warm {latency['warm_ms']:.1f} ms")
+
     # Initialize face recognizer
-    recognizer = FaceRecognizer()
+    recognizer = FaceRecognizer(engine=engine)
     print("\nInitializing face recognition system...")
     print("Available users:", recognizer.user_names)
-    if recognizer.classifier is not None:
+    if recognizer.engine == ENGINE_GALLERY:
+        print(f"Gallery loaded with {len(recognizer.gallery)} identities")
+    elif recognizer.classifier is not None:
         print("Model classes:", recognizer.classifier.classes_)
+        if len(recognizer.pending):
+            print(f"Users not in the model yet: {recognizer.pending.user_ids}")
     else:
         print("No classifier loaded!")
-    
-    # Initialize camera
-    video_capture = cv2.VideoCapture(0)
-    
-    # Set camera properties for better performance
-    video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-    video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-    video_capture.set(cv2.CAP_PROP_FPS, 30)
-    
-    if not video_capture.isOpened():
-        print("Error: Unable to access camera")
-        return
-    
+
+    # Swap in retrained models as they are published, without a restart
+    recognizer.start_model_watch()
+
+    pool = None
+    if workers:
+        pool = RecognitionPool(recognizer.gallery, workers=workers)
+        if not pool.start():
+            print("Error: Unable to start the recognition workers")
+            recognizer.stop_model_watch()
+            return
+
+    # Initialize cameras
+    video_captures = {}
+    for camera in cameras:
+        video_capture = cv2.VideoCapture(camera)
+
+        # Set camera properties for better performance
+        video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+        video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        video_capture.set(cv2.CAP_PROP_FPS, 30)
+        video_captures[camera] = video_capture
+
+        if not video_capture.isOpened():
+            print(f"Error: Unable to access camera {camera}")
+            for capture_device in video_captures.values():
+                capture_device.release()
+            recognizer.stop_model_watch()
+            if pool is not None:
+                pool.stop()
+            return
+
     # Dictionary to track recognized users and their last attendance time
     recognized_users = {}
     attendance_cooldown = 60  # seconds between attendance records
-    
-    print("Camera started. Press 'q' to quit.")
-    
-    try:
-        while True:
+
+    # Track faces per camera so that a person standing still is only recognized once
+    trackers = {camera: FaceTracker() for camera in cameras}
+
+    # Last attendance result, drawn on the frame for a couple of seconds
+    attendance_status = {'text': None, 'color': None, 'time': 0}
+
+    frame_queue = DropOldestQueue(FRAME_QUEUE_SIZE * len(cameras))
+    embed_queue = DropOldestQueue(EMBED_QUEUE_SIZE * len(cameras))
+    match_queue = DropOldestQueue(MATCH_QUEUE_SIZE)
+    # Attendance events are never dropped: the cooldown is already set when one is
+    # queued, so a lost sighting would not be retried. The cooldown bounds the queue.
+    attendance_queue = queue.Queue()
+    render_queue = DropOldestQueue(RENDER_QUEUE_SIZE * len(cameras))
+
+    def make_capture(camera):
+        video_capture = video_captures[camera]
+
+        def capture():
             ret, frame = video_capture.read()
             if not ret or frame is None:
+                return None
+            return {'camera': camera, 'frame': frame}
+        return capture
+
+    def detect(item):
+        # Detect faces, then pick the new, uncertain or stale tracks to embed
+        faces = detect_faces(item['frame'], app)
+        tracker = trackers[item['camera']]
+        tracks = tracker.update([face.bbox for face in faces])
+        now = time.time()
+        pending = []
+        if faces and recognizer.is_ready():
+            pending = [i for i, track in enumerate(tracks)
+                       if tracker.needs_recognition(track, recognizer.confidence_threshold, now)]
+            if pending:
+                print(f"\nDetected {len(faces)} faces on camera {item['camera']}, recognizing {len(pending)}")
+                for i in pending:
+                    tracker.mark_pending(tracks[i], now)
+        item.update({'faces': faces, 'tracks': tracks, 'pending': pending,
+                     'embeddings': None, 'time': now})
+        return item
+
+    def embed(items):
+        # One recognition run for the pending faces of every queued frame
+        batch = [(item['frame'], [item['faces'][i] for i in item['pending']])
+                 for item in items if item['pending']]
+        if batch:
+            embed_batch(batch, app)
+        for item in items:
+            if item['pending']:
+                item['embeddings'] = np.stack([item['faces'][i].embedding for i in item['pending']])
+        return items
+
+    def match(item):
+        tracker = trackers[item['camera']]
+        if item['embeddings'] is not None:
+            matches = recognize_embeddings(recognizer, item['embeddings'])
+            for i, (user_id, user_name, confidence) in zip(item['pending'], matches):
+                tracker.set_identity(item['tracks'][i], user_id, user_name, confidence, item['time'])
+        return label_and_record(item, [face.bbox for face in item['faces']], item['tracks'])
+
+    def dispatch(item):
+        # Dropped when every worker is busy, like a full frame queue
+        return True if pool.submit(item['camera'], item['frame']) else None
+
+    def track_results(result):
+        # Results arrive in frame order per camera, so the trackers see frames in sequence
+        tracker = trackers[result['camera']]
+        bboxes = [face['bbox'] for face in result['faces']]
+        tracks = tracker.update(bboxes)
+        now = time.time()
+        for face, track in zip(result['faces'], tracks):
+            user_name = recognizer.user_names.get(face['user_id'], "Unknown")
+            tracker.set_identity(track, face['user_id'], user_name, face['confidence'], now)
+        return label_and_record(result, bboxes, tracks)
+
+    def label_and_record(item, bboxes, tracks):
+        # Queue attendance for trusted identities whose cooldown has passed
+        labels = []
+        for bbox, track in zip(bboxes, tracks):
+            if track.user_id is None or track.confidence < recognizer.confidence_threshold:
                 continue
-            
+            labels.append((np.asarray(bbox).astype(int), f"{track.user_name} ({track.confidence:.2f})"))
+
+            current_time = time.time()
+            if (track.user_id not in recognized_users or
+                current_time - recognized_users[track.user_id] > attendance_cooldown):
+                recognized_users[track.user_id] = current_time
+                attendance_queue.put((track.user_id, track.user_name))
+
+        return {'camera': item['camera'], 'frame': item['frame'], 'labels': labels}
+
+    # Sightings are coalesced and committed in batches by the sink's own thread
+    attendance_sink = AttendanceSink()
+
+    def write_attendance(event):
+        user_id, user_name = event
+        attendance_sink.record(user_id)
+        print(f"\nQueued attendance for {user_name} (ID: {user_id})")
+        attendance_status.update(text="Attendance Recorded!", color=(0, 255, 0), time=time.time())
+        return True
+
+    stop_event = threading.Event()
+    stages = [PipelineStage(f"capture-{camera}", make_capture(camera), None, frame_queue, stop_event)
+              for camera in cameras]
+    if pool is not None:
+        stages += [
+            PipelineStage("dispatch", dispatch, frame_queue, None, stop_event),
+            PipelineStage("track", track_results, pool.output, render_queue, stop_event),
+        ]
+    else:
+        stages += [
+            PipelineStage("detect", detect, frame_queue, embed_queue, stop_event),
+            BatchPipelineStage("embed", embed, embed_queue, match_queue, stop_event, max_batch=len(cameras)),
+            PipelineStage("match", match, match_queue, render_queue, stop_event),
+        ]
+    stages.append(PipelineStage("attendance", write_attendance, attendance_queue, None, stop_event))
+
+    print("Camera started. Press 'q' to quit.")
+
+    rendered = 0
+    render_started = time.perf_counter()
+    last_stats = time.time()
+
+    try:
+        attendance_sink.start()
+        for stage in stages:
+            stage.start()
+
+        while True:
             try:
-                # Get all faces in the frame
-                faces = app.get(frame)
-                
-                if faces:
-                    print(f"\nDetected {len(faces)} faces in frame")
-                    for face in faces:
-                        try:
-                            # Get face embedding
-                            face_encoding = face.embedding.reshape(1, -1)
-                            
-                            if recognizer.classifier is not None:
-                                # Get predictions and probabilities
-                                user_id = recognizer.classifier.predict(face_encoding)[0]
-                                probs = recognizer.classifier.predict_proba(face_encoding)[0]
-                                confidence = max(probs)
-                                user_name = recognizer.user_names.get(user_id, "Unknown")
-                                
-                                # Print top 3 predictions for debugging
-                                top_3_idx = np.argsort(probs)[-3:][::-1]
-                                print("\nTop 3 predictions:")
-                                for idx in top_3_idx:
-                                    pred_id = recognizer.classifier.classes_[idx]
-                                    pred_name = recognizer.user_names.get(pred_id, "Unknown")
-                                    pred_conf = probs[idx]
-                                    print(f"{pred_name} (ID: {pred_id}): {pred_conf:.2f}")
-                                
-                                if confidence >= recognizer.confidence_threshold:
-                                    # Get face box coordinates
-                                    bbox = face.bbox.astype(int)
-                                    x1, y1, x2, y2 = bbox
-                                    
-                                    # Draw bounding box
-                                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                                    
-                                    # Draw name and confidence
-                                    text = f"{user_name} ({confidence:.2f})"
-                                    cv2.putText(frame, text, (x1, y1 - 10), 
-                                              cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                                    
-                                    # Record attendance if cooldown period has passed
-                                    current_time = time.time()
-                                    if (user_id not in recognized_users or 
-                                        current_time - recognized_users[user_id] > attendance_cooldown):
-                                        
-                                        print(f"\nAttempting to record attendance for {user_name} (ID: {user_id})")
-                                        success = recognizer.record_attendance(user_id)
-                                        if success:
-                                            print(f"✅ Successfully recorded attendance for {user_name}")
-                                            recognized_users[user_id] = current_time
-                                            # Draw success message
-                                            cv2.putText(frame, "Attendance Recorded!", 
-                                                      (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 
-                                                      1, (0, 255, 0), 2)
-                                        else:
-                                            print(f"❌ Failed to record attendance for {user_name}")
-                                            # Draw failure message
-                                            cv2.putText(frame, "Failed to Record!", 
-                                                      (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 
-                                                      1, (0, 0, 255), 2)
-                            else:
-                                print("No classifier loaded in recognizer")
-                        except Exception as e:
-                            print(f"Error processing face: {str(e)}")
-                            continue
-                
-                # Display the frame
-                cv2.imshow("VeriFace - Live Recognition", frame)
-                
-            except Exception as e:
-                print(f"Error processing frame: {str(e)}")
-                continue
-            
+                item = render_queue.get(timeout=0.1)
+            except queue.Empty:
+                item = None
+
+            if item is not None:
+                try:
+                    frame = item['frame']
+                    for (x1, y1, x2, y2), text in item['labels']:
+                        # Draw bounding box
+                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+
+                        # Draw name and confidence
+                        cv2.putText(frame, text, (x1, y1 - 10),
+                                  cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+                    # Draw the latest attendance result for two seconds
+                    if attendance_sink.last_error:
+                        cv2.putText(frame, "Failed to Record!",
+                                  (10, 30), cv2.FONT_HERSHEY_SIMPLEX,
+                                  1, (0, 0, 255), 2)
+                    elif attendance_status['text'] and time.time() - attendance_status['time'] < 2:
+                        cv2.putText(frame, attendance_status['text'],
+                                  (10, 30), cv2.FONT_HERSHEY_SIMPLEX,
+                                  1, attendance_status['color'], 2)
+
+                    # Display the frame
+                    title = "VeriFace - Live Recognition"
+                    if len(cameras) > 1:
+                        title += f" (camera {item['camera']})"
+                    cv2.imshow(title, frame)
+                    rendered += 1
+
+                except Exception as e:
+                    print(f"Error rendering frame: {str(e)}")
+
+            if time.time() - last_stats > STATS_INTERVAL:
+                last_stats = time.time()
+                render_stats = {
+                    'name': 'render', 'processed': rendered,
+                    'throughput': rendered / (time.perf_counter() - render_started),
+                    'utilization': 0.0, 'errors': 0,
+                    'queue_depth': render_queue.qsize(), 'dropped': render_queue.dropped,
+                }
+                print("\n" + format_stats([stage.stats() for stage in stages] + [render_stats]))
+                if pool is not None:
+                    pool_stats = pool.stats()
+                    print(f"Recognition workers: {pool_stats['workers']}, "
+                          f"in flight: {pool_stats['in_flight']}, "
+                          f"dropped: {pool_stats['dropped']}, errors: {pool_stats['errors']}")
+                sink_stats = attendance_sink.stats()
+                print(f"Attendance flushes: {sink_stats['flushes']}, "
+                      f"rows/flush: {sink_stats['avg_rows_per_flush']:.1f}, "
+                      f"flush latency: {sink_stats['avg_flush_ms']:.1f} ms, "
+                      f"pending: {sink_stats['pending']}")
+
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
-            
+
     except Exception as e:
         print(f"Camera error: {str(e)}")
     finally:
-        video_capture.release()
+        stop_event.set()
+        for stage in stages:
+            stage.join(timeout=2)
+        # Record sightings still queued when the attendance stage stopped
+        while True:
+            try:
+                attendance_sink.record(attendance_queue.get_nowait()[0])
+            except queue.Empty:
+                break
+        attendance_sink.stop()
+        recognizer.stop_model_watch()
+        if pool is not None:
+            pool.stop()
+        for video_capture in video_captures.values():
+            video_capture.release()
         cv2.destroyAllWindows()
         print("Camera stopped.")
 
 if __name__ == "__main__":
-    run_live_camera()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Live camera recognition and attendance")
+    parser.add_argument("cameras", type=int, nargs="*", default=[0], help="Camera indices, e.g. 0 1")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Recognition worker processes (0: recognize in this process)")
+    args = parser.parse_args()
+    run_live_camera(cameras=tuple(args.cameras), workers=args.workers)
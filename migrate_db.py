@@ -0,0 +1,241 @@
+import os
+import sqlite3
+import logging
+from datetime import datetime
+
+from db import get_connection, backup_database
+
+logger = logging.getLogger(__name__)
+
+# Schema version stored in PRAGMA user_version
+SCHEMA_VERSION = 4
+
+# Users v4: directory data only; face vectors live in the embeddings table
+USERS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id TEXT PRIMARY KEY,
+        name TEXT UNIQUE,
+        phone TEXT,
+        email TEXT
+    )
+"""
+
+# Attendance v2: one row per user per day, looked up through indexes
+ATTENDANCE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS attendance (
+        user_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        first_seen TEXT,
+        last_seen TEXT,
+        UNIQUE(user_id, day),
+        FOREIGN KEY(user_id) REFERENCES users(user_id)
+    )
+"""
+ATTENDANCE_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_attendance_day ON attendance(day)"
+
+# Insert a sighting or widen the existing row for that user and day
+ATTENDANCE_UPSERT_SQL = """
+    INSERT INTO attendance (user_id, day, first_seen, last_seen)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_id, day) DO UPDATE SET
+        first_seen = MIN(first_seen, excluded.first_seen),
+        last_seen = MAX(last_seen, excluded.last_seen)
+"""
+
+# Embeddings v3: any number of enrollment samples per user
+EMBEDDINGS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS embeddings (
+        id INTEGER PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        vector BLOB NOT NULL,
+        quality REAL,
+        source TEXT,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY(user_id) REFERENCES users(user_id)
+    )
+"""
+EMBEDDINGS_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_embeddings_user ON embeddings(user_id)"
+
+def create_users_table(cursor):
+    """Create the v4 users table if it does not exist."""
+    cursor.execute(USERS_TABLE_SQL)
+
+def create_attendance_table(cursor):
+    """Create the v2 attendance table and its indexes if they do not exist."""
+    cursor.execute(ATTENDANCE_TABLE_SQL)
+    cursor.execute(ATTENDANCE_INDEX_SQL)
+
+def create_embeddings_table(cursor):
+    """Create the v3 embeddings table and its index if they do not exist."""
+    cursor.execute(EMBEDDINGS_TABLE_SQL)
+    cursor.execute(EMBEDDINGS_INDEX_SQL)
+
+def _table_columns(cursor, table):
+    """Return the column names of a table, or an empty list if it does not exist."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [col[1] for col in cursor.fetchall()]
+
+def get_schema_version(cursor):
+    """Return the schema version of the database behind the cursor."""
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()[0]
+    if version:
+        return version
+
+    # Databases created before versioning: detect v2 from the columns
+    cursor.execute("PRAGMA table_info(attendance)")
+    columns = [col[1] for col in cursor.fetchall()]
+    if 'day' in columns:
+        return 2
+    return 1
+
+def migrate_attendance_v2(cursor):
+    """
+    Rebuild the attendance table with a day column and UNIQUE(user_id, day).
+
+    Existing rows are merged per user and day, keeping the earliest
+    first_seen and the latest last_seen.
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='attendance'")
+    if not cursor.fetchone():
+        create_attendance_table(cursor)
+        return 0
+
+    cursor.execute("ALTER TABLE attendance RENAME TO attendance_v1")
+    create_attendance_table(cursor)
+    cursor.execute("""
+        INSERT INTO attendance (user_id, day, first_seen, last_seen)
+        SELECT user_id, DATE(first_seen), MIN(first_seen), MAX(last_seen)
+        FROM attendance_v1
+        WHERE user_id IS NOT NULL AND first_seen IS NOT NULL
+        GROUP BY user_id, DATE(first_seen)
+    """)
+    migrated = cursor.rowcount
+    cursor.execute("DROP TABLE attendance_v1")
+    return migrated
+
+def migrate_embeddings_v3(cursor):
+    """
+    Create the embeddings table and copy each user's encoding into it as
+    their first enrollment sample.
+    """
+    create_embeddings_table(cursor)
+    if 'encoding' not in _table_columns(cursor, 'users'):
+        return 0
+
+    cursor.execute("""
+        INSERT INTO embeddings (user_id, vector, source, created_at)
+        SELECT user_id, encoding, 'users.encoding', datetime('now', 'localtime')
+        FROM users
+        WHERE user_id IS NOT NULL AND encoding IS NOT NULL
+    """)
+    return cursor.rowcount
+
+def migrate_users_v4(cursor):
+    """
+    Drop the encoding BLOB from the users table.
+
+    Encodings of users that have no enrollment sample yet are copied to the
+    embeddings table first, so no face data is lost.
+
+    Returns:
+        Number of encodings copied.
+    """
+    create_embeddings_table(cursor)
+    if 'encoding' not in _table_columns(cursor, 'users'):
+        return 0
+    if sqlite3.sqlite_version_info < (3, 35, 0):
+        raise RuntimeError(f"SQLite 3.35 or newer is required to drop users.encoding "
+                           f"(found {sqlite3.sqlite_version})")
+
+    cursor.execute("""
+        INSERT INTO embeddings (user_id, vector, source, created_at)
+        SELECT user_id, encoding, 'users.encoding', datetime('now', 'localtime')
+        FROM users
+        WHERE user_id IS NOT NULL AND encoding IS NOT NULL
+          AND user_id NOT IN (SELECT user_id FROM embeddings)
+    """)
+    copied = cursor.rowcount
+    cursor.execute("ALTER TABLE users DROP COLUMN encoding")
+    return copied
+
+def migrate_database(db_path="attendance.db", backup=True):
+    """
+    Migrate a database to the current schema version.
+
+    Args:
+        db_path: Path to the SQLite database.
+        backup: Copy the database to a timestamped backup file first.
+
+    Returns:
+        True if the database is at the current version, False on error.
+    """
+    try:
+        if not os.path.exists(db_path):
+            logger.error(f"Database file '{db_path}' not found.")
+            return False
+
+        conn = get_connection(db_path, check_schema=False)
+        cursor = conn.cursor()
+        version = get_schema_version(cursor)
+
+        if version >= SCHEMA_VERSION:
+            logger.info(f"Database is already at schema version {version}")
+            return True
+
+        if backup:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            backup_path = f"{os.path.splitext(db_path)[0]}_backup_{timestamp}.db"
+            backup_database(backup_path, db_path)
+            logger.info(f"Created database backup: {backup_path}")
+
+        try:
+            cursor.execute("BEGIN")
+            if version < 2:
+                migrated = migrate_attendance_v2(cursor)
+                logger.info(f"Migrated {migrated} attendance rows to schema v2")
+            if version < 3:
+                migrated = migrate_embeddings_v3(cursor)
+                logger.info(f"Copied {migrated} user encodings to the embeddings table")
+            if version < 4:
+                migrated = migrate_users_v4(cursor)
+                logger.info(f"Moved face encodings out of the users table ({migrated} copied)")
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        if version < 4:
+            # Give the pages freed by the dropped BLOBs back to the file system
+            cursor.execute("VACUUM")
+
+        logger.info(f"Database migrated to schema version {SCHEMA_VERSION}")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error migrating database: {e}")
+        return False
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "attendance.db"
+    print("Database Migration")
+    print(f"This will upgrade {db_path} to schema version {SCHEMA_VERSION}:")
+    print("- attendance gets an indexed day column")
+    print("- one row per user per day (UNIQUE(user_id, day))")
+    print("- duplicate rows for the same user and day are merged")
+    print("- face encodings move out of the users table into an embeddings table")
+    print("  with room for several samples per user")
+
+    response = input("\nContinue? (yes/no): ")
+
+    if response.lower() == 'yes':
+        if migrate_database(db_path):
+            print("\n✅ Database migrated successfully!")
+        else:
+            print("\n❌ Error migrating database. Check the logs above.")
+    else:
+        print("Operation cancelled.")
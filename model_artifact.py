@@ -0,0 +1,644 @@
+import os
+import sys
+import time
+import json
+import shutil
+import pickle
+import logging
+import numpy as np
+from datetime import datetime
+
+# Add the current directory to the path so we can import from the root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger("ModelArtifact")
+
+# Version of the on-disk layout written by save_artifact
+ARTIFACT_FORMAT = 1
+HEADER_FILE = "header.json"
+
+# Model kinds stored in the header's "engine" field
+ENGINE_SVC = "svc"
+ENGINE_LINEAR_SVC = "linear_svc"
+ENGINE_KNN = "knn"
+ENGINE_FOREST = "random_forest"
+
+# libsvm clips pairwise probabilities to this range
+_MIN_PROB = 1e-7
+
+# Largest dense (support vectors x class pairs) coefficient matrix an SVC
+# model builds for single-product scoring
+PAIR_COEF_MAX_BYTES = 64 * 1024 * 1024
+
+def is_artifact(path):
+    """Return True if path is an artifact directory."""
+    return os.path.isfile(os.path.join(path, HEADER_FILE))
+
+def _source_db_version(db_path):
+    """Schema version of the database the model was trained from, or None."""
+    try:
+        if not os.path.exists(db_path):
+            return None
+        from db import get_connection
+        from migrate_db import get_schema_version
+        return get_schema_version(get_connection(db_path).cursor())
+    except Exception as e:
+        logger.warning(f"Could not read database version: {e}")
+        return None
+
+def _labels_to_json(labels):
+    """Convert a label array to JSON-safe Python values."""
+    return [label.item() if hasattr(label, 'item') else label for label in labels]
+
+def save_artifact(path, engine, arrays, params=None, labels=None, user_names=None, db_path="attendance.db"):
+    """
+    Write an artifact directory: one .npy file per array plus header.json.
+
+    The directory is written under a temporary name and renamed into place,
+    so readers never see a partial artifact.
+
+    Args:
+        path: Artifact directory to create.
+        engine: Model kind, e.g. 'svc' or 'knn'.
+        arrays: Dict of name -> numpy array.
+        params: Dict of scalar model parameters stored in the header.
+        labels: Sequence of class labels (user IDs).
+        user_names: Optional dict of user_id -> name at training time.
+        db_path: Database whose schema version is recorded.
+
+    Returns:
+        path.
+    """
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    shapes = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(tmp_path, f"{name}.npy"), array, allow_pickle=False)
+        shapes[name] = list(array.shape)
+
+    embedding_arrays = [shape for name, shape in shapes.items() if len(shape) == 2]
+    header = {
+        'format': ARTIFACT_FORMAT,
+        'engine': engine,
+        'embedding_dim': embedding_arrays[0][1] if embedding_arrays else None,
+        'labels': _labels_to_json(labels) if labels is not None else [],
+        'user_names': {str(k): v for k, v in (user_names or {}).items()},
+        'trained_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'source_db_version': _source_db_version(db_path),
+        'params': params or {},
+        'arrays': shapes,
+    }
+    with open(os.path.join(tmp_path, HEADER_FILE), 'w') as f:
+        json.dump(header, f, indent=2)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return path
+
+def read_header(path):
+    """Read an artifact's header.json."""
+    with open(os.path.join(path, HEADER_FILE), 'r') as f:
+        return json.load(f)
+
+def load_arrays(path, header=None, mmap=True):
+    """
+    Open every array in an artifact.
+
+    Args:
+        path: Artifact directory.
+        header: Header from read_header(), read if None.
+        mmap: Memory-map the arrays instead of reading them.
+
+    Returns:
+        Dict of name -> numpy array.
+    """
+    header = header or read_header(path)
+    mode = 'r' if mmap else None
+    return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode, allow_pickle=False)
+            for name in header['arrays']}
+
+class _OneVsOneModel:
+    """
+    Shared voting and probability coupling for libsvm-style one-vs-one models.
+
+    Subclasses provide _pairwise_decisions(X), the decision value of every
+    class pair for every row, with pairs ordered (0,1), (0,2), ..., (1,2), ...
+    """
+
+    def _init_pairs(self):
+        n_classes = len(self.classes_)
+        self._pair_i, self._pair_j = np.triu_indices(n_classes, 1)
+        # One-hot maps from pair wins to class votes
+        self._wins_i = np.zeros((len(self._pair_i), n_classes))
+        self._wins_i[np.arange(len(self._pair_i)), self._pair_i] = 1
+        self._wins_j = np.zeros((len(self._pair_j), n_classes))
+        self._wins_j[np.arange(len(self._pair_j)), self._pair_j] = 1
+
+    def _vote(self, decisions):
+        positive = decisions > 0
+        votes = positive @ self._wins_i + ~positive @ self._wins_j
+        # argmax keeps the first class on a tie, as libsvm does
+        return self.classes_[votes.argmax(axis=1)]
+
+    def _probabilities(self, decisions):
+        if self.probA is None or len(self.probA) == 0:
+            raise AttributeError("predict_proba is not available when probability=False")
+        f = decisions * self.probA + self.probB
+        # libsvm's sigmoid_predict, 1 / (1 + exp(f)). Clipping f keeps exp from
+        # overflowing and changes nothing after the clip to [_MIN_PROB, 1 - _MIN_PROB]
+        pairwise = 1 / (1 + np.exp(np.clip(f, -40, 40)))
+        pairwise = np.clip(pairwise, _MIN_PROB, 1 - _MIN_PROB)
+
+        return _multiclass_probability(pairwise, self._pair_i, self._pair_j, self._wins_i, self._wins_j)
+
+    def predict(self, X):
+        return self._vote(self._pairwise_decisions(X))
+
+    def predict_proba(self, X):
+        return self._probabilities(self._pairwise_decisions(X))
+
+    def predict_scores(self, X):
+        """
+        Predict labels and class probabilities with one pass over the faces.
+
+        Returns:
+            Tuple (labels, probabilities) equal to (predict(X), predict_proba(X)).
+        """
+        decisions = self._pairwise_decisions(X)
+        return self._vote(decisions), self._probabilities(decisions)
+
+class SVCModel(_OneVsOneModel):
+    """
+    Pickle-free stand-in for a fitted sklearn SVC.
+
+    Reproduces libsvm's one-vs-one decision values, voting and pairwise
+    probability coupling from the exported support vectors.
+    """
+
+    def __init__(self, arrays, params, labels):
+        self.support_vectors_ = arrays['support_vectors']
+        self.dual_coef = arrays['dual_coef']
+        self.intercept = arrays['intercept']
+        self.n_support = arrays['n_support'].astype(np.int64)
+        self.probA = arrays.get('probA')
+        self.probB = arrays.get('probB')
+        self.classes_ = np.asarray(labels)
+        self.kernel = params['kernel']
+        self.gamma = params.get('gamma', 0.0)
+        self.coef0 = params.get('coef0', 0.0)
+        self.degree = params.get('degree', 3)
+        self._starts = np.concatenate([[0], np.cumsum(self.n_support)[:-1]])
+        self._dual_coef_t = np.ascontiguousarray(np.asarray(self.dual_coef, dtype=np.float64).T)
+        self._init_pairs()
+        self._pair_coef = self._build_pair_coef()
+
+    def _kernel(self, X):
+        sv = self.support_vectors_
+        if self.kernel == 'linear':
+            return X @ sv.T
+        if self.kernel == 'rbf':
+            sq = (X * X).sum(axis=1)[:, None] + (sv * sv).sum(axis=1)[None, :] - 2 * X @ sv.T
+            return np.exp(-self.gamma * np.maximum(sq, 0))
+        if self.kernel == 'poly':
+            return (self.gamma * X @ sv.T + self.coef0) ** self.degree
+        if self.kernel == 'sigmoid':
+            return np.tanh(self.gamma * X @ sv.T + self.coef0)
+        raise ValueError(f"Unsupported kernel: {self.kernel}")
+
+    def _pairwise_decisions(self, X):
+        """libsvm decision values, shape (n, k*(k-1)/2), pairs ordered (0,1), (0,2), ..."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        K = self._kernel(X)
+        if self._pair_coef is not None:
+            return K @ self._pair_coef + self.intercept
+        # blocks[:, c, m] sums class c's kernel values weighted by their m-th dual coefficient
+        blocks = np.add.reduceat(K[:, :, None] * self._dual_coef_t[None], self._starts, axis=1)
+        # Pair (i, j) combines class i's coefficients against j with class j's against i
+        return (blocks[:, self._pair_i, self._pair_j - 1] +
+                blocks[:, self._pair_j, self._pair_i] + self.intercept)
+
+    def _build_pair_coef(self):
+        """
+        Scatter the dual coefficients into one (support vectors x pairs) matrix,
+        so all decision values come from a single product with the kernel row.
+        Returns None when that matrix would exceed PAIR_COEF_MAX_BYTES.
+        """
+        n_sv = len(self._dual_coef_t)
+        if n_sv * len(self._pair_i) * 8 > PAIR_COEF_MAX_BYTES:
+            return None
+        owner = np.repeat(np.arange(len(self.classes_)), self.n_support)
+        pair_coef = np.zeros((n_sv, len(self._pair_i)))
+        for p, (i, j) in enumerate(zip(self._pair_i, self._pair_j)):
+            rows_i = owner == i
+            rows_j = owner == j
+            pair_coef[rows_i, p] = self._dual_coef_t[rows_i, j - 1]
+            pair_coef[rows_j, p] = self._dual_coef_t[rows_j, i]
+        return pair_coef
+
+class LinearSVCModel(_OneVsOneModel):
+    """
+    Linear SVC compiled to one weight vector per class pair.
+
+    All decision values for a frame come from a single matrix product,
+    followed by vectorized voting and Platt calibration, instead of a kernel
+    evaluation against every support vector.
+    """
+
+    def __init__(self, arrays, params, labels):
+        self.coef = arrays['coef']
+        self.intercept = arrays['intercept']
+        self.probA = arrays.get('probA')
+        self.probB = arrays.get('probB')
+        self.classes_ = np.asarray(labels)
+        self._init_pairs()
+
+    def _pairwise_decisions(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        return X @ self.coef.T + self.intercept
+
+def compile_linear_svc(arrays):
+    """
+    Fold the support vectors of a linear SVC into per-pair weight vectors.
+
+    For the pair (i, j) the decision value is sum(alpha * <sv, x>) + b over the
+    support vectors of both classes, which equals <w, x> + b with w the
+    alpha-weighted sum of those support vectors.
+
+    Args:
+        arrays: Dict with support_vectors, dual_coef, intercept, n_support and
+            optionally probA/probB, as exported for a linear SVC.
+
+    Returns:
+        Dict with coef of shape (k*(k-1)/2, dim), intercept and probA/probB.
+    """
+    sv = np.asarray(arrays['support_vectors'], dtype=np.float64)
+    dual_coef = np.asarray(arrays['dual_coef'], dtype=np.float64)
+    n_support = np.asarray(arrays['n_support'], dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(n_support)[:-1]])
+    n_classes = len(n_support)
+
+    coef = []
+    for i in range(n_classes):
+        for j in range(i + 1, n_classes):
+            si, sj = starts[i], starts[j]
+            ci, cj = n_support[i], n_support[j]
+            coef.append(dual_coef[j - 1, si:si + ci] @ sv[si:si + ci] +
+                        dual_coef[i, sj:sj + cj] @ sv[sj:sj + cj])
+    compiled = {
+        'coef': np.stack(coef) if coef else np.zeros((0, sv.shape[1])),
+        'intercept': np.asarray(arrays['intercept'], dtype=np.float64),
+    }
+    for name in ('probA', 'probB'):
+        if arrays.get(name) is not None:
+            compiled[name] = np.asarray(arrays[name], dtype=np.float64)
+    return compiled
+
+def _multiclass_probability(pairwise, pair_i, pair_j, wins_i, wins_j):
+    """
+    Pairwise coupling (Wu, Lin and Weng, method 2) for every face at once.
+
+    libsvm minimizes p'Qp subject to sum(p) = 1 iteratively, per sample,
+    until it is within its stopping tolerance. Here the same problem is
+    solved exactly through its optimality conditions, Qp + b*e = 0 and
+    e'p = 1, with one batched solve of the bordered (k+1) x (k+1) system for
+    all faces; the result agrees with sklearn's predict_proba to within
+    libsvm's tolerance. Q alone is singular whenever the pairwise estimates
+    are consistent, so it is never inverted. Two classes have the closed
+    form p = [r, 1 - r].
+
+    Args:
+        pairwise: Array (n, pairs) of P(i | i or j) for each pair (i, j).
+        pair_i, pair_j: Class indices of each pair.
+        wins_i, wins_j: One-hot (pairs, k) maps from a pair to its classes.
+
+    Returns:
+        Array of shape (n, k).
+    """
+    n, k = len(pairwise), wins_i.shape[1]
+    if k == 2:
+        return np.stack([pairwise[:, 0], 1 - pairwise[:, 0]], axis=1)
+
+    # With r[i, j] = pairwise and r[j, i] = 1 - pairwise:
+    # Q[i, j] = -r[i, j] * r[j, i] and Q[i, i] = sum over t of r[t, i]^2
+    A = np.zeros((n, k + 1, k + 1))
+    cross = -pairwise * (1 - pairwise)
+    A[:, pair_i, pair_j] = cross
+    A[:, pair_j, pair_i] = cross
+    diagonal = np.arange(k)
+    A[:, diagonal, diagonal] = (1 - pairwise) ** 2 @ wins_i + pairwise ** 2 @ wins_j
+    # Border Q with the sum(p) = 1 constraint
+    A[:, :k, k] = 1
+    A[:, k, :k] = 1
+    rhs = np.zeros((n, k + 1, 1))
+    rhs[:, k] = 1
+    p = np.linalg.solve(A, rhs)[:, :k, 0]
+    p = np.maximum(p, 0)
+    return p / p.sum(axis=1, keepdims=True)
+
+class KNNModel:
+    """Pickle-free stand-in for a fitted sklearn KNeighborsClassifier (uniform weights, Euclidean)."""
+
+    def __init__(self, arrays, params, labels):
+        self.fit_X = arrays['fit_X']
+        self.fit_y = arrays['fit_y'].astype(np.int64)
+        self.n_neighbors = params['n_neighbors']
+        self.classes_ = np.asarray(labels)
+        # Distances are computed in float64 like sklearn; convert the gallery once, not per call
+        self._fit_X = np.asarray(self.fit_X, dtype=np.float64)
+        self._fit_sq = (self._fit_X ** 2).sum(axis=1)
+        self._one_hot = np.eye(len(self.classes_))
+
+    def kneighbors(self, X, n_neighbors=None, return_distance=True):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        k = min(n_neighbors or self.n_neighbors, len(self._fit_sq))
+        sq = (X * X).sum(axis=1)[:, None] + self._fit_sq[None, :] - 2 * X @ self._fit_X.T
+        # Select the k nearest without sorting the whole gallery, as sklearn's brute force does
+        indices = np.argpartition(sq, k - 1, axis=1)[:, :k]
+        nearest = np.take_along_axis(sq, indices, axis=1)
+        order = np.argsort(nearest, axis=1)
+        indices = np.take_along_axis(indices, order, axis=1)
+        if return_distance:
+            distances = np.sqrt(np.maximum(np.take_along_axis(nearest, order, axis=1), 0))
+            return distances, indices
+        return indices
+
+    def predict_proba(self, X):
+        indices = self.kneighbors(X, return_distance=False)
+        votes = self._one_hot[self.fit_y[indices]].sum(axis=1)
+        return votes / indices.shape[1]
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def predict_scores(self, X):
+        """
+        Predict labels and class probabilities with one neighbour search.
+
+        Returns:
+            Tuple (labels, probabilities) equal to (predict(X), predict_proba(X)).
+        """
+        probabilities = self.predict_proba(X)
+        return self.classes_[probabilities.argmax(axis=1)], probabilities
+
+class ForestModel:
+    """Pickle-free stand-in for a fitted sklearn RandomForestClassifier."""
+
+    def __init__(self, arrays, params, labels):
+        self.left = arrays['children_left']
+        self.right = arrays['children_right']
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.classes_ = np.asarray(labels)
+
+    def predict_proba(self, X):
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        rows = np.arange(len(X))
+        total = np.zeros((len(X), len(self.classes_)))
+        for root in self.roots:
+            node = np.full(len(X), root, dtype=np.int64)
+            active = self.left[node] != -1
+            while active.any():
+                current = node[active]
+                go_left = X[rows[active], self.feature[current]] <= self.threshold[current]
+                node[active] = np.where(go_left, self.left[current], self.right[current])
+                active = self.left[node] != -1
+            leaf = self.value[node]
+            total += leaf / leaf.sum(axis=1, keepdims=True)
+        return total / len(self.roots)
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def predict_scores(self, X):
+        """Return (predict(X), predict_proba(X)) from one pass over the trees."""
+        probabilities = self.predict_proba(X)
+        return self.classes_[probabilities.argmax(axis=1)], probabilities
+
+_MODEL_CLASSES = {ENGINE_SVC: SVCModel, ENGINE_LINEAR_SVC: LinearSVCModel,
+                  ENGINE_KNN: KNNModel, ENGINE_FOREST: ForestModel}
+
+def export_classifier(classifier):
+    """
+    Pull the arrays and parameters out of a fitted sklearn classifier.
+
+    Returns:
+        Tuple (engine, arrays, params, labels).
+    """
+    kind = type(classifier).__name__
+    labels = classifier.classes_
+
+    if kind == 'SVC':
+        # libsvm's raw coefficients; sklearn flips the public ones for two classes
+        dual_coef = getattr(classifier, '_dual_coef_', classifier.dual_coef_)
+        intercept = getattr(classifier, '_intercept_', classifier.intercept_)
+        arrays = {
+            'support_vectors': np.asarray(classifier.support_vectors_, dtype=np.float64),
+            'dual_coef': np.asarray(dual_coef, dtype=np.float64),
+            'intercept': np.asarray(intercept, dtype=np.float64),
+            'n_support': np.asarray(classifier.n_support_, dtype=np.int64),
+        }
+        if getattr(classifier, 'probability', False):
+            arrays['probA'] = np.asarray(classifier.probA_, dtype=np.float64)
+            arrays['probB'] = np.asarray(classifier.probB_, dtype=np.float64)
+        params = {
+            'kernel': classifier.kernel,
+            'gamma': float(getattr(classifier, '_gamma', 0.0)),
+            'coef0': float(classifier.coef0),
+            'degree': int(classifier.degree),
+        }
+        if params['kernel'] == 'linear':
+            # One weight vector per pair: a single product scores every pair
+            return ENGINE_LINEAR_SVC, compile_linear_svc(arrays), {'kernel': 'linear'}, labels
+        return ENGINE_SVC, arrays, params, labels
+
+    if kind == 'KNeighborsClassifier':
+        if classifier.weights != 'uniform' or classifier.effective_metric_ != 'euclidean':
+            raise ValueError("Only uniform-weight Euclidean KNN models can be exported")
+        arrays = {
+            'fit_X': np.asarray(classifier._fit_X, dtype=np.float32),
+            'fit_y': np.asarray(classifier._y, dtype=np.int64),
+        }
+        return ENGINE_KNN, arrays, {'n_neighbors': int(classifier.n_neighbors)}, labels
+
+    if kind == 'RandomForestClassifier':
+        left, right, feature, threshold, value, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in classifier.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == -1
+            left.append(np.where(is_leaf, -1, tree.children_left + offset))
+            right.append(np.where(is_leaf, -1, tree.children_right + offset))
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+            value.append(tree.value[:, 0, :])
+            roots.append(offset)
+            offset += tree.node_count
+        arrays = {
+            'children_left': np.concatenate(left).astype(np.int64),
+            'children_right': np.concatenate(right).astype(np.int64),
+            'feature': np.concatenate(feature).astype(np.int64),
+            'threshold': np.concatenate(threshold).astype(np.float64),
+            'value': np.concatenate(value).astype(np.float64),
+            'roots': np.asarray(roots, dtype=np.int64),
+        }
+        return ENGINE_FOREST, arrays, {'n_estimators': len(roots)}, labels
+
+    raise ValueError(f"Cannot export classifier of type {kind}")
+
+def save_classifier_artifact(classifier, path, user_names=None, db_path="attendance.db"):
+    """
+    Save a fitted sklearn classifier as an artifact directory.
+
+    Returns:
+        path.
+    """
+    engine, arrays, params, labels = export_classifier(classifier)
+    params['classifier'] = type(classifier).__name__
+    return save_artifact(path, engine, arrays, params=params, labels=labels,
+                         user_names=user_names, db_path=db_path)
+
+def load_classifier_artifact(path, mmap=True):
+    """
+    Load a classifier artifact without unpickling anything.
+
+    Returns:
+        Model object with predict, predict_proba, predict_scores and classes_
+        (plus kneighbors for KNN).
+    """
+    header = read_header(path)
+    if header['format'] > ARTIFACT_FORMAT:
+        raise ValueError(f"Artifact format {header['format']} is newer than supported ({ARTIFACT_FORMAT})")
+    model_class = _MODEL_CLASSES.get(header['engine'])
+    if model_class is None:
+        raise ValueError(f"Artifact {path} is not a classifier ({header['engine']})")
+    arrays = load_arrays(path, header, mmap=mmap)
+    if model_class is SVCModel and header['params'].get('kernel') == 'linear':
+        # Linear SVC artifacts written before every linear SVC was compiled at export
+        model_class = LinearSVCModel
+        arrays = compile_linear_svc(arrays)
+    model = model_class(arrays, header['params'], header['labels'])
+    model.header = header
+    return model
+
+def convert_pickle(pickle_path, user_names=None, remove_pickle=False):
+    """
+    Convert a pickled classifier to an artifact directory next to it.
+
+    Args:
+        pickle_path: Path to the .pkl file.
+        user_names: Optional dict of user_id -> name to record.
+        remove_pickle: Delete the pickle after converting.
+
+    Returns:
+        Path to the artifact directory.
+    """
+    with open(pickle_path, 'rb') as f:
+        classifier = pickle.load(f)
+    artifact_path = os.path.splitext(pickle_path)[0]
+    save_classifier_artifact(classifier, artifact_path, user_names=user_names)
+    logger.info(f"Converted {pickle_path} to {artifact_path}")
+    if remove_pickle:
+        os.remove(pickle_path)
+    return artifact_path
+
+def load_model(path, mmap=True):
+    """
+    Load a classifier from an artifact, converting a legacy pickle on first use.
+
+    A pickle is converted once; the manifest entry that pointed at it is moved
+    to the new artifact so later loads skip the pickle entirely.
+
+    Args:
+        path: Artifact directory or legacy .pkl file.
+        mmap: Memory-map the arrays.
+
+    Returns:
+        Tuple (model, artifact_path).
+    """
+    if path.endswith(".pkl"):
+        artifact_path = os.path.splitext(path)[0]
+        if not is_artifact(artifact_path):
+            artifact_path = convert_pickle(path)
+        from model_registry import replace_model_file
+        replace_model_file(path, artifact_path)
+        path = artifact_path
+    return load_classifier_artifact(path, mmap=mmap), path
+
+def benchmark(n_classes=10, samples_per_class=5, n_faces=15, dim=512, repeats=200, seed=0):
+    """
+    Compare predict_scores with sklearn's predict + predict_proba for the
+    classifier train_face_classifier fits, SVC(kernel='linear', probability=True).
+
+    Faces are noisy copies of training samples drawn from synthetic,
+    L2-normalized identities.
+
+    Returns:
+        Dict with sklearn_ms and artifact_ms (mean milliseconds per frame of
+        n_faces), speedup, max_prob_diff and labels_match.
+    """
+    from sklearn.svm import SVC
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_classes, dim))
+    X = np.concatenate([c + rng.standard_normal((samples_per_class, dim)) for c in centers])
+    X /= np.linalg.norm(X, axis=1, keepdims=True)
+    y = np.repeat([f"S{101 + i}" for i in range(n_classes)], samples_per_class)
+    classifier = SVC(kernel='linear', probability=True, random_state=seed).fit(X, y)
+
+    engine, arrays, params, labels = export_classifier(classifier)
+    model = _MODEL_CLASSES[engine](arrays, params, labels)
+    faces = X[rng.choice(len(X), n_faces)] + 0.01 * rng.standard_normal((n_faces, dim))
+
+    def per_frame_ms(score):
+        score()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            score()
+        return (time.perf_counter() - start) * 1000 / repeats
+
+    sklearn_ms = per_frame_ms(lambda: (classifier.predict(faces), classifier.predict_proba(faces)))
+    artifact_ms = per_frame_ms(lambda: model.predict_scores(faces))
+    predicted, probs = model.predict_scores(faces)
+    return {
+        'sklearn_ms': sklearn_ms,
+        'artifact_ms': artifact_ms,
+        'speedup': sklearn_ms / artifact_ms,
+        'max_prob_diff': float(np.abs(probs - classifier.predict_proba(faces)).max()),
+        'labels_match': bool(np.array_equal(predicted, classifier.predict(faces))),
+    }
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Benchmark artifact scoring against sklearn")
+    parser.add_argument("command", choices=["benchmark"])
+    parser.add_argument("--classes", type=int, nargs="+", default=[2, 10, 50])
+    parser.add_argument("--samples-per-class", type=int, default=5)
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 15])
+    args = parser.parse_args()
+
+    print(f"{'Classes':<8} {'Faces':<6} {'sklearn ms':<11} {'Artifact ms':<12} {'Speedup':<8} {'Max |dp|':<9} {'Labels':<6}")
+    print("-" * 66)
+    for n_classes in args.classes:
+        for n_faces in args.faces:
+            result = benchmark(n_classes, args.samples_per_class, n_faces)
+            print(f"{n_classes:<8} {n_faces:<6} {result['sklearn_ms']:<11.3f} {result['artifact_ms']:<12.3f} "
+                  f"{result['speedup']:<8.1f} {result['max_prob_diff']:<9.1e} "
+                  f"{'same' if result['labels_match'] else 'DIFF':<6}")
@@ -0,0 +1,265 @@
+import os
+import sys
+import json
+import shutil
+import time
+import logging
+from datetime import datetime
+from contextlib import contextmanager
+
+# Add the current directory to the path so we can import from the root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger("ModelRegistry")
+
+MODELS_DIR = "models"
+MANIFEST_PATH = os.path.join(MODELS_DIR, "manifest.json")
+
+# Number of published model versions kept on disk, including the current one
+DEFAULT_KEEP_VERSIONS = 5
+
+# Seconds after which a leftover lock file from a crashed writer is ignored
+LOCK_TIMEOUT = 10.0
+
+# Filename prefixes of classifiers saved before the manifest existed
+LEGACY_MODEL_PREFIXES = ("face_classifier_", "face_recognition_svm_", "face_recognition_knn_")
+
+@contextmanager
+def file_lock(path):
+    """Serialize writers of path across processes with an exclusive lock file."""
+    lock_path = path + ".lock"
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                logger.warning(f"Removing stale lock {lock_path}")
+                try:
+                    os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+                deadline = time.monotonic() + LOCK_TIMEOUT
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+def read_manifest(manifest_path=MANIFEST_PATH):
+    """
+    Read the model manifest.
+
+    Returns:
+        Dict with 'current' (version number) and 'versions' (list of entries
+        with version, file, created and any extra metadata), or None if there
+        is no readable manifest.
+    """
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Error reading model manifest: {str(e)}")
+        return None
+
+def _write_manifest(manifest, manifest_path):
+    """Replace the manifest atomically so readers see the old or the new one."""
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, manifest_path)
+
+def publish_model(model_path, metadata=None, keep=DEFAULT_KEEP_VERSIONS, manifest_path=MANIFEST_PATH):
+    """
+    Register a saved model file as the new current version.
+
+    The model file must already be complete on disk. Versions beyond the
+    newest `keep` are dropped from the manifest and their files deleted.
+
+    Args:
+        model_path: Path to the model file, inside the manifest's directory.
+        metadata: Optional dict stored with the version (e.g. classifier_type).
+        keep: Number of versions to retain, including the new one.
+        manifest_path: Path to the manifest file.
+
+    Returns:
+        The new version number, or None on error.
+    """
+    try:
+        models_dir = os.path.dirname(manifest_path)
+        os.makedirs(models_dir, exist_ok=True)
+
+        with file_lock(manifest_path):
+            manifest = read_manifest(manifest_path) or {'current': None, 'versions': []}
+            versions = manifest['versions']
+            version = max((entry['version'] for entry in versions), default=0) + 1
+
+            entry = {
+                'version': version,
+                'file': os.path.relpath(model_path, models_dir),
+                'created': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            entry.update(metadata or {})
+            versions.append(entry)
+            manifest['current'] = version
+
+            retired = versions[:-keep] if keep > 0 else []
+            manifest['versions'] = versions[len(retired):]
+            _write_manifest(manifest, manifest_path)
+
+        logger.info(f"Published model version {version}: {model_path}")
+
+        # Delete retired files only after the manifest no longer points at them
+        for old in retired:
+            old_path = os.path.join(models_dir, old['file'])
+            try:
+                if os.path.isdir(old_path):
+                    shutil.rmtree(old_path)
+                else:
+                    os.remove(old_path)
+                logger.info(f"Removed model version {old['version']}: {old_path}")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"Could not remove {old_path}: {e}")
+
+        return version
+
+    except Exception as e:
+        logger.error(f"Error publishing model: {str(e)}")
+        return None
+
+def find_latest_model_file(models_dir=MODELS_DIR):
+    """
+    Find the newest classifier by modification time (pre-manifest layout).
+
+    Artifact directories are preferred over a pickle with the same name.
+    """
+    if not os.path.exists(models_dir):
+        logger.warning(f"Models directory '{models_dir}' not found.")
+        return None
+
+    names = set(os.listdir(models_dir))
+    model_files = [f for f in names
+                   if f.startswith(LEGACY_MODEL_PREFIXES) and not f.endswith((".tmp", ".lock"))
+                   and (os.path.isfile(os.path.join(models_dir, f, "header.json"))
+                        or (f.endswith(".pkl") and f[:-4] not in names))]
+    if not model_files:
+        logger.warning("No model files found.")
+        return None
+
+    model_files.sort(key=lambda x: os.path.getmtime(os.path.join(models_dir, x)), reverse=True)
+    return os.path.join(models_dir, model_files[0])
+
+def replace_model_file(old_path, new_path, manifest_path=MANIFEST_PATH):
+    """
+    Point manifest entries for old_path at new_path (e.g. after a format conversion).
+
+    Returns:
+        True if the manifest was changed, False otherwise.
+    """
+    if read_manifest(manifest_path) is None:
+        return False
+    models_dir = os.path.dirname(manifest_path)
+    old_file = os.path.relpath(old_path, models_dir)
+    new_file = os.path.relpath(new_path, models_dir)
+    with file_lock(manifest_path):
+        manifest = read_manifest(manifest_path)
+        changed = False
+        for entry in manifest['versions']:
+            if entry['file'] == old_file:
+                entry['file'] = new_file
+                changed = True
+        if changed:
+            _write_manifest(manifest, manifest_path)
+    return changed
+
+def current_model(manifest_path=MANIFEST_PATH):
+    """
+    Get the current model version and path.
+
+    Falls back to the newest model file when no manifest has been written yet.
+
+    Returns:
+        Tuple (version, path). version is None for the fallback; path is None
+        if there is no model at all.
+    """
+    manifest = read_manifest(manifest_path)
+    if manifest and manifest.get('current') is not None:
+        for entry in manifest['versions']:
+            if entry['version'] == manifest['current']:
+                return entry['version'], os.path.join(os.path.dirname(manifest_path), entry['file'])
+    return None, find_latest_model_file(os.path.dirname(manifest_path))
+
+def manifest_stamp(manifest_path=MANIFEST_PATH):
+    """
+    Cheap change marker for polling the manifest.
+
+    Returns:
+        Tuple (inode, mtime_ns) that changes on every atomic rewrite, or None
+        if there is no manifest.
+    """
+    try:
+        stat = os.stat(manifest_path)
+        return stat.st_ino, stat.st_mtime_ns
+    except OSError:
+        return None
+
+def list_versions(manifest_path=MANIFEST_PATH):
+    """Return the retained version entries, oldest first."""
+    manifest = read_manifest(manifest_path)
+    return manifest['versions'] if manifest else []
+
+def rollback(version, manifest_path=MANIFEST_PATH):
+    """
+    Make a retained older version current again.
+
+    Returns:
+        True if successful, False otherwise.
+    """
+    try:
+        with file_lock(manifest_path):
+            manifest = read_manifest(manifest_path)
+            if not manifest or all(entry['version'] != version for entry in manifest['versions']):
+                logger.error(f"Model version {version} is not retained")
+                return False
+            manifest['current'] = version
+            _write_manifest(manifest, manifest_path)
+        logger.info(f"Model version {version} is now current")
+        return True
+    except Exception as e:
+        logger.error(f"Error rolling back model: {str(e)}")
+        return False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    manifest = read_manifest()
+    if not manifest:
+        print("No model manifest found.")
+        version, path = current_model()
+        print(f"Latest model file: {path}")
+    else:
+        print(f"Current version: {manifest['current']}")
+        for entry in manifest['versions']:
+            marker = "*" if entry['version'] == manifest['current'] else " "
+            print(f"{marker} v{entry['version']}  {entry['created']}  {entry['file']}")
+
+        if len(sys.argv) > 2 and sys.argv[1] == "rollback":
+            version = int(sys.argv[2])
+            response = input(f"\nMake version {version} current? (yes/no): ")
+            if response.lower() == 'yes':
+                if rollback(version):
+                    print("\n✅ Rollback complete. Running recognizers will switch on their next check.")
+                else:
+                    print("\n❌ Rollback failed. Check the logs above.")
+            else:
+                print("Operation cancelled.")
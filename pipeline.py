@@ -0,0 +1,163 @@
+import time
+import queue
+import threading
+import logging
+
+logger = logging.getLogger("Pipeline")
+
+class DropOldestQueue:
+    """Bounded queue that discards its oldest item instead of blocking the producer."""
+
+    def __init__(self, maxsize):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.maxsize = maxsize
+        self.dropped = 0
+
+    def put(self, item):
+        """Add an item, dropping the oldest one if the queue is full."""
+        with self._lock:
+            while True:
+                try:
+                    self._queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self._queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def get(self, timeout=None):
+        """Remove and return the next item. Raises queue.Empty on timeout."""
+        return self._queue.get(timeout=timeout)
+
+    def get_batch(self, max_items, timeout=None):
+        """
+        Remove up to max_items items: wait for the first, then take whatever
+        else is already queued. Raises queue.Empty on timeout.
+        """
+        items = [self._queue.get(timeout=timeout)]
+        while len(items) < max_items:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def qsize(self):
+        return self._queue.qsize()
+
+class PipelineStage(threading.Thread):
+    """
+    One stage of a threaded pipeline.
+
+    The stage takes items from its input queue, calls func(item) and puts the
+    result on its output queue. A stage without an input queue is a source and
+    calls func() in a loop. Results of None are not forwarded.
+    """
+
+    def __init__(self, name, func, input_queue=None, output_queue=None, stop_event=None):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.stop_event = stop_event or threading.Event()
+        self.processed = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.started_at = None
+
+    def run(self):
+        self.started_at = time.perf_counter()
+        while not self.stop_event.is_set():
+            if self.input_queue is not None:
+                try:
+                    item = self.input_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+            start = time.perf_counter()
+            try:
+                result = self.func(item) if self.input_queue is not None else self.func()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error in pipeline stage {self.name}: {str(e)}")
+                continue
+            finally:
+                self.busy_time += time.perf_counter() - start
+
+            if result is None:
+                continue
+            self.processed += 1
+            if self.output_queue is not None:
+                self.output_queue.put(result)
+
+    def stats(self):
+        """
+        Get throughput statistics for this stage.
+
+        Returns:
+            Dict with name, processed, throughput (items per second since start),
+            utilization (fraction of time spent in func), errors, and the depth
+            and drop count of the input queue.
+        """
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        return {
+            'name': self.name,
+            'processed': self.processed,
+            'throughput': self.processed / elapsed if elapsed > 0 else 0.0,
+            'utilization': self.busy_time / elapsed if elapsed > 0 else 0.0,
+            'errors': self.errors,
+            'queue_depth': self.input_queue.qsize() if self.input_queue is not None else 0,
+            'dropped': getattr(self.input_queue, 'dropped', 0),
+        }
+
+class BatchPipelineStage(PipelineStage):
+    """
+    Pipeline stage that processes the items waiting in its input queue together.
+
+    func receives a list of up to max_batch items and returns a list of
+    results in the same order; each result that is not None is forwarded.
+    The stage never waits for a batch to fill, so it adds no latency when
+    only one item is queued.
+    """
+
+    def __init__(self, name, func, input_queue, output_queue=None, stop_event=None, max_batch=8):
+        super().__init__(name, func, input_queue, output_queue, stop_event)
+        self.max_batch = max_batch
+        self.batches = 0
+
+    def run(self):
+        self.started_at = time.perf_counter()
+        while not self.stop_event.is_set():
+            try:
+                items = self.input_queue.get_batch(self.max_batch, timeout=0.1)
+            except queue.Empty:
+                continue
+
+            start = time.perf_counter()
+            try:
+                results = self.func(items)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error in pipeline stage {self.name}: {str(e)}")
+                continue
+            finally:
+                self.busy_time += time.perf_counter() - start
+
+            self.batches += 1
+            for result in results:
+                if result is None:
+                    continue
+                self.processed += 1
+                if self.output_queue is not None:
+                    self.output_queue.put(result)
+
+def format_stats(stats_list):
+    """Format stage statistics as a small table for console output."""
+    lines = [f"{'Stage':<12} {'Items':<8} {'Items/s':<9} {'Busy':<6} {'Queue':<6} {'Dropped':<8}"]
+    for stats in stats_list:
+        lines.append(f"{stats['name']:<12} {stats['processed']:<8} {stats['throughput']:<9.1f} "
+                     f"{stats['utilization']:<6.0%} {stats['queue_depth']:<6} {stats['dropped']:<8}")
+    return "\n".join(lines)
@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+import logging
+import numpy as np
+
+# Add the current directory to the path so we can import from the root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from face_models import INFERENCE_PROFILES, get_face_app, get_profile
+from image_io import load_image
+
+logger = logging.getLogger("ProfileBenchmark")
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def load_dataset(image_dir, max_per_person=None):
+    """
+    Read a labelled benchmark set laid out as <image_dir>/<person>/<image>.
+
+    Args:
+        image_dir: Directory with one sub-directory of photos per person.
+        max_per_person: Optional cap on the photos used per person.
+
+    Returns:
+        List of (person, image) pairs with images as BGR arrays; unreadable
+        files are skipped.
+    """
+    dataset = []
+    for person in sorted(os.listdir(image_dir)):
+        person_dir = os.path.join(image_dir, person)
+        if not os.path.isdir(person_dir):
+            continue
+        filenames = sorted(f for f in os.listdir(person_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+        for filename in filenames[:max_per_person]:
+            image = load_image(os.path.join(person_dir, filename))
+            if image is None:
+                logger.warning(f"Could not read {os.path.join(person_dir, filename)}")
+                continue
+            dataset.append((person, image))
+    return dataset
+
+def evaluate(app, dataset):
+    """
+    Measure latency and identification accuracy of one FaceAnalysis app.
+
+    Each image goes through app.get, as enrollment and recognition do, and
+    the largest face is kept. Accuracy is leave-one-out rank-1 identification:
+    every embedded photo of a person with at least two embedded photos is
+    matched by cosine similarity against all other photos.
+
+    Args:
+        app: Prepared FaceAnalysis instance.
+        dataset: List of (person, BGR image) pairs from load_dataset.
+
+    Returns:
+        Dict with images, detection_rate, mean_ms, p95_ms, rank1 (None when no
+        person has two photos) and probes.
+    """
+    # The first run allocates the session buffers; keep it out of the timings
+    app.get(dataset[0][1])
+
+    latencies = []
+    labels = []
+    embeddings = []
+    for person, image in dataset:
+        start = time.perf_counter()
+        faces = app.get(image)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if not faces:
+            continue
+        face = max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+        labels.append(person)
+        embeddings.append(face.normed_embedding)
+
+    rank1 = None
+    probes = 0
+    if embeddings:
+        labels = np.array(labels)
+        embeddings = np.stack(embeddings).astype(np.float32)
+        similarity = embeddings @ embeddings.T
+        np.fill_diagonal(similarity, -np.inf)
+        people, per_person = np.unique(labels, return_counts=True)
+        probe_mask = np.isin(labels, people[per_person > 1])
+        probes = int(probe_mask.sum())
+        if probes:
+            best = similarity[probe_mask].argmax(axis=1)
+            rank1 = float(np.mean(labels[best] == labels[probe_mask]))
+
+    return {
+        'images': len(dataset),
+        'detection_rate': len(embeddings) / len(dataset),
+        'mean_ms': float(np.mean(latencies)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'rank1': rank1,
+        'probes': probes,
+    }
+
+def benchmark_profiles(image_dir, profiles=None, max_per_person=None):
+    """
+    Evaluate every inference profile on the same labelled photos.
+
+    Args:
+        image_dir: Benchmark set laid out as <image_dir>/<person>/<image>.
+        profiles: Profile names to run. Defaults to all of them.
+        max_per_person: Optional cap on the photos used per person.
+
+    Returns:
+        List of result dicts from evaluate, each with profile, name, det_size
+        and load_s added. Profiles that fail to load are reported with error.
+    """
+    dataset = load_dataset(image_dir, max_per_person)
+    if not dataset:
+        logger.error(f"No images found in {image_dir}")
+        return []
+    logger.info(f"Benchmarking on {len(dataset)} images of {len({p for p, _ in dataset})} people")
+
+    results = []
+    for profile in profiles or INFERENCE_PROFILES:
+        settings = get_profile(profile)
+        result = {'profile': profile, 'name': settings['name'], 'det_size': settings['det_size']}
+        try:
+            start = time.perf_counter()
+            app = get_face_app(profile=profile)
+            result['load_s'] = time.perf_counter() - start
+            result.update(evaluate(app, dataset))
+        except Exception as e:
+            logger.error(f"Profile {profile} failed: {e}")
+            result['error'] = str(e)
+        results.append(result)
+    return results
+
+def format_results(results):
+    """Format benchmark results as a table for console output."""
+    lines = [f"{'Profile':<10} {'Pack':<11} {'Det size':<9} {'Load s':<7} {'Mean ms':<8} "
+             f"{'P95 ms':<8} {'Detected':<9} {'Rank-1':<7}"]
+    for result in results:
+        det_size = 'x'.join(str(size) for size in result['det_size'])
+        if 'error' in result:
+            lines.append(f"{result['profile']:<10} {result['name']:<11} {det_size:<9} failed: {result['error']}")
+            continue
+        rank1 = f"{result['rank1']:.3f}" if result['rank1'] is not None else "-"
+        lines.append(f"{result['profile']:<10} {result['name']:<11} {det_size:<9} {result['load_s']:<7.2f} "
+                     f"{result['mean_ms']:<8.1f} {result['p95_ms']:<8.1f} "
+                     f"{result['detection_rate']:<9.1%} {rank1:<7}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Compare latency and accuracy of the inference profiles")
+    parser.add_argument("image_dir", help="Labelled photos laid out as <image_dir>/<person>/<image>")
+    parser.add_argument("--profiles", nargs="+", choices=list(INFERENCE_PROFILES),
+                        help="Profiles to run (default: all)")
+    parser.add_argument("--max-per-person", type=int, default=None,
+                        help="Use at most this many photos per person")
+    args = parser.parse_args()
+
+    results = benchmark_profiles(args.image_dir, args.profiles, args.max_per_person)
+    if results:
+        print()
+        print(format_results(results))
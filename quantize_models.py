@@ -0,0 +1,427 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import numpy as np
+import cv2
+
+# Add the current directory to the path so we can import from the root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from face_models import (get_face_app, get_profile, get_model_version, model_root,
+                         quantized_pack_name, float_pack_name, detect_faces)
+from face_gallery import DEFAULT_MATCH_THRESHOLD
+from image_io import load_image
+from profile_benchmark import IMAGE_EXTENSIONS, evaluate
+
+logger = logging.getLogger("QuantizeModels")
+
+DEFAULT_CALIBRATION_DIR = "known_faces"
+QUANTIZATION_MODES = ('static', 'dynamic')
+
+# Every HOLDOUT_EVERY-th image of each person is kept out of calibration and used for validation
+HOLDOUT_EVERY = 5
+
+# Most images fed through each model during static calibration
+MAX_CALIBRATION_IMAGES = 200
+
+# Minimum IoU for a quantized detection to count as the float model's face
+MATCH_IOU = 0.5
+
+# Validation passes when the quantized pack stays this close to the float one
+MIN_MEAN_COSINE = 0.98
+MIN_DECISION_AGREEMENT = 0.99
+
+# Fewest held-out faces whose person is in the gallery for a validation to count
+MIN_KNOWN_PROBES = 10
+
+# Written next to the quantized models to record how they were made
+INFO_FILENAME = "quantization.json"
+
+def list_images(image_dir):
+    """
+    List the images under a directory with a label for each.
+
+    Images in sub-directories are labelled with the sub-directory name
+    (<image_dir>/<person>/<image>); images directly in image_dir, like the
+    known_faces/<name>.jpg enrollment photos, with their file name.
+
+    Returns:
+        Sorted list of (label, path) pairs.
+    """
+    images = []
+    for directory, _, filenames in os.walk(image_dir):
+        for filename in filenames:
+            if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            path = os.path.join(directory, filename)
+            if os.path.samefile(directory, image_dir):
+                label = os.path.splitext(filename)[0]
+            else:
+                label = os.path.basename(directory)
+            images.append((label, path))
+    return sorted(images)
+
+def split_images(images, holdout_every=HOLDOUT_EVERY):
+    """
+    Split labelled images into a calibration set and a held-out validation set.
+
+    The split is made per label, so every held-out person also has
+    calibration images to enroll: every holdout_every-th image of a label is
+    held out, or the last one when the label has fewer images. Labels with a
+    single image are only used for calibration.
+
+    Returns:
+        Tuple (calibration, holdout), both sorted lists of (label, path).
+    """
+    by_label = {}
+    for label, path in images:
+        by_label.setdefault(label, []).append((label, path))
+
+    calibration = []
+    holdout = []
+    for group in by_label.values():
+        if len(group) < 2:
+            calibration.extend(group)
+            continue
+        held = group[holdout_every - 1::holdout_every] or group[-1:]
+        holdout.extend(held)
+        calibration.extend(image for image in group if image not in held)
+    return sorted(calibration), sorted(holdout)
+
+def _read_images(images):
+    """Load (label, path) pairs as (label, BGR image), skipping unreadable files."""
+    loaded = []
+    for label, path in images:
+        image = load_image(path)
+        if image is None:
+            logger.warning(f"Could not read {path}")
+            continue
+        loaded.append((label, image))
+    return loaded
+
+def _largest_face(faces):
+    if not faces:
+        return None
+    return max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+
+def _iou(box, other):
+    """Intersection over union of two (x1, y1, x2, y2) boxes."""
+    width = min(box[2], other[2]) - max(box[0], other[0])
+    height = min(box[3], other[3]) - max(box[1], other[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    other_area = (other[2] - other[0]) * (other[3] - other[1])
+    return intersection / (area + other_area - intersection)
+
+def _detector_blobs(model, images):
+    """Detector inputs for calibration, preprocessed exactly as the detector does."""
+    width, height = model.input_size
+    blobs = []
+    for image in images:
+        # Resize keeping the aspect ratio and pad to the detector input size
+        ratio = image.shape[0] / image.shape[1]
+        if ratio > height / width:
+            new_height, new_width = height, int(height / ratio)
+        else:
+            new_height, new_width = int(width * ratio), width
+        det_image = np.zeros((height, width, 3), dtype=np.uint8)
+        det_image[:new_height, :new_width] = cv2.resize(image, (new_width, new_height))
+        blobs.append(cv2.dnn.blobFromImage(det_image, 1.0 / model.input_std, (width, height),
+                                           (model.input_mean,) * 3, swapRB=True))
+    return blobs
+
+def _recognizer_blobs(app, images):
+    """Recognizer inputs for calibration: the aligned crop of each image's largest face."""
+    from insightface.utils import face_align
+
+    model = app.models['recognition']
+    size = model.input_size[0]
+    blobs = []
+    for image in images:
+        face = _largest_face(detect_faces(image, app))
+        if face is None:
+            continue
+        crop = face_align.norm_crop(image, landmark=face.kps, image_size=size)
+        blobs.append(cv2.dnn.blobFromImages([crop], 1.0 / model.input_std, (size, size),
+                                            (model.input_mean,) * 3, swapRB=True))
+    return blobs
+
+def quantize_model(model_path, output_path, mode='static', input_name=None, blobs=None):
+    """
+    Write an INT8 copy of one ONNX model.
+
+    Static quantization inserts QuantizeLinear/DequantizeLinear pairs with
+    per-channel INT8 weights and activation ranges measured on blobs, which
+    suits the convolutional detector and recognizer. Dynamic quantization
+    needs no calibration data but computes activation ranges at run time.
+
+    Args:
+        model_path: Float ONNX model.
+        output_path: Where to write the quantized model.
+        mode: 'static' or 'dynamic'.
+        input_name: Name of the model input (static only).
+        blobs: Calibration inputs as NCHW float32 arrays (static only).
+    """
+    from onnxruntime.quantization import (quantize_dynamic, quantize_static, CalibrationDataReader,
+                                          QuantFormat, QuantType)
+
+    if mode == 'dynamic':
+        quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8)
+        return
+
+    if not blobs:
+        raise ValueError(f"No calibration data for {os.path.basename(model_path)}")
+
+    class BlobReader(CalibrationDataReader):
+        def __init__(self):
+            self._blobs = iter(blobs)
+
+        def get_next(self):
+            blob = next(self._blobs, None)
+            return None if blob is None else {input_name: blob}
+
+    # Shape inference and graph cleanup let more nodes be quantized
+    source = model_path
+    preprocessed = output_path + ".pre.onnx"
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+        quant_pre_process(model_path, preprocessed, skip_symbolic_shape=True)
+        source = preprocessed
+    except Exception as e:
+        logger.warning(f"Pre-processing {os.path.basename(model_path)} failed, quantizing as is: {e}")
+
+    try:
+        quantize_static(source, output_path, BlobReader(), quant_format=QuantFormat.QDQ,
+                        per_channel=True, activation_type=QuantType.QInt8,
+                        weight_type=QuantType.QInt8)
+    finally:
+        if os.path.exists(preprocessed):
+            os.remove(preprocessed)
+
+def quantize_pack(name=None, mode='static', calibration_dir=DEFAULT_CALIBRATION_DIR,
+                  max_images=MAX_CALIBRATION_IMAGES):
+    """
+    Build the INT8 variant of a model pack's detector and recognizer.
+
+    The pack is written to <INSIGHTFACE_HOME>/models/<name>_int8, where the
+    quantized inference profiles load it. It is assembled in a temporary
+    directory and renamed into place, so a recognizer never loads a partial pack.
+
+    Args:
+        name: Float model pack. Defaults to the active profile's pack.
+        mode: 'static' (calibrated on calibration_dir) or 'dynamic'.
+        calibration_dir: Face photos used for calibration; the held-out
+            images (see split_images) are not used.
+        max_images: Most calibration images used per model.
+
+    Returns:
+        Path of the quantized pack, or None on error.
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode '{mode}'")
+    name = float_pack_name(name or get_profile()['name'])
+
+    try:
+        app = get_face_app(name=name)
+
+        images = []
+        if mode == 'static':
+            calibration, _ = split_images(list_images(calibration_dir))
+            images = [image for _, image in _read_images(calibration[:max_images])]
+            if not images:
+                logger.error(f"No calibration images in {calibration_dir}")
+                return None
+            logger.info(f"Calibrating on {len(images)} images from {calibration_dir}")
+
+        output_dir = os.path.join(model_root(), 'models', quantized_pack_name(name))
+        staging_dir = output_dir + ".tmp"
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        os.makedirs(staging_dir)
+
+        for task in ('detection', 'recognition'):
+            model = app.models[task]
+            blobs = None
+            if mode == 'static':
+                blobs = _detector_blobs(model, images) if task == 'detection' else _recognizer_blobs(app, images)
+            output_path = os.path.join(staging_dir, os.path.basename(model.model_file))
+            start = time.perf_counter()
+            quantize_model(model.model_file, output_path, mode, model.input_name, blobs)
+            logger.info(f"Quantized {task} model {os.path.basename(model.model_file)} ({mode}) in "
+                        f"{time.perf_counter() - start:.1f}s: "
+                        f"{os.path.getsize(model.model_file) / 2**20:.1f} MB -> "
+                        f"{os.path.getsize(output_path) / 2**20:.1f} MB")
+
+        with open(os.path.join(staging_dir, INFO_FILENAME), 'w') as f:
+            json.dump({
+                'source': name,
+                'source_version': get_model_version(name),
+                'mode': mode,
+                'calibration_dir': calibration_dir if mode == 'static' else None,
+                'calibration_images': len(images),
+                'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+            }, f, indent=2)
+
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.replace(staging_dir, output_dir)
+        logger.info(f"Quantized pack written to {output_dir}")
+        return output_dir
+
+    except Exception as e:
+        logger.error(f"Error quantizing {name}: {str(e)}")
+        return None
+
+def validate_pack(name=None, image_dir=DEFAULT_CALIBRATION_DIR, threshold=DEFAULT_MATCH_THRESHOLD):
+    """
+    Compare a quantized pack with its float pack on held-out images.
+
+    The float pack enrolls the calibration split as a gallery. For each
+    held-out image both packs run end to end, and the following are compared:
+    the largest detected face (IoU), the embedding of the float model's
+    aligned crop from the quantized recognizer (cosine similarity to the
+    float embedding) and the identification decision against the gallery
+    (best match at or above threshold, else unknown).
+
+    Args:
+        name: Float model pack. Defaults to the active profile's pack.
+        image_dir: Labelled photos (see list_images).
+        threshold: Cosine similarity below which a face is unknown.
+
+    Returns:
+        Dict with probes, known (probes whose label is in the gallery),
+        gallery, detection_agreement, cosine_mean, cosine_min,
+        cosine_p5, decision_agreement, float_accuracy and quant_accuracy
+        (None when no probe's label is in the gallery), float_ms and
+        quant_ms (mean app.get latency) and passed (which also requires at
+        least MIN_KNOWN_PROBES known probes); None on error.
+    """
+    from insightface.utils import face_align
+
+    name = float_pack_name(name or get_profile()['name'])
+    try:
+        float_app = get_face_app(name=name)
+        quant_app = get_face_app(name=quantized_pack_name(name))
+
+        calibration, holdout = split_images(list_images(image_dir))
+        holdout = _read_images(holdout)
+        if not holdout:
+            logger.error(f"No held-out images in {image_dir}: validation needs "
+                         f"at least two photos of a person (<image_dir>/<person>/<image>)")
+            return None
+
+        gallery_labels = []
+        gallery = []
+        for label, image in _read_images(calibration):
+            face = _largest_face(float_app.get(image))
+            if face is not None:
+                gallery_labels.append(label)
+                gallery.append(face.normed_embedding)
+        gallery = np.stack(gallery) if gallery else np.zeros((0, 1), dtype=np.float32)
+
+        def decide(embedding):
+            if embedding is None or not len(gallery):
+                return None
+            scores = gallery @ embedding
+            best = int(np.argmax(scores))
+            return gallery_labels[best] if scores[best] >= threshold else None
+
+        quant_recognizer = quant_app.models['recognition']
+        size = quant_recognizer.input_size[0]
+        cosines = []
+        detected = 0
+        agreed = 0
+        correct = {'float': 0, 'quant': 0}
+        known = 0
+        for label, image in holdout:
+            float_face = _largest_face(float_app.get(image))
+            if float_face is None:
+                continue
+            quant_face = _largest_face(quant_app.get(image))
+
+            if quant_face is not None and _iou(float_face.bbox, quant_face.bbox) >= MATCH_IOU:
+                detected += 1
+
+            # Same aligned crop through both recognizers isolates recognizer error
+            crop = face_align.norm_crop(image, landmark=float_face.kps, image_size=size)
+            quant_embedding = quant_recognizer.get_feat([crop]).flatten()
+            cosines.append(float(np.dot(float_face.normed_embedding,
+                                        quant_embedding / np.linalg.norm(quant_embedding))))
+
+            float_decision = decide(float_face.normed_embedding)
+            quant_decision = decide(quant_face.normed_embedding if quant_face is not None else None)
+            agreed += float_decision == quant_decision
+            if label in gallery_labels:
+                known += 1
+                correct['float'] += float_decision == label
+                correct['quant'] += quant_decision == label
+
+        probes = len(cosines)
+        if not probes:
+            logger.error("The float pack found no faces in the held-out images")
+            return None
+
+        result = {
+            'probes': probes,
+            'known': known,
+            'gallery': len(gallery_labels),
+            'detection_agreement': detected / probes,
+            'cosine_mean': float(np.mean(cosines)),
+            'cosine_min': float(np.min(cosines)),
+            'cosine_p5': float(np.percentile(cosines, 5)),
+            'decision_agreement': agreed / probes,
+            'float_accuracy': correct['float'] / known if known else None,
+            'quant_accuracy': correct['quant'] / known if known else None,
+            'float_ms': evaluate(float_app, holdout)['mean_ms'],
+            'quant_ms': evaluate(quant_app, holdout)['mean_ms'],
+        }
+        # Decisions on faces nobody enrolled agree trivially (both unknown),
+        # so a pass needs enough probes whose person is in the gallery
+        if known < MIN_KNOWN_PROBES:
+            logger.error(f"Only {known} held-out faces belong to enrolled people "
+                         f"(need {MIN_KNOWN_PROBES}); add more photos per person to {image_dir}")
+        result['passed'] = (known >= MIN_KNOWN_PROBES and
+                            result['cosine_mean'] >= MIN_MEAN_COSINE and
+                            result['decision_agreement'] >= MIN_DECISION_AGREEMENT)
+        return result
+
+    except Exception as e:
+        logger.error(f"Error validating quantized {name}: {str(e)}")
+        return None
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build and validate INT8 face model packs")
+    parser.add_argument("command", choices=["quantize", "validate"])
+    parser.add_argument("--pack", default=None, help="Float model pack (default: active profile's pack)")
+    parser.add_argument("--mode", choices=QUANTIZATION_MODES, default='static')
+    parser.add_argument("--images", default=DEFAULT_CALIBRATION_DIR,
+                        help="Face photos for calibration and validation")
+    args = parser.parse_args()
+
+    if args.command == "quantize":
+        output_dir = quantize_pack(args.pack, args.mode, args.images)
+        if output_dir is None:
+            sys.exit(1)
+        print(f"\nQuantized pack: {output_dir}")
+
+    result = validate_pack(args.pack, args.images)
+    if result is None:
+        sys.exit(1)
+    print(f"\nHeld-out faces:          {result['probes']} ({result['known']} enrolled, "
+          f"gallery of {result['gallery']})")
+    print(f"Detection agreement:     {result['detection_agreement']:.1%}")
+    print(f"Embedding cosine:        mean {result['cosine_mean']:.4f}, "
+          f"p5 {result['cosine_p5']:.4f}, min {result['cosine_min']:.4f}")
+    print(f"Decision agreement:      {result['decision_agreement']:.1%}")
+    if result['float_accuracy'] is not None:
+        print(f"Identification accuracy: float {result['float_accuracy']:.1%}, "
+              f"int8 {result['quant_accuracy']:.1%}")
+    print(f"Mean latency:            float {result['float_ms']:.1f} ms, int8 {result['quant_ms']:.1f} ms")
+    print("PASSED" if result['passed'] else "FAILED: keep the float pack for this deployment")
+    sys.exit(0 if result['passed'] else 1)
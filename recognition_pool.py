@@ -0,0 +1,400 @@
+import os
+import sys
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+# Add the current directory to the path so we can import from the root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from face_gallery import FaceGallery, DEFAULT_MATCH_THRESHOLD, normalize_embeddings
+from pipeline import DropOldestQueue
+
+logger = logging.getLogger("RecognitionPool")
+
+# Frames queued or running per worker before new frames are dropped
+MAX_IN_FLIGHT = 2
+
+# Ordered results kept for the consumer; the oldest is dropped when full
+RESULT_QUEUE_SIZE = 16
+
+# Seconds to wait for a worker to load its models
+WORKER_START_TIMEOUT = 120
+
+# Seconds between checks for workers that have died
+WORKER_CHECK_INTERVAL = 1.0
+
+class SharedGallery:
+    """
+    Enrolled embedding matrix in a shared memory block.
+
+    The owner writes the normalized matrix once; workers attach to the block
+    by name and match against it in place, so the gallery exists once in
+    memory however many workers read it. A new gallery is published as a new
+    block rather than written over the old one, so a worker never sees a
+    half-updated matrix.
+    """
+
+    def __init__(self, shm, shape, user_ids, version, owner):
+        self._shm = shm
+        self.shape = tuple(shape)
+        self.user_ids = list(user_ids)
+        self.version = version
+        self.owner = owner
+        self.matrix = np.ndarray(self.shape, dtype=np.float32, buffer=shm.buf)
+        if not owner:
+            self.matrix.flags.writeable = False
+
+    @classmethod
+    def create(cls, embeddings, user_ids, version=0):
+        """
+        Copy embeddings into a new shared memory block.
+
+        Args:
+            embeddings: Array of shape (n, dim), one row per enrolled user.
+            user_ids: Sequence of n user IDs aligned with the rows.
+            version: Number identifying this gallery among later updates.
+        """
+        matrix = normalize_embeddings(embeddings) if len(user_ids) else np.zeros((0, 0), dtype=np.float32)
+        shm = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+        gallery = cls(shm, matrix.shape, user_ids, version, owner=True)
+        gallery.matrix[...] = matrix
+        return gallery
+
+    @classmethod
+    def attach(cls, spec):
+        """Open a gallery published by another process from its spec."""
+        try:
+            shm = shared_memory.SharedMemory(name=spec['name'], track=False)
+        except TypeError:
+            # Before Python 3.13 attaching also registers the block, but pool
+            # workers share the owner's resource tracker, so it is only
+            # cleaned up if the owner dies without unlinking it
+            shm = shared_memory.SharedMemory(name=spec['name'])
+        return cls(shm, spec['shape'], spec['user_ids'], spec['version'], owner=False)
+
+    @property
+    def spec(self):
+        """Picklable description that workers pass to attach."""
+        return {'name': self._shm.name, 'shape': self.shape,
+                'user_ids': self.user_ids, 'version': self.version}
+
+    def gallery(self, threshold=DEFAULT_MATCH_THRESHOLD):
+        """FaceGallery matching directly against the shared matrix."""
+        gallery = FaceGallery(threshold=threshold)
+        gallery.attach(self.matrix, self.user_ids)
+        return gallery
+
+    def close(self):
+        """Detach from the block; the owner also frees it."""
+        if self.matrix is None:
+            return
+        self.matrix = None
+        self._shm.close()
+        if self.owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+def _worker_main(worker_id, tasks, results, gallery_spec, threshold, k, max_faces, threads, profile):
+    """
+    Recognition worker: detect, embed and match frames until told to stop.
+
+    Each worker has its own ONNX sessions, limited to its share of the cores.
+    Messages on tasks are ('frame', camera, seq, frame), ('gallery', spec) or
+    None to stop. Every frame is answered on results, also when it fails, so
+    the dispatcher never waits for a frame that will not come.
+    """
+    from face_models import configure_sessions, set_profile, get_face_app, detect_faces, embed_batch
+    from face_recognition import ranked_result
+
+    try:
+        configure_sessions(intra_op_num_threads=threads)
+        if profile:
+            set_profile(profile)
+        app = get_face_app()
+        shared = SharedGallery.attach(gallery_spec)
+        gallery = shared.gallery(threshold)
+    except Exception as e:
+        results.put(('failed', worker_id, None, str(e)))
+        return
+    results.put(('ready', worker_id, None, None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        if task[0] == 'gallery':
+            previous = shared
+            shared = SharedGallery.attach(task[1])
+            gallery = shared.gallery(threshold)
+            previous.close()
+            results.put(('gallery', worker_id, None, shared.version))
+            continue
+
+        _, camera, seq, frame = task
+        try:
+            faces = detect_faces(frame, app)[:max_faces]
+            matches = []
+            if faces:
+                embed_batch([(frame, faces)], app)
+                ids, scores = gallery.topk(np.stack([face.embedding for face in faces]), k=k)
+                for face, row_ids, row_scores in zip(faces, ids, scores):
+                    match = ranked_result(row_ids, row_scores, k, threshold)
+                    match['bbox'] = face.bbox.astype(int)
+                    matches.append(match)
+            results.put(('result', worker_id, (camera, seq), matches))
+        except Exception as e:
+            results.put(('error', worker_id, (camera, seq), str(e)))
+
+    # The gallery's view of the block must go before the block is closed
+    gallery = None
+    shared.close()
+
+class RecognitionPool:
+    """
+    Pool of recognition worker processes fed by a load-balancing dispatcher.
+
+    submit() hands each frame to the worker with the fewest frames in
+    flight, or drops it when every worker is busy. Workers answer in any
+    order; results are released per camera in submission order and can be
+    read with get(). All workers match against one SharedGallery.
+    """
+
+    def __init__(self, gallery, workers=None, k=3, max_faces=10, max_in_flight=MAX_IN_FLIGHT,
+                 profile=None, result_queue_size=RESULT_QUEUE_SIZE):
+        """
+        Args:
+            gallery: FaceGallery with the enrolled identities; its threshold is used.
+            workers: Number of worker processes. Defaults to the CPU count.
+            k: Candidates returned per face.
+            max_faces: Most faces recognized per frame.
+            max_in_flight: Frames queued or running per worker.
+            profile: Inference profile for the workers. Defaults to the active one.
+            result_queue_size: Ordered results kept for get().
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = gallery.threshold
+        self.k = k
+        self.max_faces = max_faces
+        self.max_in_flight = max_in_flight
+        self.profile = profile
+        self.output = DropOldestQueue(result_queue_size)
+
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.errors = 0
+
+        self._gallery = SharedGallery.create(gallery.matrix, gallery.user_ids)
+        self._retired = []
+        self._context = multiprocessing.get_context("spawn")
+        self._results = self._context.Queue()
+        self._processes = []
+        self._tasks = []
+        self._in_flight = []
+        self._dead = set()
+        self._frames = {}
+        self._next_seq = {}
+        self._next_release = {}
+        self._done = {}
+        self._acks = {}
+        self._lock = threading.Lock()
+        self._collector = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """
+        Start the workers and wait until each has loaded its models.
+
+        Returns:
+            True if every worker started, False otherwise.
+        """
+        # Workers split the cores; each runs one frame at a time
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        for worker_id in range(self.workers):
+            tasks = self._context.Queue()
+            process = self._context.Process(
+                target=_worker_main, name=f"recognizer-{worker_id}", daemon=True,
+                args=(worker_id, tasks, self._results, self._gallery.spec, self.threshold,
+                      self.k, self.max_faces, threads, self.profile))
+            process.start()
+            self._processes.append(process)
+            self._tasks.append(tasks)
+            self._in_flight.append(set())
+
+        ready = 0
+        deadline = time.time() + WORKER_START_TIMEOUT
+        while ready < self.workers:
+            try:
+                kind, worker_id, _, error = self._results.get(timeout=max(0.1, deadline - time.time()))
+            except queue.Empty:
+                logger.error(f"Only {ready} of {self.workers} recognition workers started in time")
+                self.stop()
+                return False
+            if kind == 'failed':
+                logger.error(f"Recognition worker {worker_id} failed to start: {error}")
+                self.stop()
+                return False
+            ready += 1
+
+        self._collector = threading.Thread(target=self._collect, name="recognition-collector", daemon=True)
+        self._collector.start()
+        logger.info(f"Started {self.workers} recognition workers with {threads} thread(s) each, "
+                    f"gallery of {len(self._gallery.user_ids)} identities")
+        return True
+
+    def submit(self, camera, frame):
+        """
+        Queue a frame on the least busy worker.
+
+        Args:
+            camera: Camera the frame came from; results keep its order.
+            frame: BGR image as a numpy array.
+
+        Returns:
+            True if the frame was queued, False if it was dropped because
+            every worker already has max_in_flight frames.
+        """
+        with self._lock:
+            live = [i for i in range(len(self._in_flight)) if i not in self._dead]
+            worker_id = min(live, key=lambda i: len(self._in_flight[i]), default=None)
+            if worker_id is None or len(self._in_flight[worker_id]) >= self.max_in_flight:
+                self.dropped += 1
+                return False
+            seq = self._next_seq.get(camera, 0)
+            self._next_seq[camera] = seq + 1
+            self._next_release.setdefault(camera, 0)
+            self._frames[(camera, seq)] = frame
+            self._in_flight[worker_id].add((camera, seq))
+            self.submitted += 1
+        self._tasks[worker_id].put(('frame', camera, seq, frame))
+        return True
+
+    def get(self, timeout=None):
+        """
+        Next result: dict with camera, seq, frame, faces (recognize_topk-style
+        matches with bbox, user_id, confidence, margin and candidates) and
+        error. Raises queue.Empty on timeout.
+        """
+        return self.output.get(timeout=timeout)
+
+    def update_gallery(self, gallery):
+        """
+        Publish a new gallery to every worker.
+
+        The new matrix goes to a new shared memory block; the old block is
+        freed once every worker has switched over.
+
+        Args:
+            gallery: FaceGallery with the new enrolled identities.
+        """
+        with self._lock:
+            previous = self._gallery
+            self._gallery = SharedGallery.create(gallery.matrix, gallery.user_ids, previous.version + 1)
+            self._retired.append(previous)
+            self._acks[self._gallery.version] = set()
+        for tasks in self._tasks:
+            tasks.put(('gallery', self._gallery.spec))
+        logger.info(f"Published gallery version {self._gallery.version} "
+                    f"with {len(self._gallery.user_ids)} identities")
+
+    def _collect(self):
+        """Collector thread: receive worker results and release them in order."""
+        last_check = time.time()
+        while not self._stop.is_set():
+            if time.time() - last_check > WORKER_CHECK_INTERVAL:
+                last_check = time.time()
+                self._check_workers()
+            try:
+                kind, worker_id, key, payload = self._results.get(timeout=WORKER_CHECK_INTERVAL)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            with self._lock:
+                if kind == 'gallery':
+                    self._gallery_switched(worker_id, payload)
+                    continue
+                self._in_flight[worker_id].discard(key)
+                self._finish(key, payload if kind == 'result' else [],
+                             payload if kind == 'error' else None)
+
+    def _finish(self, key, faces, error):
+        """Record one frame's result and release any now in order. Holds _lock."""
+        camera, seq = key
+        if error is not None:
+            self.errors += 1
+            logger.error(f"Recognition failed for camera {camera} frame {seq}: {error}")
+        self._done[key] = {'camera': camera, 'seq': seq, 'frame': self._frames.pop(key, None),
+                           'faces': faces, 'error': error}
+        self.completed += 1
+
+        # Earlier frames of the same camera still running hold this one back
+        while (camera, self._next_release[camera]) in self._done:
+            self.output.put(self._done.pop((camera, self._next_release[camera])))
+            self._next_release[camera] += 1
+
+    def _gallery_switched(self, worker_id, version):
+        """Free retired galleries once every worker uses a newer one. Holds _lock."""
+        self._acks.setdefault(version, set()).add(worker_id)
+        alive = {i for i, process in enumerate(self._processes) if process.is_alive()}
+        if alive <= self._acks[version]:
+            for retired in [g for g in self._retired if g.version < version]:
+                retired.close()
+                self._retired.remove(retired)
+            for old in [v for v in self._acks if v <= version]:
+                del self._acks[old]
+
+    def _check_workers(self):
+        """Fail the frames of a worker that died, so later frames are not held back."""
+        with self._lock:
+            for worker_id, process in enumerate(self._processes):
+                if process.is_alive() or worker_id in self._dead:
+                    continue
+                logger.error(f"Recognition worker {worker_id} exited with code {process.exitcode}")
+                self._dead.add(worker_id)
+                for key in sorted(self._in_flight[worker_id]):
+                    self._finish(key, [], "worker exited")
+                self._in_flight[worker_id].clear()
+
+    def stats(self):
+        """
+        Get dispatcher metrics.
+
+        Returns:
+            Dict with workers (still running), submitted, completed, dropped,
+            errors and in_flight.
+        """
+        with self._lock:
+            in_flight = sum(len(keys) for keys in self._in_flight)
+            live = len(self._processes) - len(self._dead)
+        return {'workers': live, 'submitted': self.submitted, 'completed': self.completed,
+                'dropped': self.dropped, 'errors': self.errors, 'in_flight': in_flight}
+
+    def stop(self, timeout=5):
+        """Stop the workers and the collector, and free the shared galleries."""
+        for tasks in self._tasks:
+            try:
+                tasks.put(None)
+            except Exception:
+                pass
+        deadline = time.time() + timeout
+        for process in self._processes:
+            process.join(timeout=max(0, deadline - time.time()))
+            if process.is_alive():
+                process.terminate()
+        self._stop.set()
+        if self._collector is not None:
+            self._collector.join(timeout=2)
+        for gallery in self._retired + [self._gallery]:
+            gallery.close()
+        self._retired = []
+        logger.info(f"Recognition pool stopped: {self.stats()}")
@@ -1,10 +1,12 @@
 import os
-import sqlite3
-import numpy as np
 from sklearn.svm import SVC
-import pickle
 import logging
 from datetime import datetime
+from db import query_all
+from face_embeddings import load_embeddings
+from model_registry import publish_model
+from face_models import get_profile
+from model_artifact import save_classifier_artifact
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,45 +16,21 @@ def retrain_model():
     Retrain the face recognition model with optimized parameters.
     """
     try:
-        # Load face encodings from database
-        conn = sqlite3.connect("attendance.db")
-        cursor = conn.cursor()
-        
-        # Get all users with their encodings
-        cursor.execute("SELECT user_id, name, encoding FROM users")
-        users = cursor.fetchall()
-        
-        if not users:
-            logger.error("No users found in database!")
+        # Load every enrollment sample from the database
+        X, y = load_embeddings()
+        if X is None or len(X) == 0:
+            logger.error("No face encodings found in database!")
             return False
             
-        encodings = []
-        labels = []
-        names = {}
-        
-        for user_id, name, encoding_blob in users:
-            if encoding_blob is None:
-                logger.warning(f"User {name} (ID: {user_id}) has no face encoding.")
-                continue
-                
-            try:
-                encoding = np.frombuffer(encoding_blob, dtype=np.float32)
-                encodings.append(encoding)
-                labels.append(user_id)
-                names[user_id] = name
-                logger.info(f"Loaded encoding for {name} (ID: {user_id})")
-            except Exception as e:
-                logger.error(f"Error processing encoding for {name}: {e}")
-                continue
+        trained_ids = set(y.tolist())
+        names = {user_id: name for user_id, name in query_all("SELECT user_id, name FROM users")
+                 if user_id in trained_ids}
+        logger.info(f"Loaded {len(X)} encodings for {len(trained_ids)} users")
         
-        if len(encodings) < 2:
+        if len(trained_ids) < 2:
             logger.error("Need at least 2 users with valid encodings!")
             return False
         
-        # Convert to numpy arrays
-        X = np.array(encodings)
-        y = np.array(labels)
-        
         # Train SVM with optimized parameters
         classifier = SVC(
             kernel='rbf',  # RBF kernel often works better for face recognition
@@ -67,26 +45,19 @@ def retrain_model():
         
         # Save the model
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        model_path = os.path.join("models", f"face_recognition_svm_{timestamp}.pkl")
+        model_path = os.path.join("models", f"face_recognition_svm_{timestamp}")
         
         # Create models directory if it doesn't exist
         os.makedirs("models", exist_ok=True)
         
-        # Delete old model files
-        for file in os.listdir("models"):
-            if file.endswith(".pkl"):
-                try:
-                    os.remove(os.path.join("models", file))
-                    logger.info(f"Deleted old model: {file}")
-                except Exception as e:
-                    logger.error(f"Could not delete {file}: {e}")
+        # Save new model, then publish it; old versions are pruned by the manifest
+        save_classifier_artifact(classifier, model_path, user_names=names)
         
-        # Save new model
-        with open(model_path, 'wb') as f:
-            pickle.dump(classifier, f)
+        if publish_model(model_path, {'classifier_type': 'svm_rbf', 'face_model': get_profile()['name']}) is None:
+            return False
         
         logger.info(f"Model saved to: {model_path}")
-        logger.info(f"Trained with {len(encodings)} face encodings")
+        logger.info(f"Trained with {len(X)} face encodings")
         logger.info("Users in model:")
         for user_id, name in names.items():
             logger.info(f"  ID: {user_id}, Name: {name}")
@@ -96,11 +67,6 @@ def retrain_model():
     except Exception as e:
         logger.error(f"Error training model: {e}")
         return False
-    finally:
-        try:
-            conn.close()
-        except:
-            pass
 
 if __name__ == "__main__":
     print("This will retrain the face recognition model with optimized parameters.")
@@ -110,7 +76,7 @@ if __name__ == "__main__":
         if retrain_model():
             print("\n✅ Model retrained successfully!")
             print("\nNext steps:")
-            print("1. Restart the attendance system")
+            print("1. Running recognizers switch to the new model automatically")
             print("2. Test face recognition")
         else:
             print("\n❌ Error retraining model. Check the logs above.")
@@ -0,0 +1,95 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("sklearn")
+
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.svm import SVC
+
+from model_artifact import load_classifier_artifact, save_classifier_artifact
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models")
+
+# libsvm stops its pairwise coupling iteration once it is this close
+PROBA_ATOL = 5e-3
+
+def _blobs(n_classes, n_per_class=30, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=2.0, size=(n_classes, dim))
+    X = np.concatenate([c + rng.normal(size=(n_per_class, dim)) for c in centers])
+    y = np.repeat([f"S{101 + i}" for i in range(n_classes)], n_per_class)
+    return X, y
+
+def _probe(X):
+    return X + np.random.default_rng(1).normal(scale=0.5, size=X.shape)
+
+def _round_trip(classifier, tmp_path):
+    path = save_classifier_artifact(classifier, str(tmp_path / "model"), db_path=str(tmp_path / "missing.db"))
+    return load_classifier_artifact(path)
+
+@pytest.mark.parametrize("kernel", ["linear", "rbf"])
+def test_svc_matches_sklearn(tmp_path, kernel):
+    X, y = _blobs(3)
+    classifier = SVC(kernel=kernel, probability=True, random_state=0).fit(X, y)
+    model = _round_trip(classifier, tmp_path)
+
+    probe = _probe(X)
+    np.testing.assert_array_equal(model.predict(probe), classifier.predict(probe))
+    np.testing.assert_allclose(model.predict_proba(probe), classifier.predict_proba(probe), atol=PROBA_ATOL)
+
+def test_knn_matches_sklearn(tmp_path):
+    X, y = _blobs(3)
+    classifier = KNeighborsClassifier(n_neighbors=5).fit(X, y)
+    model = _round_trip(classifier, tmp_path)
+
+    probe = _probe(X)
+    np.testing.assert_array_equal(model.predict(probe), classifier.predict(probe))
+    np.testing.assert_allclose(model.predict_proba(probe), classifier.predict_proba(probe))
+
+def test_forest_matches_sklearn(tmp_path):
+    X, y = _blobs(3)
+    classifier = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    model = _round_trip(classifier, tmp_path)
+
+    probe = _probe(X)
+    np.testing.assert_array_equal(model.predict(probe), classifier.predict(probe))
+    np.testing.assert_allclose(model.predict_proba(probe), classifier.predict_proba(probe))
+
+@pytest.mark.parametrize("n_classes", [2, 3])
+@pytest.mark.parametrize("kernel", ["linear", "rbf"])
+def test_predict_scores_matches_sklearn(tmp_path, n_classes, kernel):
+    X, y = _blobs(n_classes)
+    classifier = SVC(kernel=kernel, probability=True, random_state=0).fit(X, y)
+    model = _round_trip(classifier, tmp_path)
+
+    probe = _probe(X)
+    labels, probs = model.predict_scores(probe)
+
+    assert np.all(np.isfinite(probs))
+    np.testing.assert_array_equal(labels, classifier.predict(probe))
+    np.testing.assert_allclose(probs, classifier.predict_proba(probe), atol=PROBA_ATOL)
+
+def test_shipped_model_matches_pickle(tmp_path):
+    pickle_path = os.path.join(MODELS_DIR, "face_recognition_svm_20250406_204222.pkl")
+    if not os.path.exists(pickle_path):
+        pytest.skip("shipped model not present")
+    joblib = pytest.importorskip("joblib")
+    try:
+        classifier = joblib.load(pickle_path)
+        model = _round_trip(classifier, tmp_path)
+    except Exception as e:
+        pytest.skip(f"shipped model cannot be loaded here: {e}")
+
+    support = np.asarray(classifier.support_vectors_)
+    probe = support + np.random.default_rng(0).normal(scale=0.05, size=support.shape)
+    labels, probs = model.predict_scores(probe)
+
+    assert np.all(np.isfinite(probs))
+    np.testing.assert_array_equal(labels, classifier.predict(probe))
+    np.testing.assert_allclose(probs, classifier.predict_proba(probe), atol=PROBA_ATOL)
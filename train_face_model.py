@@ -1,7 +1,5 @@
 import os
-import sqlite3
 import numpy as np
-import pickle
 import cv2
 from sklearn.svm import SVC
 from sklearn.neighbors import KNeighborsClassifier
@@ -10,6 +8,12 @@ from sklearn.metrics import accuracy_score
 import logging
 from datetime import datetime
 import sys
+from db import query_all
+from model_artifact import save_classifier_artifact
+from face_embeddings import load_embeddings
+from embedding_store import EmbeddingStore
+from model_registry import publish_model
+from face_models import get_profile
 
 # Add the current directory to the path so we can import from the root
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -32,51 +36,22 @@ logger = logging.getLogger("FaceTraining")
 
 def load_face_encodings_from_db():
     """
-    Load face encodings and labels from the database.
-    Returns a tuple of (encodings, labels).
+    Load every enrollment sample and its label from the database.
+    Returns a tuple of (encodings, labels) with one row per sample.
     """
     try:
-        conn = sqlite3.connect("attendance.db")
-        cursor = conn.cursor()
-        
-        # Get all users with their encodings
-        cursor.execute("SELECT user_id, name, encoding FROM users")
-        users = cursor.fetchall()
-        
-        if not users:
-            logger.warning("No users found in the database.")
+        encodings, labels = load_embeddings()
+        if encodings is None:
             return None, None
-        
-        encodings = []
-        labels = []
-        
-        for user_id, name, encoding_blob in users:
-            if encoding_blob is None:
-                logger.warning(f"User {name} (ID: {user_id}) has no face encoding.")
-                continue
-                
-            try:
-                # Convert blob to numpy array
-                encoding = np.frombuffer(encoding_blob, dtype=np.float32)
-                
-                # Check if encoding is valid (has the expected shape)
-                if encoding.shape[0] == 0:
-                    logger.warning(f"User {name} (ID: {user_id}) has an empty face encoding.")
-                    continue
-                    
-                encodings.append(encoding)
-                labels.append(user_id)  # Use user_id as the label
-            except Exception as e:
-                logger.error(f"Error processing encoding for user {name} (ID: {user_id}): {str(e)}")
-                continue
-        
-        conn.close()
-        
-        if not encodings:
-            logger.warning("No valid face encodings found.")
+            
+        if len(encodings) == 0:
+            logger.warning("No face encodings found in the database.")
             return None, None
             
-        return np.array(encodings), np.array(labels)
+        counts = np.unique(labels, return_counts=True)[1]
+        logger.info(f"Loaded {len(encodings)} encodings for {len(counts)} users "
+                    f"({counts.min()}-{counts.max()} per user)")
+        return encodings, labels
         
     except Exception as e:
         logger.error(f"Error loading face encodings from database: {str(e)}")
@@ -84,6 +59,43 @@ def load_face_encodings_from_db():
         logger.error(f"Traceback: {traceback.format_exc()}")
         return None, None
 
+def split_for_evaluation(encodings, labels, test_size=0.2, random_state=42):
+    """
+    Hold out samples for evaluation without dropping any identity from training.
+    
+    Users with a single sample stay entirely in the training set; the split
+    is stratified over the users that have two or more samples.
+    
+    Args:
+        encodings: numpy array of face encodings
+        labels: numpy array of user IDs
+        test_size: Fraction of the multi-sample users' samples to hold out
+        random_state: Seed for the split
+        
+    Returns:
+        Tuple (X_train, X_test, y_train, y_test). The test arrays are empty
+        when no user has a second sample.
+    """
+    user_ids, counts = np.unique(labels, return_counts=True)
+    splittable = np.isin(labels, user_ids[counts >= 2])
+    
+    X_train, y_train = encodings[~splittable], labels[~splittable]
+    X_test, y_test = encodings[:0], labels[:0]
+    
+    if splittable.any():
+        n_test = max(int(round(test_size * splittable.sum())), int((counts >= 2).sum()))
+        if n_test < splittable.sum():
+            X_fit, X_test, y_fit, y_test = train_test_split(
+                encodings[splittable], labels[splittable], test_size=n_test,
+                stratify=labels[splittable], random_state=random_state
+            )
+        else:
+            X_fit, y_fit = encodings[splittable], labels[splittable]
+        X_train = np.concatenate([X_train, X_fit])
+        y_train = np.concatenate([y_train, y_fit])
+        
+    return X_train, X_test, y_train, y_test
+
 def train_face_classifier(encodings, labels, classifier_type='svm'):
     """
     Train a face classifier using the provided encodings and labels.
@@ -113,9 +125,7 @@ def train_face_classifier(encodings, labels, classifier_type='svm'):
             return None
             
         # Split data for training and testing
-        X_train, X_test, y_train, y_test = train_test_split(
-            encodings, labels, test_size=0.2, random_state=42
-        )
+        X_train, X_test, y_train, y_test = split_for_evaluation(encodings, labels)
         
         # Initialize classifier
         if classifier_type.lower() == 'svm':
@@ -130,9 +140,15 @@ def train_face_classifier(encodings, labels, classifier_type='svm'):
         classifier.fit(X_train, y_train)
         
         # Evaluate the classifier
-        y_pred = classifier.predict(X_test)
-        accuracy = accuracy_score(y_test, y_pred)
-        logger.info(f"Classifier accuracy: {accuracy:.2f}")
+        if len(X_test) > 0:
+            y_pred = classifier.predict(X_test)
+            accuracy = accuracy_score(y_test, y_pred)
+            logger.info(f"Classifier accuracy: {accuracy:.2f} on {len(X_test)} held-out samples")
+            
+            # Refit on every sample now that the held-out ones have been scored
+            classifier.fit(encodings, labels)
+        else:
+            logger.info("No user has a second sample; skipping evaluation")
         
         return classifier
         
@@ -144,14 +160,14 @@ def train_face_classifier(encodings, labels, classifier_type='svm'):
 
 def save_classifier(classifier, classifier_type='svm'):
     """
-    Save the trained classifier to a file.
+    Save the trained classifier as a model artifact (.npy arrays plus a JSON header).
     
     Args:
         classifier: Trained classifier
         classifier_type: 'svm' or 'knn'
         
     Returns:
-        Path to the saved model file
+        Path to the saved model artifact
     """
     if classifier is None:
         logger.error("No classifier to save.")
@@ -160,14 +176,19 @@ def save_classifier(classifier, classifier_type='svm'):
     try:
         # Generate filename with timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        model_filename = f"face_recognition_{classifier_type}_{timestamp}.pkl"
+        model_filename = f"face_recognition_{classifier_type}_{timestamp}"
         model_path = os.path.join("models", model_filename)
         
-        # Save the classifier
-        with open(model_path, 'wb') as f:
-            pickle.dump(classifier, f)
-            
+        # The artifact is written under a temporary name and renamed into place,
+        # so a recognizer looking for the latest model never sees a partial one
+        user_names = dict(query_all("SELECT user_id, name FROM users"))
+        save_classifier_artifact(classifier, model_path, user_names=user_names)
         logger.info(f"Classifier saved to {model_path}")
+        
+        # Make it the current version; running recognizers pick it up from the manifest
+        metadata = {'classifier_type': classifier_type, 'face_model': get_profile()['name']}
+        if publish_model(model_path, metadata) is None:
+            return None
         return model_path
         
     except Exception as e:
@@ -178,52 +199,49 @@ def save_classifier(classifier, classifier_type='svm'):
 
 def save_encodings_and_labels(encodings, labels):
     """
-    Save encodings and labels to a file for future use.
+    Store encodings and labels in the shared embedding store.
+    
+    Unchanged encodings are kept in place and only new ones are appended, so
+    repeated training runs do not grow the store.
     
     Args:
         encodings: numpy array of face encodings
         labels: numpy array of user IDs
         
     Returns:
-        Path to the saved data file
+        The EmbeddingStore, or None on error
     """
     if encodings is None or labels is None:
         logger.error("No encodings or labels to save.")
         return None
         
     try:
-        # Generate filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        data_path = os.path.join("face_data", f"face_encodings_{timestamp}.pkl")
-        
-        # Save the data
-        data = {
-            'encodings': encodings,
-            'labels': labels
-        }
-        
-        with open(data_path, 'wb') as f:
-            pickle.dump(data, f)
-            
-        logger.info(f"Face encodings and labels saved to {data_path}")
-        return data_path
+        store = EmbeddingStore()
+        added = store.sync(encodings, labels)
+        logger.info(f"Embedding store updated: {added} new encodings, {len(store)} in total")
+        return store
         
     except Exception as e:
         logger.error(f"Error saving encodings and labels: {str(e)}")
         return None
 
-def train_and_save_face_model(classifier_type='svm'):
+def train_and_save_face_model(classifier_type='svm', progress=None):
     """
     Train and save the face recognition model.
     
     Args:
         classifier_type (str): Type of classifier to use ('svm' or 'knn')
+        progress (callable): Optional function called with a status message
+            at the start of each stage
         
     Returns:
-        dict: Dictionary containing success status and message
+        dict: Dictionary containing success status and message, and the
+            model_path of the saved model on success
     """
+    report = progress or (lambda message: None)
     try:
         # Load face encodings from database
+        report("Loading face encodings")
         encodings, labels = load_face_encodings_from_db()
         
         if encodings is None or labels is None:
@@ -238,7 +256,14 @@ def train_and_save_face_model(classifier_type='svm'):
                 'message': 'Not enough face encodings to train the model. At least 2 users with face encodings are required.'
             }
             
+        # Train from the shared embedding store so training, evaluation and
+        # recognition all read the same memory-mapped array
+        store = save_encodings_and_labels(encodings, labels)
+        if store is not None:
+            encodings, labels = store.embeddings()
+            
         # Train the classifier
+        report(f"Training {classifier_type.upper()} classifier on {len(encodings)} encodings")
         classifier = train_face_classifier(encodings, labels, classifier_type)
         if classifier is None:
             return {
@@ -247,7 +272,9 @@ def train_and_save_face_model(classifier_type='svm'):
             }
             
         # Save the classifier
-        if not save_classifier(classifier, classifier_type):
+        report("Saving model")
+        model_path = save_classifier(classifier, classifier_type)
+        if not model_path:
             return {
                 'success': False,
                 'message': 'Failed to save the classifier'
@@ -255,7 +282,8 @@ def train_and_save_face_model(classifier_type='svm'):
             
         return {
             'success': True,
-            'message': 'Model trained and saved successfully'
+            'message': 'Model trained and saved successfully',
+            'model_path': model_path
         }
         
     except Exception as e:
@@ -0,0 +1,198 @@
+import os
+import sys
+import time
+import queue
+import threading
+import logging
+import multiprocessing
+
+# Add the current directory to the path so we can import from the root
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger("TrainingService")
+
+# Seconds to wait after the last request before starting a retrain
+DEFAULT_DEBOUNCE = 3.0
+
+def _training_job(classifier_type, events):
+    """
+    Run one retrain in a worker process.
+
+    Progress messages and the final result are sent back over the events queue
+    as ('progress', message) and ('done', result) tuples.
+    """
+    try:
+        from train_face_model import train_and_save_face_model
+        result = train_and_save_face_model(
+            classifier_type=classifier_type,
+            progress=lambda message: events.put(('progress', message))
+        )
+    except Exception as e:
+        result = {'success': False, 'message': f'Error during model training: {str(e)}'}
+    events.put(('done', result))
+
+class TrainingService:
+    """
+    Background model training with request debouncing.
+
+    request() returns immediately. Requests that arrive within debounce seconds
+    of each other, or while a retrain is already running, are coalesced into a
+    single retrain. Each retrain runs train_and_save_face_model in a separate
+    process so the caller's event loop and the GIL stay free.
+
+    The model file is renamed into place only when training is done, so
+    recognizers keep using the previous model until on_finished reports the
+    new one.
+    """
+
+    def __init__(self, classifier_type='svm', debounce=DEFAULT_DEBOUNCE, on_progress=None, on_finished=None):
+        """
+        Initialize the service.
+
+        Args:
+            classifier_type: 'svm' or 'knn'.
+            debounce: Seconds without new requests before a retrain starts.
+            on_progress: Optional callable(message) for progress updates.
+            on_finished: Optional callable(success, message, model_path) called
+                after each retrain. model_path is '' on failure.
+
+        Callbacks run on the service thread; Qt code should pass a signal's
+        emit method so the slot runs on the UI thread.
+        """
+        self.classifier_type = classifier_type
+        self.debounce = debounce
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._process = None
+        self._pending = 0
+        self._last_request = 0.0
+
+        # Metrics
+        self.requests = 0
+        self.jobs_run = 0
+        self.jobs_failed = 0
+        self.last_duration = 0.0
+
+    def start(self):
+        """Start the service thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="training-service", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the service, terminating a retrain that is still running."""
+        self._stop.set()
+        self._wakeup.set()
+        process = self._process
+        if process is not None and process.is_alive():
+            process.terminate()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def request(self, reason=None):
+        """
+        Ask for a retrain. Never blocks.
+
+        Args:
+            reason: Optional description for the log.
+        """
+        with self._lock:
+            self._pending += 1
+            self._last_request = time.monotonic()
+            self.requests += 1
+        if reason:
+            logger.info(f"Retrain requested: {reason}")
+        self._wakeup.set()
+
+    def is_busy(self):
+        """Return True while a retrain is waiting or running."""
+        with self._lock:
+            pending = self._pending
+        return pending > 0 or (self._process is not None and self._process.is_alive())
+
+    def stats(self):
+        """
+        Get service metrics.
+
+        Returns:
+            Dict with requests, jobs_run, jobs_failed, coalesced and last_duration.
+        """
+        return {
+            'requests': self.requests,
+            'jobs_run': self.jobs_run,
+            'jobs_failed': self.jobs_failed,
+            'coalesced': max(self.requests - self.jobs_run - self._pending, 0),
+            'last_duration': self.last_duration,
+        }
+
+    def _notify_progress(self, message):
+        logger.info(message)
+        if self.on_progress is not None:
+            self.on_progress(message)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+
+            # Debounce: wait until no request has arrived for self.debounce seconds
+            while not self._stop.is_set():
+                with self._lock:
+                    if self._pending == 0:
+                        break
+                    remaining = self._last_request + self.debounce - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._stop.wait(remaining)
+
+            with self._lock:
+                coalesced = self._pending
+                self._pending = 0
+            if self._stop.is_set() or coalesced == 0:
+                continue
+
+            self._notify_progress(f"Retraining model ({coalesced} change(s) queued)")
+            success, message, model_path = self._run_job()
+            self.jobs_run += 1
+            if not success:
+                self.jobs_failed += 1
+            logger.info(f"Retrain finished in {self.last_duration:.1f}s: {message}")
+            if self.on_finished is not None and not self._stop.is_set():
+                self.on_finished(success, message, model_path)
+
+    def _run_job(self):
+        """Run one retrain in a worker process and wait for its result."""
+        start = time.perf_counter()
+        context = multiprocessing.get_context("spawn")
+        events = context.Queue()
+        self._process = context.Process(target=_training_job, args=(self.classifier_type, events),
+                                        name="training-worker", daemon=True)
+        self._process.start()
+
+        result = None
+        try:
+            while result is None:
+                try:
+                    kind, payload = events.get(timeout=0.5)
+                except queue.Empty:
+                    if not self._process.is_alive():
+                        result = {'success': False, 'message': 'Training worker exited unexpectedly'}
+                    continue
+                if kind == 'progress':
+                    self._notify_progress(payload)
+                else:
+                    result = payload
+        finally:
+            self._process.join(timeout=5)
+            self._process = None
+            self.last_duration = time.perf_counter() - start
+
+        return result['success'], result['message'], result.get('model_path', '')
@@ -1,5 +1,5 @@
-import sqlite3
 import logging
+from db import get_connection
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -9,7 +9,7 @@ def update_user_id(old_id, new_id):
     Update a user's ID in the database and update related attendance records.
     """
     try:
-        conn = sqlite3.connect("attendance.db")
+        conn = get_connection()
         cursor = conn.cursor()
         
         # First, check if new_id already exists
@@ -28,6 +28,7 @@ def update_user_id(old_id, new_id):
             user = cursor.fetchone()
             if not user:
                 logger.error(f"User with ID {old_id} not found")
+                cursor.execute("ROLLBACK")
                 return False
             
             # Update user ID in users table
@@ -37,6 +38,13 @@ def update_user_id(old_id, new_id):
                 WHERE id = ?
             """, (new_id, old_id))
             
+            # Update enrollment samples
+            cursor.execute("""
+                UPDATE embeddings 
+                SET user_id = ? 
+                WHERE user_id = ?
+            """, (new_id, old_id))
+            
             # Update attendance records
             cursor.execute("""
                 UPDATE attendance 
@@ -66,11 +74,6 @@ def update_user_id(old_id, new_id):
     except Exception as e:
         logger.error(f"Database error: {e}")
         return False
-    finally:
-        try:
-            conn.close()
-        except:
-            pass
 
 if __name__ == "__main__":
     print("This will update a user's ID in the database.")
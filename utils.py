@@ -1,5 +1,3 @@
-import sqlite3
-import numpy as np
 from datetime import datetime  
 import os
 import sys
@@ -8,12 +6,14 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from face_recognition import FaceRecognizer
+from migrate_db import ATTENDANCE_UPSERT_SQL
+from db import get_connection
 
 WORK_END_TIME = "20:00:00"  # 8 PM
 
 def fetch_attendance(user_phone):
     """Fetch attendance from the database using the user's phone number."""
-    conn = sqlite3.connect("attendance.db")
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -24,8 +24,7 @@ def fetch_attendance(user_phone):
     """, (user_phone,))
     
     record = cursor.fetchone()
-    conn.close()
-    
+
     if record:
         name, first_seen, last_seen = record
         return f"Hello {name}, your attendance:\nFirst Seen: {first_seen}\ Last Seen: {last_seen}"
@@ -35,35 +34,16 @@ def fetch_attendance(user_phone):
 import datetime
 
 def save_attendance(user_id):
-    conn = sqlite3.connect("attendance.db")
+    conn = get_connection()
     cursor = conn.cursor()
 
     date_today = datetime.date.today().isoformat()
     time_now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    # Optional: Avoid duplicate entries for the same user on the same day
-    cursor.execute(
-        "SELECT * FROM attendance WHERE user_id = ? AND date(first_seen) = ?",
-        (user_id, date_today)
-    )
-    entry = cursor.fetchone()
-
-    if not entry:
-        # If no entry exists, insert the first_seen timestamp
-        cursor.execute(
-            "INSERT INTO attendance (user_id, first_seen, last_seen) VALUES (?, ?, ?)",
-            (user_id, time_now, time_now)
-        )
-        conn.commit()
-    else:
-        # If the entry exists, update the last_seen timestamp
-        cursor.execute(
-            "UPDATE attendance SET last_seen = ? WHERE user_id = ? AND date(first_seen) = ?",
-            (time_now, user_id, date_today)
-        )
-        conn.commit()
+    # One row per user per day: insert it or move last_seen forward
+    cursor.execute(ATTENDANCE_UPSERT_SQL, (user_id, date_today, time_now, time_now))
+    conn.commit()
 
-    conn.close()
 
 
 def get_known_faces():
@@ -82,7 +62,7 @@ def get_known_faces():
 def verify_database():
     """Verify database structure and recent records."""
     try:
-        conn = sqlite3.connect("attendance.db")
+        conn = get_connection()
         cursor = conn.cursor()
         
         # Check tables
@@ -112,8 +92,7 @@ def verify_database():
         for record in records:
             print(record)
             
-        conn.close()
-        
+
     except Exception as e:
         print(f"Error verifying database: {e}")
 
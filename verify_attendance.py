@@ -1,6 +1,6 @@
-import sqlite3
 from datetime import datetime
 import logging
+from db import get_connection
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -8,7 +8,7 @@ logger = logging.getLogger(__name__)
 def verify_todays_attendance():
     """Verify attendance records for today."""
     try:
-        conn = sqlite3.connect("attendance.db")
+        conn = get_connection()
         cursor = conn.cursor()
         
         # Get today's date
@@ -23,7 +23,7 @@ def verify_todays_attendance():
                 a.last_seen
             FROM users u
             LEFT JOIN attendance a ON u.user_id = a.user_id
-            WHERE DATE(a.first_seen) = ?
+            WHERE a.day = ?
             ORDER BY a.first_seen DESC
         """, (today,))
         
@@ -47,8 +47,7 @@ def verify_todays_attendance():
         for user in users:
             print(f"ID: {user[0]}, Name: {user[1]}")
         
-        conn.close()
-        
+
     except Exception as e:
         logger.error(f"Error verifying attendance: {e}")
 
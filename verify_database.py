@@ -1,7 +1,7 @@
-import sqlite3
 import os
 from datetime import datetime
 import logging
+from db import get_connection
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,7 +11,7 @@ def verify_and_fix_database():
     Verify database integrity and fix any issues.
     """
     try:
-        conn = sqlite3.connect("attendance.db")
+        conn = get_connection()
         cursor = conn.cursor()
         
         # Check tables
@@ -65,7 +65,6 @@ def verify_and_fix_database():
         else:
             logger.info("No orphaned attendance records found")
         
-        conn.close()
         logger.info("\nDatabase verification complete")
         
     except Exception as e:
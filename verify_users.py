@@ -1,8 +1,9 @@
-import sqlite3
 import numpy as np
 import cv2
-from insightface.app import FaceAnalysis
+from face_models import get_face_app
 import logging
+from db import get_connection
+from face_embeddings import load_embeddings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,32 +14,31 @@ def verify_users_and_encodings():
     Optionally recompute encodings if needed.
     """
     try:
-        # Initialize InsightFace
-        app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'])
-        app.prepare(ctx_id=0)
+        # Get the shared InsightFace app
+        app = get_face_app()
         
-        conn = sqlite3.connect("attendance.db")
+        conn = get_connection()
         cursor = conn.cursor()
         
         # Get all users
-        cursor.execute("SELECT user_id, name, encoding, email FROM users")
+        cursor.execute("SELECT user_id, name, email FROM users")
         users = cursor.fetchall()
         
+        # Enrollment samples live in the embeddings table
+        embeddings, labels = load_embeddings()
+        
         print(f"\nFound {len(users)} users in database:")
         for user in users:
-            user_id, name, encoding_blob, email = user
+            user_id, name, email = user
             print(f"\nUser ID: {user_id}")
             print(f"Name: {name}")
             print(f"Email: {email}")
             
-            if encoding_blob:
-                # Convert blob to numpy array
-                try:
-                    encoding = np.frombuffer(encoding_blob, dtype=np.float32)
-                    print(f"Encoding shape: {encoding.shape}")
-                    print(f"Encoding valid: Yes")
-                except Exception as e:
-                    print(f"Error with encoding: {e}")
+            samples = embeddings[labels == user_id] if embeddings is not None else []
+            if len(samples):
+                print(f"Encoding samples: {len(samples)}")
+                print(f"Encoding shape: {samples.shape[1:]}")
+                print(f"Encoding valid: {'Yes' if np.isfinite(samples).all() else 'No'}")
             else:
                 print("No encoding found!")
         
@@ -61,7 +61,6 @@ def verify_users_and_encodings():
                     else:
                         print(f"Could not read image: {file}")
         
-        conn.close()
         return True
         
     except Exception as e: